@@ -17,9 +17,9 @@ from bot.cogs.core.database import Database
 from bot.cogs.core.paginator import Paginator
 from bot.cogs.core.quests import DailyQuestDoneView, Quests
 from bot.utils.ctx import Ctx
+from bot.utils.database_proxy import TransactionAborted
 from bot.utils.misc import (
     SuppressCtxManager,
-    calc_total_wealth,
     craft_lbs,
     emojify_crop,
     emojify_item,
@@ -58,6 +58,10 @@ class Econ(commands.Cog):
     def paginator(self) -> Paginator:
         return typing.cast(Paginator, self.bot.get_cog("Paginator"))
 
+    async def cog_before_invoke(self, ctx: Ctx) -> None:
+        # each user's row, items and active effects are only loaded once per command
+        ctx.user_snapshots = self.db.begin_user_snapshots()
+
     def calc_yield_chance_list(self, pickaxe: str):
         yield_ = self.d.mining.yields_pickaxes[pickaxe]  # [xTrue, xFalse]
         return [True] * yield_[0] + [False] * yield_[1]
@@ -146,7 +150,7 @@ class Econ(commands.Cog):
             user_id = db_user.user_id
 
         if lucky is None:
-            lucky = await self.karen.check_active_fx(user_id, "Luck Potion")
+            lucky = await self.db.check_active_fx(user_id, "Luck Potion")
 
         if random.randint(0, 50) == 1 or (lucky and random.randint(1, 25) == 1):
             if db_user is None:
@@ -177,9 +181,8 @@ class Econ(commands.Cog):
             return
 
         db_user = await self.db.fetch_user(user.id)
-        u_items = await self.db.fetch_items(user.id)
 
-        total_wealth = calc_total_wealth(db_user, u_items)
+        total_wealth = db_user.net_worth
         health_bar = make_health_bar(
             db_user.health,
             20,
@@ -203,7 +206,7 @@ class Econ(commands.Cog):
         else:
             can_vote_value = f"[{ctx.l.econ.pp.yep}]({self.d.topgg + '/vote'})"
 
-        active_fx = await self.karen.fetch_active_fx(user.id)
+        active_fx = await self.db.fetch_active_fx(user.id)
 
         if db_user.shield_pearl and (
             arrow.get(db_user.shield_pearl).shift(months=1) > arrow.utcnow()
@@ -279,9 +282,8 @@ class Econ(commands.Cog):
             return
 
         db_user = await self.db.fetch_user(user.id)
-        u_items = await self.db.fetch_items(user.id)
 
-        total_wealth = calc_total_wealth(db_user, u_items)
+        total_wealth = db_user.net_worth
 
         mooderalds = getattr(await self.db.fetch_item(user.id, "Mooderald"), "amount", 0)
 
@@ -803,17 +805,27 @@ class Econ(commands.Cog):
                 )
                 return
 
-        await self.db.balance_sub(ctx.author.id, shop_item.buy_price * amount)
-
-        for req_item, req_amount in shop_item.requires.get("items", {}).items():
-            await self.db.remove_item(ctx.author.id, req_item, req_amount * amount)
-
         sellable = True
         # hoes shouldn't be sellable
         if shop_item.db_entry.item.endswith("Hoe"):
             sellable = False
 
-        await self.db.add_item(
+        # the purchase is applied atomically, in case the balance or items changed since they were
+        # checked above
+        tx = self.db.transaction()
+        badge_stats = self.db.tx_fetch_badge_stats(tx, ctx.author.id)
+        self.db.tx_balance_sub(tx, ctx.author.id, shop_item.buy_price * amount)
+
+        removed_req_items = {
+            self.db.tx_remove_item(tx, ctx.author.id, req_item, req_amount * amount).index: (
+                req_item,
+                req_amount,
+            )
+            for req_item, req_amount in shop_item.requires.get("items", {}).items()
+        }
+
+        self.db.tx_add_item(
+            tx,
             ctx.author.id,
             shop_item.db_entry.item,
             shop_item.db_entry.sell_price,
@@ -822,14 +834,38 @@ class Econ(commands.Cog):
             sellable=sellable,
         )
 
+        if shop_item.db_entry.item == "Rich Person Trophy":
+            self.db.tx_rich_trophy_wipe(tx, ctx.author.id)
+
+        new_badge_stats = self.db.tx_fetch_badge_stats(tx, ctx.author.id)
+
+        try:
+            await tx.run()
+        except TransactionAborted as e:
+            if e.statement.index in removed_req_items:
+                req_item, req_amount = removed_req_items[e.statement.index]
+                await ctx.reply_embed(
+                    ctx.l.econ.buy.need_total_of.format(
+                        req_amount,
+                        req_item,
+                        self.d.emojis[self.d.emoji_items[req_item]],
+                    ),
+                )
+            else:
+                await ctx.reply_embed(
+                    ctx.l.econ.buy.poor_loser_2.format(amount, shop_item.db_entry.item),
+                )
+
+            return
+
+        await self.badges.on_stats_changed(ctx.author.id, badge_stats.value, new_badge_stats.value)
+
         if (
             shop_item.db_entry.item.endswith("Pickaxe")
             or shop_item.db_entry.item == "Bane Of Pillagers Amulet"
+            or shop_item.db_entry.item == "Rich Person Trophy"
         ):
             await self.karen.update_support_server_member_roles(ctx.author.id)
-        elif shop_item.db_entry.item == "Rich Person Trophy":
-            await self.db.rich_trophy_wipe(ctx.author.id)
-            await self.karen.update_support_server_member_roles(ctx.author.id)
 
         await ctx.reply_embed(
             ctx.l.econ.buy.you_done_bought.format(
@@ -892,10 +928,21 @@ class Econ(commands.Cog):
             if db_item.name == fish.name:
                 db_item.sell_price = fish.current
 
-        await self.db.balance_add(ctx.author.id, amount * db_item.sell_price)
-        await self.db.remove_item(ctx.author.id, db_item.name, amount)
+        tx = self.db.transaction()
+        badge_stats = self.db.tx_fetch_badge_stats(tx, ctx.author.id)
+        self.db.tx_remove_item(tx, ctx.author.id, db_item.name, amount)
+        self.db.tx_balance_add(tx, ctx.author.id, amount * db_item.sell_price)
+        self.db.tx_update_lb(tx, ctx.author.id, "week_emeralds", amount * db_item.sell_price)
+        new_badge_stats = self.db.tx_fetch_badge_stats(tx, ctx.author.id)
+
+        try:
+            await tx.run()
+        except TransactionAborted:
+            # the item was sold or given away since it was fetched
+            await ctx.reply_embed(ctx.l.econ.sell.stupid_1)
+            return
 
-        await self.db.update_lb(ctx.author.id, "week_emeralds", amount * db_item.sell_price)
+        await self.badges.on_stats_changed(ctx.author.id, badge_stats.value, new_badge_stats.value)
 
         if db_item.name.endswith("Pickaxe") or db_item.name == "Bane Of Pillagers Amulet":
             await self.karen.update_support_server_member_roles(ctx.author.id)
@@ -959,15 +1006,29 @@ class Econ(commands.Cog):
                 await ctx.reply_embed(ctx.l.econ.give.stupid_3)
                 return
 
-            await self.db.balance_sub(ctx.author.id, amount)
-            await self.db.balance_add(victim.id, amount)
-            await self.db.log_transaction(
+            await self.db.ensure_user_exists(victim.id)
+
+            tx = self.db.transaction()
+            badge_stats = self.db.tx_fetch_badge_stats(tx, victim.id)
+            self.db.tx_balance_sub(tx, ctx.author.id, amount)
+            self.db.tx_balance_add(tx, victim.id, amount)
+            self.db.tx_log_transaction(
+                tx,
                 "emerald",
                 amount,
                 arrow.utcnow().datetime,
                 ctx.author.id,
                 victim.id,
             )
+            new_badge_stats = self.db.tx_fetch_badge_stats(tx, victim.id)
+
+            try:
+                await tx.run()
+            except TransactionAborted:
+                await ctx.reply_embed(ctx.l.econ.give.stupid_3)
+                return
+
+            await self.badges.on_stats_changed(victim.id, badge_stats.value, new_badge_stats.value)
 
             await ctx.reply_embed(
                 ctx.l.econ.give.gaveems.format(
@@ -1002,17 +1063,29 @@ class Econ(commands.Cog):
                 await ctx.reply_embed(ctx.l.econ.give.stupid_2)
                 return
 
-            await self.db.remove_item(ctx.author.id, item, amount)
-            await self.db.add_item(victim.id, db_item.name, db_item.sell_price, amount)
-            self.bot.loop.create_task(
-                self.db.log_transaction(
-                    db_item.name,
-                    amount,
-                    arrow.utcnow().datetime,
-                    ctx.author.id,
-                    victim.id,
-                ),
+            await self.db.ensure_user_exists(victim.id)
+
+            tx = self.db.transaction()
+            badge_stats = self.db.tx_fetch_badge_stats(tx, victim.id)
+            self.db.tx_remove_item(tx, ctx.author.id, db_item.name, amount)
+            self.db.tx_add_item(tx, victim.id, db_item.name, db_item.sell_price, amount)
+            self.db.tx_log_transaction(
+                tx,
+                db_item.name,
+                amount,
+                arrow.utcnow().datetime,
+                ctx.author.id,
+                victim.id,
             )
+            new_badge_stats = self.db.tx_fetch_badge_stats(tx, victim.id)
+
+            try:
+                await tx.run()
+            except TransactionAborted:
+                await ctx.reply_embed(ctx.l.econ.give.stupid_4)
+                return
+
+            await self.badges.on_stats_changed(victim.id, badge_stats.value, new_badge_stats.value)
 
             await ctx.reply_embed(
                 ctx.l.econ.give.gave.format(
@@ -1159,7 +1232,7 @@ class Econ(commands.Cog):
         pickaxe = await self.db.fetch_pickaxe(ctx.author.id)
 
         # see if user has chugged a luck potion
-        lucky = await self.karen.check_active_fx(ctx.author.id, "Luck Potion")
+        lucky = await self.db.check_active_fx(ctx.author.id, "Luck Potion")
 
         # iterate through items findable via mining
         for item in self.d.mining_findables:
@@ -1261,9 +1334,9 @@ class Econ(commands.Cog):
 
             lure_i_book, seaweed_active, lucky, bait_active = await asyncio.gather(
                 self.db.fetch_item(ctx.author.id, "Lure I Book"),
-                self.karen.check_active_fx(ctx.author.id, "Seaweed"),
-                self.karen.check_active_fx(ctx.author.id, "Luck Potion"),
-                self.karen.check_active_fx(ctx.author.id, "Fishing Bait"),
+                self.db.check_active_fx(ctx.author.id, "Seaweed"),
+                self.db.check_active_fx(ctx.author.id, "Luck Potion"),
+                self.db.check_active_fx(ctx.author.id, "Fishing Bait"),
             )
 
             if lure_i_book is not None:
@@ -1452,10 +1525,37 @@ class Econ(commands.Cog):
             # 8% tax to prevent exploitation of pillaging leaderboard
             adjusted = math.ceil(stolen * 0.92)
 
-            await self.db.balance_sub(victim.id, stolen)
-            await self.db.balance_add(ctx.author.id, adjusted)  # 8% tax
+            tx = self.db.transaction()
+            badge_stats = self.db.tx_fetch_badge_stats(tx, ctx.author.id)
+            self.db.tx_balance_sub(tx, victim.id, stolen)
+            self.db.tx_balance_add(tx, ctx.author.id, adjusted)  # 8% tax
+            self.db.tx_update_lb(tx, ctx.author.id, "week_emeralds", adjusted)
+            pillaged_emeralds = self.db.tx_update_lb(
+                tx,
+                ctx.author.id,
+                "pillaged_emeralds",
+                adjusted,
+            )
+            new_badge_stats = self.db.tx_fetch_badge_stats(tx, ctx.author.id)
+
+            try:
+                await tx.run()
+            except TransactionAborted:
+                # the victim spent their emeralds in the meantime
+                await ctx.reply_embed(ctx.l.econ.pillage.stupid_4.format(self.d.emojis.emerald))
+                return
 
-            await self.db.update_lb(ctx.author.id, "week_emeralds", adjusted)
+            await self.badges.on_stats_changed(
+                ctx.author.id,
+                badge_stats.value,
+                new_badge_stats.value,
+            )
+            await self.badges.on_lb_changed(
+                ctx.author.id,
+                "pillaged_emeralds",
+                pillaged_emeralds.value - adjusted,
+                pillaged_emeralds.value,
+            )
 
             await ctx.reply_embed(
                 random.choice(ctx.l.econ.pillage.u_win.user).format(
@@ -1473,17 +1573,21 @@ class Econ(commands.Cog):
                         self.d.emojis.emerald,
                     ),
                 )
-
-            await self.db.update_lb(ctx.author.id, "pillaged_emeralds", adjusted, "add")
         else:
             penalty = max(32, db_user.emeralds // 3)
 
-            await self.db.balance_sub(ctx.author.id, penalty)
-            await self.db.balance_add(victim.id, penalty)
+            tx = self.db.transaction()
+            badge_stats = self.db.tx_fetch_badge_stats(tx, victim.id)
+            penalty_taken = self.db.tx_balance_sub_up_to(tx, ctx.author.id, penalty)
+            self.db.tx_balance_add(tx, victim.id, penalty_taken)
+            new_badge_stats = self.db.tx_fetch_badge_stats(tx, victim.id)
+            await tx.run()
+
+            await self.badges.on_stats_changed(victim.id, badge_stats.value, new_badge_stats.value)
 
             await ctx.reply_embed(
                 random.choice(ctx.l.econ.pillage.u_lose.user).format(
-                    penalty,
+                    penalty_taken.value,
                     self.d.emojis.emerald,
                 ),
             )
@@ -1516,7 +1620,7 @@ class Econ(commands.Cog):
             await ctx.reply_embed(ctx.l.econ.use.stupid_4)
             return
 
-        if await self.karen.check_active_fx(ctx.author.id, thing):
+        if await self.db.check_active_fx(ctx.author.id, thing):
             await ctx.reply_embed(ctx.l.econ.use.stupid_1)
             return
 
@@ -1544,7 +1648,7 @@ class Econ(commands.Cog):
                 return
 
             await self.db.remove_item(ctx.author.id, db_item.name, 1)
-            await self.karen.add_active_fx(ctx.author.id, db_item.name, duration)
+            await self.db.add_active_fx(ctx.author.id, db_item.name, duration)
             await ctx.reply_embed(ctx.l.econ.use.chug.format(db_item.name, duration / 60))
 
             await asyncio.sleep(duration)
@@ -1571,7 +1675,7 @@ class Econ(commands.Cog):
                 return
 
             await self.db.remove_item(ctx.author.id, thing, 1)
-            await self.karen.add_active_fx(ctx.author.id, "Seaweed", duration)
+            await self.db.add_active_fx(ctx.author.id, "Seaweed", duration)
             await ctx.reply_embed(ctx.l.econ.use.smoke_seaweed.format(30))
 
             await asyncio.sleep(duration)
@@ -1586,7 +1690,7 @@ class Econ(commands.Cog):
                 return
 
             await self.db.remove_item(ctx.author.id, thing, 1)
-            await self.karen.add_active_fx(ctx.author.id, "Fishing Bait", duration)
+            await self.db.add_active_fx(ctx.author.id, "Fishing Bait", duration)
             await ctx.reply_embed(ctx.l.econ.use.fishing_bait_used.format(20))
 
             await asyncio.sleep(duration)
@@ -1801,7 +1905,7 @@ class Econ(commands.Cog):
                 self.karen.cooldown_reset("honey", ctx.author.id),
                 self.karen.cooldown_reset("pillage", ctx.author.id),
                 self.karen.cooldown_reset("search", ctx.author.id),
-                self.karen.clear_active_fx(ctx.author.id),
+                self.db.clear_active_fx(ctx.author.id),
                 self.db.remove_item(ctx.author.id, "Time Pearl", 1),
             )
 
@@ -1841,7 +1945,7 @@ class Econ(commands.Cog):
         await ctx.reply_embed(random.choice(ctx.l.econ.honey.honey).format(jars))
 
         # see if user has chugged a luck potion
-        lucky = await self.karen.check_active_fx(ctx.author.id, "Luck Potion")
+        lucky = await self.db.check_active_fx(ctx.author.id, "Luck Potion")
 
         if not lucky and random.choice([False] * 3 + [True]):
             bees_lost = random.randint(math.ceil(bees / 75), math.ceil(bees / 50))
@@ -2243,8 +2347,9 @@ class Econ(commands.Cog):
     @leaderboards.command(name="totalwealth", aliases=["tw"])
     async def leaderboard_total_wealth(self, ctx: Ctx):
         async with SuppressCtxManager(ctx.typing()):
-            global_lb = await self.db.fetch_global_lb_total_wealth(ctx.author.id)
-            local_lb = await self.db.fetch_local_lb_total_wealth(
+            global_lb = await self.db.fetch_global_lb_user("net_worth", ctx.author.id)
+            local_lb = await self.db.fetch_local_lb_user(
+                "net_worth",
                 ctx.author.id,
                 [m.id for m in ctx.guild.members if not m.bot],
             )
@@ -2269,9 +2374,12 @@ class Econ(commands.Cog):
 
         max_plots = self.d.farming.max_plots[await self.db.fetch_hoe(ctx.author.id)]
 
-        emojis = [emojify_crop(self.d, r["crop_type"]) for r in db_farm_plots] + [
-            emojify_crop(self.d, "dirt"),
-        ] * (max_plots - len(db_farm_plots))
+        # each row is a batch of plots which were planted at once
+        emojis = [
+            emojify_crop(self.d, r["crop_type"]) for r in db_farm_plots for _ in range(r["count"])
+        ]
+        plots_count = len(emojis)
+        emojis += [emojify_crop(self.d, "dirt")] * (max_plots - plots_count)
         emoji_farm = "> " + "\n> ".join(
             "".join(r[::-1])
             for r in zip(*[emojis[i : i + 5] for i in range(0, len(emojis), 5)][::-1])
@@ -2293,7 +2401,7 @@ class Econ(commands.Cog):
         embed.description = (
             emoji_farm
             + f"\n{self.d.emojis.air * 15}\n"
-            + ctx.l.econ.farm.available.format(available=available, max=len(db_farm_plots))
+            + ctx.l.econ.farm.available.format(available=available, max=plots_count)
         )
 
         await ctx.send(embed=embed)
@@ -2358,8 +2466,7 @@ class Econ(commands.Cog):
 
     @farm.command(name="harvest", aliases=["h"])
     async def farm_harvest(self, ctx: Ctx):
-        records = await self.db.fetch_ready_crops(ctx.author.id)
-        await self.db.delete_ready_crops(ctx.author.id)
+        records = await self.db.harvest_ready_crops(ctx.author.id)
 
         if not records:
             await ctx.reply_embed(ctx.l.econ.farm.cant_harvest)
@@ -1,4 +1,6 @@
+import asyncio
 import datetime
+import functools
 import math
 import typing
 from typing import Any
@@ -12,6 +14,8 @@ from bot.cogs.core.paginator import Paginator
 from bot.utils.ctx import Ctx
 from bot.utils.misc import SuppressCtxManager, parse_timedelta, shorten_text
 from bot.villager_bot import VillagerBotCluster
+from common.coms.packet_type import PacketType
+from common.models.coms_metrics import ComsMetrics
 from common.utils.code import execute_code, format_exception
 
 
@@ -335,6 +339,67 @@ class Owner(commands.Cog):
                 f"\n```c\n{rows}\n```",
             )
 
+    @commands.command(name="comsmetrics", aliases=["cmetrics"])
+    @commands.is_owner()
+    async def coms_metrics(self, ctx: Ctx, packet_type: str | None = None):
+        if packet_type is not None:
+            packet_type = packet_type.upper()
+
+            if packet_type not in PacketType.__members__:
+                await ctx.reply_embed("Invalid packet type specified")
+                return
+
+        def ms(seconds: float) -> str:
+            return f"{seconds * 1000:.1f}"
+
+        def format_metrics(metrics: ComsMetrics) -> str:
+            rows = [
+                (name, m)
+                for name, m in metrics.packet_types.items()
+                if packet_type is None or name == packet_type
+            ]
+
+            # show where the most time is spent first
+            rows.sort(
+                key=(lambda r: r[1].handler_time.total + r[1].round_trip_time.total),
+                reverse=True,
+            )
+
+            formatted_rows = "\n".join([
+                f"{shorten_text(name.lower(), 20):<20} "
+                f"{m.handler_time.count:>7} {ms(m.handler_time.percentile(50)):>6}/"
+                f"{ms(m.handler_time.percentile(99)):<6} "
+                f"{m.round_trip_time.count:>7} {ms(m.round_trip_time.percentile(50)):>6}/"
+                f"{ms(m.round_trip_time.percentile(99)):<6} "
+                f"{int(m.payload_bytes.percentile(50)):>7} "
+                f"{m.handler_errors + m.request_errors:>4}"
+                for name, m in rows[:10]
+            ])
+
+            return (
+                f"**{metrics.identifier}**\n```md\n"
+                f"{'## type':<20} {'handled':>7} {'p50/p99 ms':^13} {'sent':>7} "
+                f"{'p50/p99 ms':^13} {'bytes':>7} {'err':>4}\n"
+                f"{formatted_rows}\n```"
+            )
+
+        async with SuppressCtxManager(ctx.typing()):
+            karen_metrics, clusters_metrics = await asyncio.gather(
+                self.karen.fetch_karen_coms_metrics(),
+                self.karen.fetch_clusters_coms_metrics(),
+            )
+
+            # clusters all talk to Karen in the same way, so their metrics are combined
+            combined_clusters_metrics = functools.reduce(
+                lambda a, b: a.merge(b, "Clusters"),
+                clusters_metrics,
+                ComsMetrics(identifier="Clusters", packet_types={}),
+            )
+
+        await ctx.reply(
+            f"{format_metrics(karen_metrics)}\n{format_metrics(combined_clusters_metrics)}",
+        )
+
     @commands.command(
         name="transferinventory",
         aliases=["invtransfer", "transferinv", "trinv"],
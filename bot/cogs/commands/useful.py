@@ -85,6 +85,7 @@ class Useful(commands.Cog):
 
         await self.db.add_reminder(
             ctx.author.id,
+            getattr(ctx.guild, "id", None),
             ctx.channel.id,
             ctx.message.id,
             reminder[:499].replace("@everyone", "@\ufeffeveryone").replace("@here", "@\ufeffhere"),
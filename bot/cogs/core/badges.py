@@ -1,17 +1,49 @@
 import io
 import typing
+from bisect import bisect_right
+from collections import defaultdict
 from io import BytesIO
+from typing import Any, Mapping
 
-from discord.ext import commands
+from discord.ext import commands, tasks
 from PIL import Image
 
-from common.models.db.item import Item
-from common.models.db.user import User
-
 from bot.cogs.core.database import Database
-from bot.utils.misc import calc_total_wealth
+from bot.utils.misc import TTLCache
 from bot.villager_bot import VillagerBotCluster
 
+# total wealth in emeralds a user needs to have more than for the uncle scrooge badge
+UNCLE_SCROOGE_WEALTH = 100_000
+
+# the values at which each level of a badge is reached
+BADGE_THRESHOLDS = {
+    "uncle_scrooge": (UNCLE_SCROOGE_WEALTH + 1,),
+    "collector": (16, 32, 64, 128, 256),  # unique items
+    "beekeeper": (100, 1_000, 100_000),  # jars of bees
+    "pillager": (100, 1_000, 100_000),  # emeralds pillaged
+    "murderer": (100, 1_000, 10_000),  # mobs killed
+    "fisherman": (100, 1_000, 10_000, 100_000),  # fishies fished
+    "enthusiast": (10_000, 1_000_000, 100_000_000),  # commands ran
+}
+
+# badges which are either had or not, rather than having levels
+BOOL_BADGES = frozenset({"uncle_scrooge"})
+
+# the badges which depend on the stats returned by Database.fetch_badge_stats
+STAT_BADGES = {"wealth": "uncle_scrooge", "item_count": "collector", "bees": "beekeeper"}
+
+# the badges which depend on a leaderboard
+LB_BADGES = {
+    "pillaged_emeralds": "pillager",
+    "mobs_killed": "murderer",
+    "fish_fished": "fisherman",
+    "commands": "enthusiast",
+}
+
+
+def badge_level(badge: str, value: int | None) -> int:
+    return bisect_right(BADGE_THRESHOLDS[badge], value or 0)
+
 
 class Badges(commands.Cog):
     def __init__(self, bot: VillagerBotCluster):
@@ -19,186 +51,152 @@ class Badges(commands.Cog):
 
         self.d = bot.d
 
-    @property
-    def db(self) -> Database:
-        return typing.cast(Database, self.bot.get_cog("Database"))
+        # user_id: badges, badges are cached as they're checked whenever the values they depend on
+        # cross a threshold and are shown on profiles
+        self._badges_cache = TTLCache[int, dict[str, Any]](expire_after=600, max_size=10_000)
 
-    async def fetch_user_badges(self, user_id) -> dict:
-        return dict(await self.db.fetch_user_badges(user_id))
+        # user_id: {badge: level}, upgrades are written in batches by flush_badge_upgrades
+        self._pending_upgrades = defaultdict[int, dict[str, Any]](dict)
 
-    async def update_user_badges(self, user_id, **kwargs):
-        await self.db.update_user_badges(user_id, **kwargs)
+        self.flush_badge_upgrades.start()
 
-    def emojify_badges(self, user_badges: dict) -> str:
-        emojis = []
+    async def cog_unload(self):
+        self.flush_badge_upgrades.cancel()
+        await self.flush_badge_upgrades()
 
-        for badge, value in dict(user_badges).items():
-            if not value:
-                continue
+    @property
+    def db(self) -> Database:
+        return typing.cast(Database, self.bot.get_cog("Database"))
 
-            emoji_entry = self.d.emojis.badges[badge]
+    async def fetch_user_badges(self, user_id: int) -> dict[str, Any]:
+        badges = self._badges_cache.get(user_id)
 
-            if isinstance(emoji_entry, list):
-                emojis.append(emoji_entry[value - 1])
-            else:
-                emojis.append(emoji_entry)
+        if badges is None:
+            badges = dict(await self.db.fetch_user_badges(user_id))
 
-        return " ".join(emojis)
+            # upgrades which haven't been written yet aren't in the database's badges
+            badges.update(self._pending_upgrades.get(user_id, {}))
 
-    async def update_badge_uncle_scrooge(
-        self,
-        user_id: int,
-        db_user: User | None = None,
-        user_items: list[Item] = None,
-    ) -> None:
-        badges = await self.fetch_user_badges(user_id)
+            self._badges_cache.put(user_id, badges)
 
-        if badges["uncle_scrooge"]:
-            return
+        return dict(badges)
 
-        if user_items is None:
-            user_items = await self.db.fetch_items(user_id)
+    async def update_user_badges(self, user_id: int, **kwargs) -> None:
+        await self.db.update_user_badges(user_id, **kwargs)
+
+        if (badges := self._badges_cache.get(user_id)) is not None:
+            badges.update(kwargs)
 
-        if db_user is None:
-            db_user = await self.db.fetch_user(user_id)
+    async def update_badge(self, user_id: int, badge: str, value: int) -> None:
+        """Upgrades a badge to the level reached by the value it depends on, if it's higher than
+        the user's current level"""
 
-        total_wealth = calc_total_wealth(db_user, user_items)
+        level = badge_level(badge, value)
 
-        if total_wealth > 100_000:
-            await self.update_user_badges(user_id, uncle_scrooge=True)
+        if level == 0:
+            return
 
-    async def update_badge_collector(self, user_id: int, user_items: list[Item] = None) -> None:
-        # Levels are:
-        # I -> 16 unique items
-        # II -> 32  ||
-        # III -> 64 ||
-        # IV -> 128 ||
-        # V -> 256  ||
+        badges = self._badges_cache.get(user_id)
 
-        badges = await self.fetch_user_badges(user_id)
-        collector_level = badges["collector"]
+        if badges is None:
+            await self.fetch_user_badges(user_id)
+            badges = self._badges_cache.get(user_id)
 
-        if collector_level == 5:
+        if int(badges[badge]) >= level:
             return
 
-        if user_items is None:
-            user_items = await self.db.fetch_items(user_id)
-
-        user_items_len = len(user_items)
+        badges[badge] = self._pending_upgrades[user_id][badge] = (
+            True if badge in BOOL_BADGES else level
+        )
 
-        if collector_level < 5 and user_items_len >= 256:
-            await self.update_user_badges(user_id, collector=5)
-        elif collector_level < 4 and user_items_len >= 128:
-            await self.update_user_badges(user_id, collector=4)
-        elif collector_level < 3 and user_items_len >= 64:
-            await self.update_user_badges(user_id, collector=3)
-        elif collector_level < 2 and user_items_len >= 32:
-            await self.update_user_badges(user_id, collector=2)
-        elif collector_level < 1 and user_items_len >= 16:
-            await self.update_user_badges(user_id, collector=1)
+    async def on_value_changed(
+        self,
+        user_id: int,
+        badge: str,
+        prev_value: int | None,
+        value: int | None,
+    ) -> None:
+        """Upgrades a badge if the change of the value it depends on crossed a threshold, without
+        querying anything otherwise"""
 
-    async def update_badge_beekeeper(self, user_id: int, bees: int = None) -> None:
-        # levels are:
-        # I -> 100 bees
-        # II -> 1_000 bees
-        # III -> 100_000 bees
+        if badge_level(badge, value) > badge_level(badge, prev_value):
+            await self.update_badge(user_id, badge, value)
 
-        badges = await self.fetch_user_badges(user_id)
-        beekeeper_level = badges["beekeeper"]
+    async def on_stats_changed(
+        self,
+        user_id: int,
+        prev_stats: Mapping[str, int],
+        stats: Mapping[str, int],
+    ) -> None:
+        """Upgrades the badges which depend on a user's stats, given their stats from before and
+        after a write (from Database.tx_fetch_badge_stats)"""
 
-        if beekeeper_level == 3:
-            return
+        for stat, badge in STAT_BADGES.items():
+            await self.on_value_changed(user_id, badge, prev_stats[stat], stats[stat])
 
-        if bees is None:
-            bees = await self.db.fetch_item(user_id, "Jar Of Bees")
+    async def on_lb_changed(
+        self,
+        user_id: int,
+        lb: str,
+        prev_value: int | None,
+        value: int | None,
+    ) -> None:
+        if (badge := LB_BADGES.get(lb)) is not None:
+            await self.on_value_changed(user_id, badge, prev_value, value)
 
-            if bees is None:
-                bees = 0
-            else:
-                bees = bees.amount
+    async def update_lb_badge(self, user_id: int, lb: str, value: int) -> None:
+        if (badge := LB_BADGES.get(lb)) is not None:
+            await self.update_badge(user_id, badge, value)
 
-        if beekeeper_level < 3 and bees >= 100_000:
-            await self.update_user_badges(user_id, beekeeper=3)
-        elif beekeeper_level < 2 and bees >= 1000:
-            await self.update_user_badges(user_id, beekeeper=2)
-        elif beekeeper_level < 1 and bees >= 100:
-            await self.update_user_badges(user_id, beekeeper=1)
+    async def update_stat_badges(self, user_id: int) -> None:
+        """Checks all the badges which depend on a user's stats, for when it's unknown how they
+        changed"""
 
-    async def update_badge_pillager(self, user_id: int, pillaged_emeralds: int) -> None:
-        # levels are:
-        # I -> 100 emeralds stolen
-        # II -> 1_000 emeralds stolen
-        # III -> 100_000 emeralds stolen
+        stats = await self.db.fetch_badge_stats(user_id)
 
-        badges = await self.fetch_user_badges(user_id)
-        pillager_level = badges["pillager"]
+        for stat, badge in STAT_BADGES.items():
+            await self.update_badge(user_id, badge, stats[stat])
 
-        if pillager_level == 3:
+    @tasks.loop(seconds=5)
+    async def flush_badge_upgrades(self):
+        if not self._pending_upgrades:
             return
 
-        if pillager_level < 3 and pillaged_emeralds >= 100_000:
-            await self.update_user_badges(user_id, pillager=3)
-        elif pillager_level < 2 and pillaged_emeralds >= 1_000:
-            await self.update_user_badges(user_id, pillager=2)
-        elif pillager_level < 1 and pillaged_emeralds >= 100:
-            await self.update_user_badges(user_id, pillager=1)
+        pending = self._pending_upgrades
+        self._pending_upgrades = defaultdict[int, dict[str, Any]](dict)
 
-    async def update_badge_murderer(self, user_id: int, murders: int) -> None:
-        # levels are:
-        # I -> 100 mobs cruelly genocided
-        # II -> 1_000 mobs cruelly genocided
-        # III -> 10_000 mobs cruelly genocided
+        # users with the same upgraded badges are written with the same query
+        grouped = defaultdict[tuple[str, ...], list[list[Any]]](list)
 
-        badges = await self.fetch_user_badges(user_id)
-        murderer_level = badges["murderer"]
+        for user_id, upgrades in pending.items():
+            badges = tuple(sorted(upgrades))
+            grouped[badges].append([user_id, *(upgrades[b] for b in badges)])
 
-        if murderer_level == 3:
-            return
+        try:
+            for badges, rows in grouped.items():
+                await self.db.upgrade_user_badges(badges, rows)
+        except Exception:
+            # they're retried on the next flush, written upgrades are harmless to write again
+            for user_id, upgrades in pending.items():
+                self._pending_upgrades[user_id] = {**upgrades, **self._pending_upgrades[user_id]}
 
-        if murderer_level < 3 and murders >= 10_000:
-            await self.update_user_badges(user_id, murderer=3)
-        elif murderer_level < 2 and murders >= 1_000:
-            await self.update_user_badges(user_id, murderer=2)
-        elif murderer_level < 1 and murders >= 100:
-            await self.update_user_badges(user_id, murderer=1)
+            raise
 
-    async def update_badge_fisherman(self, user_id: int, fishies_fished: int) -> None:
-        # levels are:
-        # I -> 100 fishies fished (cod)
-        # II -> 1_000 fishies fished (tropical)
-        # III -> 10_000 fishies fished (rainbow trout)
-        # IV -> 100_000 fishies fished (emerald)
+    def emojify_badges(self, user_badges: dict) -> str:
+        emojis = []
 
-        badges = await self.fetch_user_badges(user_id)
-        fisherman_level = badges["fisherman"]
+        for badge, value in dict(user_badges).items():
+            if not value:
+                continue
 
-        if fisherman_level == 4:
-            return
+            emoji_entry = self.d.emojis.badges[badge]
 
-        if fisherman_level < 4 and fishies_fished >= 100_000:
-            await self.update_user_badges(user_id, fisherman=4)
-        elif fisherman_level < 3 and fishies_fished >= 10_000:
-            await self.update_user_badges(user_id, fisherman=3)
-        elif fisherman_level < 2 and fishies_fished >= 1_000:
-            await self.update_user_badges(user_id, fisherman=2)
-        elif fisherman_level < 1 and fishies_fished >= 100:
-            await self.update_user_badges(user_id, fisherman=1)
-
-    async def update_badge_enthusiast(self, user_id: int, commands_ran: int) -> None:
-        # levels are:
-        # I -> 10_000 commands ran
-        # II -> 1_000_000 commands ran
-        # III -> 100_000_000 commands ran
-
-        badges = await self.fetch_user_badges(user_id)
-        enthusiast_level = badges["enthusiast"]
-
-        if enthusiast_level < 3 and commands_ran > 10_000:
-            await self.update_user_badges(user_id, enthusiast=3)
-        elif enthusiast_level < 2 and commands_ran > 1_000_000:
-            await self.update_user_badges(user_id, enthusiast=2)
-        elif enthusiast_level < 1 and commands_ran > 100_000_000:
-            await self.update_user_badges(user_id, enthusiast=1)
+            if isinstance(emoji_entry, list):
+                emojis.append(emoji_entry[value - 1])
+            else:
+                emojis.append(emoji_entry)
+
+        return " ".join(emojis)
 
     async def generate_badges_image(self, user_id: int) -> io.BytesIO | None:
         """
@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import asyncio
 import datetime
+import json
 import typing
 from collections import defaultdict
 from contextlib import suppress
@@ -14,6 +15,8 @@ import discord
 from discord.ext import commands
 
 from bot.cogs.core.quests import Quests
+from bot.utils.database_proxy import StatementResult, Transaction
+from bot.utils.user_snapshot import UserSnapshot, UserSnapshots, current_user_snapshots
 from common.data.enums.guild_event_type import GuildEventType
 from common.models.db.guild import Guild
 from common.models.db.item import Item
@@ -26,6 +29,84 @@ if TYPE_CHECKING:
     from badges import Badges
     from quests import Quests
 
+# columns of the leaderboards table which are updated through update_lb
+LEADERBOARD_COLUMNS = (
+    "pillaged_emeralds",
+    "mobs_killed",
+    "fish_fished",
+    "commands",
+    "crops_planted",
+    "trash_emptied",
+    "week_emeralds",
+    "week_commands",
+    "daily_quests",
+    "week_daily_quests",
+)
+
+# frequently used queries, which are registered with Karen along with the generated ones
+SELECT_USER_QUERY = "SELECT * FROM users WHERE user_id = $1"
+SELECT_GUILD_QUERY = "SELECT * FROM guilds WHERE guild_id = $1"
+SELECT_ITEMS_QUERY = "SELECT * FROM items WHERE user_id = $1"
+SELECT_ITEM_QUERY = "SELECT * FROM items WHERE user_id = $1 AND LOWER(name) = LOWER($2)"
+SELECT_USER_SNAPSHOT_QUERY = "SELECT users.*, (SELECT COALESCE(JSON_AGG(items.*), '[]') FROM items WHERE items.user_id = users.user_id)::TEXT AS items FROM users WHERE user_id = $1"
+
+# subtracts as many emeralds as a user has up to an amount, returning how many were subtracted
+BALANCE_SUB_UP_TO_QUERY = "WITH prev AS (SELECT emeralds FROM users WHERE user_id = $2 FOR UPDATE) UPDATE users SET emeralds = users.emeralds - LEAST(prev.emeralds, $1::BIGINT) FROM prev WHERE users.user_id = $2 RETURNING LEAST(prev.emeralds, $1::BIGINT)"
+
+
+def badge_stats_sql(user_id_sql: str) -> str:
+    """The stats of a user which badges depend on, as columns for a SELECT or RETURNING clause"""
+
+    return (
+        f"(SELECT u.net_worth FROM users u WHERE u.user_id = {user_id_sql}) AS wealth, "
+        f"(SELECT COUNT(*) FROM items i WHERE i.user_id = {user_id_sql}) AS item_count, "
+        f"(SELECT COALESCE(SUM(i.amount), 0)::BIGINT FROM items i WHERE i.user_id = {user_id_sql} AND LOWER(i.name) = 'jar of bees') AS bees"
+    )
+
+
+BADGE_STATS_QUERY = f"SELECT {badge_stats_sql('$1')}"
+
+# creates the user if they don't exist yet, xmax is only zero for a freshly inserted row
+BALANCE_ADD_QUERY = "INSERT INTO users (user_id, emeralds) VALUES ($1, GREATEST($2::BIGINT, 0)) ON CONFLICT (user_id) DO UPDATE SET emeralds = GREATEST(users.emeralds + $2::BIGINT, 0) RETURNING emeralds, net_worth, xmax = 0 AS inserted"
+SET_BALANCE_QUERY = "WITH prev AS (SELECT emeralds FROM users WHERE user_id = $1 FOR UPDATE) UPDATE users SET emeralds = $2::BIGINT FROM prev WHERE users.user_id = $1 RETURNING prev.emeralds AS prev_emeralds, users.net_worth"
+SET_VAULT_QUERY = "WITH prev AS (SELECT vault_balance FROM users WHERE user_id = $1 FOR UPDATE) UPDATE users SET vault_balance = LEAST(GREATEST($2::INT, 0), $3::INT), vault_max = $3::INT FROM prev WHERE users.user_id = $1 RETURNING users.vault_balance, prev.vault_balance AS prev_vault_balance, users.net_worth"
+
+# relies on the unique index on items (user_id, LOWER(name)), the returned badge stats are from
+# before the item was added, as subqueries don't see the statement's own changes
+ADD_ITEM_QUERY = f"INSERT INTO items (user_id, name, sell_price, amount, sticky, sellable) VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT (user_id, LOWER(name)) DO UPDATE SET amount = items.amount + EXCLUDED.amount RETURNING amount, sell_price, xmax = 0 AS inserted, {badge_stats_sql('items.user_id')}"
+
+# deletes the item if the user would have none of it left, otherwise subtracts the amount from it
+REMOVE_ITEM_QUERY = "WITH deleted AS (DELETE FROM items WHERE user_id = $1 AND LOWER(name) = LOWER($2) AND amount <= $3) UPDATE items SET amount = amount - $3 WHERE user_id = $1 AND LOWER(name) = LOWER($2) AND amount > $3"
+
+# run on every unlucky mine, relies on the unique index on trash_can (user_id, item)
+ADD_TO_TRASHCAN_QUERY = "INSERT INTO trash_can (user_id, item, value, amount) VALUES ($1, $2, $3, $4) ON CONFLICT (user_id, item) DO UPDATE SET value = EXCLUDED.value, amount = trash_can.amount + EXCLUDED.amount"
+
+
+def update_user_query(columns: typing.Sequence[str]) -> str:
+    sets = ",".join(f"{column} = ${i + 1}" for i, column in enumerate(columns))
+    return f"UPDATE users SET {sets} WHERE user_id = ${len(columns) + 1}"
+
+
+def update_lb_query(lb: str, mode: str) -> str:
+    if mode == "add":
+        return f"UPDATE leaderboards SET {lb} = {lb} + $1 WHERE user_id = $2 RETURNING {lb}"
+
+    if mode == "sub":
+        return f"UPDATE leaderboards SET {lb} = {lb} - $1 WHERE user_id = $2"
+
+    return f"UPDATE leaderboards SET {lb} = $1 WHERE user_id = $2"
+
+
+def set_guild_attr_query(attr: str) -> str:
+    return f"UPDATE guilds SET {attr} = $1 WHERE guild_id = $2"
+
+
+def update_daily_quest_query(key: str, mode: str) -> str:
+    sql_value = f"daily_quests.{key} + $1" if mode == "add" else "$1"
+    return (
+        f"UPDATE daily_quests SET {key} = {sql_value} WHERE daily_quests.user_id = $2 RETURNING *"
+    )
+
 
 class Database(commands.Cog):
     def __init__(self, bot: VillagerBotCluster):
@@ -45,7 +126,40 @@ class Database(commands.Cog):
     def quests(self) -> Quests:
         return typing.cast("Quests", self.bot.get_cog("Quests"))
 
+    def registered_queries(self) -> list[str]:
+        """The queries which are registered with Karen, so they're sent as an id instead of as text"""
+
+        return [
+            SELECT_USER_QUERY,
+            SELECT_GUILD_QUERY,
+            SELECT_ITEMS_QUERY,
+            SELECT_ITEM_QUERY,
+            SELECT_USER_SNAPSHOT_QUERY,
+            BALANCE_ADD_QUERY,
+            BALANCE_SUB_UP_TO_QUERY,
+            SET_VAULT_QUERY,
+            SET_BALANCE_QUERY,
+            ADD_ITEM_QUERY,
+            BADGE_STATS_QUERY,
+            REMOVE_ITEM_QUERY,
+            ADD_TO_TRASHCAN_QUERY,
+            *(update_user_query([column]) for column in User.__fields__ if column != "user_id"),
+            *(set_guild_attr_query(attr) for attr in Guild.__fields__ if attr != "guild_id"),
+            *(
+                update_lb_query(lb, mode)
+                for lb in LEADERBOARD_COLUMNS
+                for mode in ("add", "sub", "set")
+            ),
+            *(
+                update_daily_quest_query(key, mode)
+                for key in self.d.quests
+                for mode in ("add", "set")
+            ),
+        ]
+
     async def populate_caches(self):
+        await self.db.register_queries(self.registered_queries())
+
         # caches which need to be maintained across all clusters
         self.bot.botban_cache = await self.fetch_all_botbans()
 
@@ -64,14 +178,16 @@ class Database(commands.Cog):
     async def add_reminder(
         self,
         user_id: int,
+        guild_id: int | None,
         channel_id: int,
         message_id: int,
         reminder: str,
         at: datetime.datetime,
     ) -> None:
         await self.db.execute(
-            "INSERT INTO reminders (user_id, channel_id, message_id, reminder, at) VALUES ($1, $2, $3, $4, $5)",
+            "INSERT INTO reminders (user_id, guild_id, channel_id, message_id, reminder, at) VALUES ($1, $2, $3, $4, $5, $6)",
             user_id,
+            guild_id,
             channel_id,
             message_id,
             reminder,
@@ -88,39 +204,40 @@ class Database(commands.Cog):
         return bool(count)
 
     async def fetch_all_botbans(self) -> set[int]:
-        botban_records = await self.db.fetch("SELECT user_id FROM users WHERE bot_banned = true")
-        return {r["user_id"] for r in botban_records}
+        return {
+            r["user_id"]
+            async for r in self.db.cursor("SELECT user_id FROM users WHERE bot_banned = true")
+        }
 
     async def fetch_all_guild_langs(self) -> dict:
-        lang_records = await self.db.fetch(
+        lang_records = self.db.cursor(
             "SELECT guild_id, language FROM guilds WHERE language != $1 AND language != $2",
             "en",
             "en_us",
         )
-        return {r["guild_id"]: r["language"] for r in lang_records}
+        return {r["guild_id"]: r["language"] async for r in lang_records}
 
     async def fetch_all_guild_prefixes(self) -> dict[int, str]:
-        prefix_records = await self.db.fetch(
+        prefix_records = self.db.cursor(
             "SELECT guild_id, prefix FROM guilds WHERE prefix != $1",
             self.k.default_prefix,
         )
-        return {r["guild_id"]: r["prefix"] for r in prefix_records}
+        return {r["guild_id"]: r["prefix"] async for r in prefix_records}
 
     async def fetch_all_disabled_commands(self) -> dict[int, set[str]]:
-        disabled_records = await self.db.fetch("SELECT * FROM disabled_commands")
         disabled = defaultdict(set)
 
-        for record in disabled_records:
+        async for record in self.db.cursor("SELECT * FROM disabled_commands"):
             disabled[record["guild_id"]].add(record["command"])
 
         return disabled
 
     async def fetch_all_do_replies(self) -> set[int]:
-        replies_records = await self.db.fetch("SELECT guild_id FROM guilds WHERE do_replies = true")
-        return {r["guild_id"] for r in replies_records}
+        replies_records = self.db.cursor("SELECT guild_id FROM guilds WHERE do_replies = true")
+        return {r["guild_id"] async for r in replies_records}
 
     async def fetch_guild(self, guild_id: int) -> Guild:
-        g = await self.db.fetchrow("SELECT * FROM guilds WHERE guild_id = $1", guild_id)
+        g = await self.db.fetchrow(SELECT_GUILD_QUERY, guild_id)
 
         if g is None:
             g = await self.db.fetchrow(
@@ -134,7 +251,7 @@ class Database(commands.Cog):
 
     async def set_guild_attr(self, guild_id: int, attr: str, value: object) -> None:
         await self.fetch_guild(guild_id)  # ensure it exists in db
-        await self.db.execute(f"UPDATE guilds SET {attr} = $1 WHERE guild_id = $2", value, guild_id)
+        await self.db.execute(set_guild_attr_query(attr), value, guild_id)
 
     async def drop_guild(self, guild_id: int) -> None:
         await self.db.execute("DELETE FROM guilds WHERE guild_id = $1", guild_id)
@@ -160,15 +277,95 @@ class Database(commands.Cog):
         if user_id in self.bot.existing_users_cache:
             return
 
-        await self.fetch_user(user_id)  # will create user if they don't exist
-
-        self.bot.existing_user_lbs_cache.add(user_id)
+        await self._fetch_user(user_id)  # will create user if they don't exist
 
-        if len(self.bot.existing_users_cache) > 30:
+        if len(self.bot.existing_users_cache) >= 30:
             self.bot.existing_users_cache.pop()
 
+        self.bot.existing_users_cache.add(user_id)
+
+    def begin_user_snapshots(self) -> UserSnapshots:
+        """Starts a scope in which each user's row, items and active effects are only loaded once,
+        which lasts for the rest of the current task (and tasks it creates)"""
+
+        snapshots = UserSnapshots()
+        current_user_snapshots.set(snapshots)
+        return snapshots
+
+    async def fetch_user_snapshot(self, user_id: int) -> UserSnapshot:
+        snapshots = current_user_snapshots.get()
+
+        if snapshots is None:
+            return await self._load_user_snapshot(user_id)
+
+        return await snapshots.fetch(user_id, self._load_user_snapshot)
+
+    async def _load_user_snapshot(self, user_id: int) -> UserSnapshot:
+        record, active_fx = await asyncio.gather(
+            self.db.fetchrow(SELECT_USER_SNAPSHOT_QUERY, user_id),
+            self.bot.karen.fetch_active_fx(user_id),
+        )
+
+        if record is None:
+            await self._fetch_user(user_id)  # creates the user
+            record = await self.db.fetchrow(SELECT_USER_SNAPSHOT_QUERY, user_id)
+
+        return UserSnapshot(
+            User(**record),
+            [Item(**item) for item in json.loads(record["items"])],
+            active_fx,
+        )
+
+    async def _snapshot(self, user_id: int) -> UserSnapshot | None:
+        """Returns the user's snapshot if the current task is in a snapshot scope"""
+
+        if current_user_snapshots.get() is None:
+            return None
+
+        return await self.fetch_user_snapshot(user_id)
+
+    def _loaded_snapshot(self, user_id: int) -> UserSnapshot | None:
+        """Returns the user's snapshot if it's been loaded, to keep it up to date after a write"""
+
+        snapshots = current_user_snapshots.get()
+
+        if snapshots is None:
+            return None
+
+        return snapshots.loaded(user_id)
+
+    async def fetch_active_fx(self, user_id: int) -> set[str]:
+        if snapshot := await self._snapshot(user_id):
+            return set(snapshot.active_fx)
+
+        return await self.bot.karen.fetch_active_fx(user_id)
+
+    async def check_active_fx(self, user_id: int, fx: str) -> bool:
+        if snapshot := await self._snapshot(user_id):
+            return fx.lower() in snapshot.active_fx
+
+        return await self.bot.karen.check_active_fx(user_id, fx)
+
+    async def add_active_fx(self, user_id: int, fx: str, duration: float) -> None:
+        await self.bot.karen.add_active_fx(user_id, fx, duration)
+
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.active_fx.add(fx.lower())
+
+    async def clear_active_fx(self, user_id: int) -> None:
+        await self.bot.karen.clear_active_fx(user_id)
+
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.active_fx.clear()
+
     async def fetch_user(self, user_id: int) -> User:
-        user = await self.db.fetchrow("SELECT * FROM users WHERE user_id = $1", user_id)
+        if snapshot := await self._snapshot(user_id):
+            return snapshot.user.copy()
+
+        return await self._fetch_user(user_id)
+
+    async def _fetch_user(self, user_id: int) -> User:
+        user = await self.db.fetchrow(SELECT_USER_QUERY, user_id)
 
         if user is None:
             user = await self.db.fetchrow(
@@ -176,99 +373,142 @@ class Database(commands.Cog):
                 user_id,
             )
 
-            await self.add_item(user_id, "Wood Pickaxe", 0, 1, True, False)
-            await self.add_item(user_id, "Wood Sword", 0, 1, True, False)
-            await self.add_item(user_id, "Wood Hoe", 0, 1, True, False)
-            await self.add_item(user_id, "Wheat Seed", 24, 5)
+            await self.add_starter_items(user_id)
 
         return User(**user)
 
+    async def add_starter_items(self, user_id: int) -> None:
+        # none of these can earn a badge, so they're added without checking any
+        await self.db.executemany(
+            ADD_ITEM_QUERY,
+            [
+                (user_id, "Wood Pickaxe", 0, 1, True, False),
+                (user_id, "Wood Sword", 0, 1, True, False),
+                (user_id, "Wood Hoe", 0, 1, True, False),
+                (user_id, "Wheat Seed", 24, 5, False, True),
+            ],
+        )
+
     async def update_user(self, user_id: int, **kwargs) -> None:
-        db_user = await self.fetch_user(
-            user_id,
-        )  # ensures user exists + we use db_user for updating badges
+        await self.ensure_user_exists(user_id)
 
-        values = []
-        sql = []
-
-        for i, (k, v) in enumerate(kwargs.items()):
-            values.append(v)
-            sql.append(f"{k} = ${i + 1}")
+        # columns are sorted so each combination of them always results in the same query
+        columns = sorted(kwargs)
 
         # this sql query crafting is safe because the user's input is still sanitized by asyncpg
         await self.db.execute(
-            f"UPDATE users SET {','.join(sql)} WHERE user_id = ${i + 2}",
-            *values,
+            update_user_query(columns),
+            *[kwargs[column] for column in columns],
             user_id,
         )
 
-        # update badges
-        await self.badges.update_badge_uncle_scrooge(user_id, db_user)
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.update_user(kwargs)
+
+        # it's unknown how the user's wealth changed, so it's checked in full
+        if "emeralds" in kwargs or "vault_balance" in kwargs:
+            await self.badges.update_stat_badges(user_id)
 
     async def fetch_balance(self, user_id: int) -> int:
         """Fetches the amount of emeralds a user has"""
 
+        if snapshot := await self._snapshot(user_id):
+            return snapshot.user.emeralds
+
         await self.ensure_user_exists(user_id)
         return await self.db.fetchval("SELECT emeralds FROM users WHERE user_id = $1", user_id)
 
     async def set_balance(self, user_id: int, emeralds: int) -> None:
-        db_user = await self.fetch_user(
+        await self.ensure_user_exists(user_id)
+
+        result = await self.db.fetchrow(SET_BALANCE_QUERY, user_id, emeralds)
+
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.update_user({"emeralds": emeralds})
+
+        await self.badges.on_value_changed(
             user_id,
-        )  # ensures user exists + we use db_user for updating badges
-        await self.db.execute(
-            "UPDATE users SET emeralds = $1 WHERE user_id = $2",
-            emeralds,
+            "uncle_scrooge",
+            result["net_worth"] - emeralds + result["prev_emeralds"],
+            result["net_worth"],
+        )
+
+    async def balance_add(self, user_id: int, amount: int) -> int:
+        """Adds emeralds to a user's balance, which can't go below zero, returning the new balance"""
+
+        result = await self.db.fetchrow(
+            BALANCE_ADD_QUERY,
             user_id,
+            amount,
         )
 
-        # update badges
-        await self.badges.update_badge_uncle_scrooge(user_id, db_user)
+        if result["inserted"]:
+            await self.add_starter_items(user_id)
 
-    async def balance_add(self, user_id: int, amount: int) -> int:
-        new_bal = await self.fetch_balance(user_id) + amount
-        await self.set_balance(user_id, new_bal)
-        return new_bal
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.update_user({"emeralds": result["emeralds"]})
+
+        if amount > 0:
+            net_worth = result["net_worth"]
+            await self.badges.on_value_changed(
+                user_id,
+                "uncle_scrooge",
+                net_worth - amount,
+                net_worth,
+            )
+
+        return result["emeralds"]
 
     async def balance_sub(self, user_id: int, amount: int) -> int:
-        bal = await self.fetch_balance(user_id)
-        new = bal - amount
+        """Subtracts up to the given amount of emeralds from a user's balance, returning how many
+        were actually subtracted"""
 
-        if new < 0:
-            amount = bal
-            new = 0
+        # a user who doesn't exist yet has no emeralds to take
+        subtracted = await self.db.fetchval(BALANCE_SUB_UP_TO_QUERY, amount, user_id) or 0
 
-        await self.set_balance(user_id, new)
-        return amount
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.update_user({"emeralds": snapshot.user.emeralds - subtracted})
+
+        return subtracted
 
     async def set_vault(self, user_id: int, vault_balance: int, vault_max: int) -> None:
-        db_user = await self.fetch_user(
+        """Sets a user's vault, the balance is clamped between zero and the vault's max"""
+
+        await self.ensure_user_exists(user_id)
+
+        result = await self.db.fetchrow(
+            SET_VAULT_QUERY,
             user_id,
-        )  # ensures user exists + we use db_user for updating badges
-        await self.db.execute(
-            "UPDATE users SET vault_balance = $1, vault_max = $2 WHERE user_id = $3",
             vault_balance,
             vault_max,
-            user_id,
         )
 
-        # update badges
-        await self.badges.update_badge_uncle_scrooge(user_id, db_user)
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.update_user(
+                {"vault_balance": result["vault_balance"], "vault_max": vault_max},
+            )
+
+        await self.badges.on_value_changed(
+            user_id,
+            "uncle_scrooge",
+            result["net_worth"] + (result["prev_vault_balance"] - result["vault_balance"]) * 9,
+            result["net_worth"],
+        )
 
     async def fetch_items(self, user_id: int) -> list[Item]:
+        if snapshot := await self._snapshot(user_id):
+            return snapshot.fetch_items()
+
         await self.ensure_user_exists(user_id)
-        return [
-            Item(**r)
-            for r in await self.db.fetch("SELECT * FROM items WHERE user_id = $1", user_id)
-        ]
+        return [Item(**r) for r in await self.db.fetch(SELECT_ITEMS_QUERY, user_id)]
 
     async def fetch_item(self, user_id: int, name: str) -> Item | None:
+        if snapshot := await self._snapshot(user_id):
+            return snapshot.fetch_item(name)
+
         await self.ensure_user_exists(user_id)
 
-        db_item = await self.db.fetchrow(
-            "SELECT * FROM items WHERE user_id = $1 AND LOWER(name) = LOWER($2)",
-            user_id,
-            name,
-        )
+        db_item = await self.db.fetchrow(SELECT_ITEM_QUERY, user_id, name)
 
         if db_item:
             return Item(**db_item)
@@ -283,53 +523,160 @@ class Database(commands.Cog):
         amount: int,
         sticky: bool = False,
         sellable: bool = True,
-    ) -> None:
-        prev = await self.fetch_item(user_id, name)
+    ) -> int:
+        """Adds an amount of an item to a user, returning how many of it they now have"""
 
-        if prev is None:
-            await self.db.execute(
-                "INSERT INTO items (user_id, name, sell_price, amount, sticky, sellable) VALUES ($1, $2, $3, $4, $5, $6)",
-                user_id,
-                name,
-                sell_price,
-                amount,
-                sticky,
-                sellable,
-            )
-        else:
-            await self.db.execute(
-                "UPDATE items SET amount = $1 WHERE user_id = $2 AND LOWER(name) = LOWER($3)",
-                amount + prev.amount,
-                user_id,
-                name,
-            )
+        await self.ensure_user_exists(user_id)
+
+        result = await self.db.fetchrow(
+            ADD_ITEM_QUERY,
+            user_id,
+            name,
+            sell_price,
+            amount,
+            sticky,
+            sellable,
+        )
 
-        # update badges
-        await self.badges.update_badge_uncle_scrooge(user_id)
-        await self.badges.update_badge_collector(user_id)
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.add_item(name, sell_price, result["amount"], sticky, sellable)
 
-        if name == "Jar Of Bees":
-            await self.badges.update_badge_beekeeper(user_id)
+        # the badge stats returned are from before the item was added
+        stats = {
+            "wealth": result["wealth"] + max(result["sell_price"] or 0, 0) * amount,
+            "item_count": result["item_count"] + result["inserted"],
+            "bees": result["bees"] + (amount if name.lower() == "jar of bees" else 0),
+        }
+        await self.badges.on_stats_changed(user_id, result, stats)
+
+        return result["amount"]
 
     async def remove_item(self, user_id: int, name: str, amount: int) -> None:
-        prev = await self.fetch_item(user_id, name)
+        # removing items can only lower a user's wealth, so no badges need to be updated
+        await self.db.execute(REMOVE_ITEM_QUERY, user_id, name, amount)
 
-        if prev.amount - amount < 1:
-            await self.db.execute(
-                "DELETE FROM items WHERE user_id = $1 AND LOWER(name) = LOWER($2)",
-                user_id,
-                name,
-            )
-        else:
-            await self.db.execute(
-                "UPDATE items SET amount = $1 WHERE user_id = $2 AND LOWER(name) = LOWER($3)",
-                prev.amount - amount,
-                user_id,
-                name,
-            )
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.remove_item(name, amount)
+
+    def transaction(self) -> Transaction:
+        """Creates a builder for statements which are run atomically in one round trip, the tx_*
+        methods add common statements to one"""
+
+        return self.db.transaction()
+
+    def tx_balance_add(self, tx: Transaction, user_id: int, amount: int) -> StatementResult:
+        return tx.fetchval(
+            "UPDATE users SET emeralds = emeralds + $1 WHERE user_id = $2 RETURNING emeralds",
+            amount,
+            user_id,
+            required=True,
+        )
 
-        # update badges
-        await self.badges.update_badge_uncle_scrooge(user_id)
+    def tx_balance_sub(self, tx: Transaction, user_id: int, amount: int) -> StatementResult:
+        """Rolls the transaction back if the user doesn't have enough emeralds"""
+
+        return tx.fetchval(
+            "UPDATE users SET emeralds = emeralds - $1 WHERE user_id = $2 AND emeralds >= $1 RETURNING emeralds",
+            amount,
+            user_id,
+            required=True,
+        )
+
+    def tx_balance_sub_up_to(self, tx: Transaction, user_id: int, amount: int) -> StatementResult:
+        """Subtracts as many emeralds as the user has up to the amount, returning how many were"""
+
+        return tx.fetchval(BALANCE_SUB_UP_TO_QUERY, amount, user_id, required=True)
+
+    def tx_add_item(
+        self,
+        tx: Transaction,
+        user_id: int,
+        name: str,
+        sell_price: int,
+        amount: int,
+        sticky: bool = False,
+        sellable: bool = True,
+    ) -> None:
+        tx.execute(
+            ADD_ITEM_QUERY,
+            user_id,
+            name,
+            sell_price,
+            amount,
+            sticky,
+            sellable,
+        )
+
+    def tx_remove_item(
+        self,
+        tx: Transaction,
+        user_id: int,
+        name: str,
+        amount: int,
+    ) -> StatementResult:
+        """Rolls the transaction back if the user doesn't have enough of the item"""
+
+        remaining = tx.fetchval(
+            "UPDATE items SET amount = amount - $3 WHERE user_id = $1 AND LOWER(name) = LOWER($2) AND amount >= $3 RETURNING amount",
+            user_id,
+            name,
+            amount,
+            required=True,
+        )
+        tx.execute(
+            "DELETE FROM items WHERE user_id = $1 AND LOWER(name) = LOWER($2) AND amount < 1",
+            user_id,
+            name,
+        )
+
+        return remaining
+
+    def tx_update_lb(self, tx: Transaction, user_id: int, lb: str, value: int) -> StatementResult:
+        tx.execute(
+            "INSERT INTO leaderboards (user_id) VALUES ($1) ON CONFLICT (user_id) DO NOTHING",
+            user_id,
+        )
+
+        return tx.fetchval(update_lb_query(lb, "add"), value, user_id)
+
+    def tx_log_transaction(
+        self,
+        tx: Transaction,
+        item: str,
+        amount: int,
+        at: datetime.datetime,
+        giver: int,
+        receiver: int,
+    ) -> None:
+        tx.execute(
+            "INSERT INTO give_logs (item, amount, at, sender, receiver) VALUES ($1, $2, $3, $4, $5)",
+            item,
+            amount,
+            at,
+            giver,
+            receiver,
+        )
+
+    def tx_rich_trophy_wipe(self, tx: Transaction, user_id: int) -> None:
+        tx.execute(
+            "UPDATE users SET emeralds = 0, vault_balance = 0, vault_max = 1 WHERE user_id = $1",
+            user_id,
+        )
+        tx.execute(
+            "DELETE FROM items WHERE user_id = $1 AND NOT name = ANY($2::VARCHAR(250)[])",
+            user_id,
+            self.d.rpt_ignore,
+        )
+        tx.execute("DELETE FROM trash_can WHERE user_id = $1", user_id)
+        tx.execute("DELETE FROM farm_plots WHERE user_id = $1", user_id)
+
+    def tx_fetch_badge_stats(self, tx: Transaction, user_id: int) -> StatementResult:
+        """Fetches the stats of a user which badges depend on, at this point in the transaction"""
+
+        return tx.fetchrow(BADGE_STATS_QUERY, user_id)
+
+    async def fetch_badge_stats(self, user_id: int) -> dict[str, int]:
+        return await self.db.fetchrow(BADGE_STATS_QUERY, user_id)
 
     async def fuzzy_fetch_item_and_count(self, name: str) -> tuple[str | None, int]:
         result = await self.db.fetchrow(
@@ -428,17 +775,8 @@ class Database(commands.Cog):
         return "Wood Hoe"
 
     async def rich_trophy_wipe(self, user_id: int) -> None:
-        await self.set_balance(user_id, 0)
-        await self.set_vault(user_id, 0, 1)
-
-        await self.db.execute(
-            "DELETE FROM items WHERE user_id = $1 AND NOT name = ANY($2::VARCHAR(250)[])",
-            user_id,
-            self.d.rpt_ignore,
-        )
-
-        await self.db.execute("DELETE FROM trash_can WHERE user_id = $1", user_id)
-        await self.db.execute("DELETE FROM farm_plots WHERE user_id = $1", user_id)
+        async with self.transaction() as tx:
+            self.tx_rich_trophy_wipe(tx, user_id)
 
     async def ensure_user_lb(self, user_id: int) -> None:
         """Ensure that a user exists in the leaderboards table"""
@@ -460,41 +798,30 @@ class Database(commands.Cog):
         await self.ensure_user_lb(user_id)  # ensure lb entry exists
 
         if mode == "add":
-            user_lb_value = await self.db.fetchval(
-                f"UPDATE leaderboards SET {lb} = {lb} + $1 WHERE user_id = $2 RETURNING {lb}",
-                value,
-                user_id,
-            )
-
-            if lb == "pillaged_emeralds":
-                await self.badges.update_badge_pillager(user_id, user_lb_value)
-            elif lb == "mobs_killed":
-                await self.badges.update_badge_murderer(user_id, user_lb_value)
-            elif lb == "fish_fished":
-                await self.badges.update_badge_fisherman(user_id, user_lb_value)
-            elif lb == "commands":
-                await self.badges.update_badge_enthusiast(user_id, user_lb_value)
+            user_lb_value = await self.db.fetchval(update_lb_query(lb, mode), value, user_id)
+            await self.badges.on_lb_changed(user_id, lb, user_lb_value - value, user_lb_value)
         elif mode == "sub":
-            await self.db.execute(
-                f"UPDATE leaderboards SET {lb} = {lb} - $1 WHERE user_id = $2",
-                value,
-                user_id,
-            )
+            await self.db.execute(update_lb_query(lb, mode), value, user_id)
         elif mode == "set":
-            await self.db.execute(
-                f"UPDATE leaderboards SET {lb} = $1 WHERE user_id = $2",
-                value,
-                user_id,
-            )
+            await self.db.execute(update_lb_query(lb, mode), value, user_id)
+
+            await self.badges.update_lb_badge(user_id, lb, value)
 
-            if lb == "pillaged_emeralds":
-                await self.badges.update_badge_pillager(user_id, value)
-            elif lb == "mobs_killed":
-                await self.badges.update_badge_murderer(user_id, value)
-            elif lb == "fish_fished":
-                await self.badges.update_badge_fisherman(user_id, value)
+    async def fetch_lb_snapshot(
+        self,
+        lb: str,
+        user_id: int,
+        user_ids: list[int] | None = None,
+    ) -> list[dict[str, Any]] | None:
+        """Fetches a leaderboard from the snapshots Karen keeps, which are refreshed every few
+        minutes, returns None if Karen doesn't have a snapshot of it yet"""
+
+        return await self.bot.karen.fetch_leaderboard(lb, user_id, user_ids)
 
     async def fetch_global_lb(self, lb: str, user_id: int) -> list[dict[str, Any]]:
+        if (snapshot := await self.fetch_lb_snapshot(lb, user_id)) is not None:
+            return snapshot
+
         return await self.db.fetch(
             f"""
         WITH lb AS (SELECT user_id, {lb} AS amount, ROW_NUMBER() OVER(ORDER BY {lb} DESC) AS idx FROM leaderboards)
@@ -507,6 +834,9 @@ class Database(commands.Cog):
         )
 
     async def fetch_local_lb(self, lb: str, user_id: int, user_ids: list) -> list[dict[str, Any]]:
+        if (snapshot := await self.fetch_lb_snapshot(lb, user_id, user_ids)) is not None:
+            return snapshot
+
         return await self.db.fetch(
             f"""
         WITH lb AS (SELECT user_id, {lb} AS amount, ROW_NUMBER() OVER(ORDER BY {lb} DESC) AS idx FROM leaderboards WHERE user_id = ANY($2::BIGINT[]))
@@ -520,6 +850,9 @@ class Database(commands.Cog):
         )
 
     async def fetch_global_lb_user(self, column: str, user_id: int) -> list[dict[str, Any]]:
+        if (snapshot := await self.fetch_lb_snapshot(column, user_id)) is not None:
+            return snapshot
+
         return await self.db.fetch(
             f"""
         WITH lb AS (SELECT user_id, {column} AS amount, ROW_NUMBER() OVER(ORDER BY {column} DESC) AS idx FROM users WHERE {column} > 0 AND bot_banned = false)
@@ -537,6 +870,9 @@ class Database(commands.Cog):
         user_id: int,
         user_ids: list,
     ) -> list[dict[str, Any]]:
+        if (snapshot := await self.fetch_lb_snapshot(column, user_id, user_ids)) is not None:
+            return snapshot
+
         return await self.db.fetch(
             f"""
         WITH lb AS (SELECT user_id, {column} AS amount, ROW_NUMBER() OVER(ORDER BY {column} DESC) AS idx FROM users WHERE {column} > 0 AND bot_banned = false AND user_id = ANY($2::BIGINT[]))
@@ -582,6 +918,9 @@ class Database(commands.Cog):
         )
 
     async def fetch_global_lb_unique_items(self, user_id: int) -> list[dict[str, Any]]:
+        if (snapshot := await self.fetch_lb_snapshot("unique_items", user_id)) is not None:
+            return snapshot
+
         return await self.db.fetch(
             """
         WITH lb AS (SELECT user_id, COUNT(*) AS amount, ROW_NUMBER() OVER(ORDER BY COUNT(*) DESC) AS idx FROM items GROUP BY user_id)
@@ -598,6 +937,11 @@ class Database(commands.Cog):
         user_id: int,
         user_ids: list,
     ) -> list[dict[str, Any]]:
+        snapshot = await self.fetch_lb_snapshot("unique_items", user_id, user_ids)
+
+        if snapshot is not None:
+            return snapshot
+
         return await self.db.fetch(
             """
         WITH lb AS (SELECT user_id, COUNT(*) AS amount, ROW_NUMBER() OVER(ORDER BY COUNT(*) DESC) AS idx FROM items WHERE user_id = ANY($2::BIGINT[]) GROUP BY user_id)
@@ -610,65 +954,6 @@ class Database(commands.Cog):
             user_ids,
         )
 
-    async def fetch_global_lb_total_wealth(self, user_id: int) -> list[dict[str, Any]]:
-        return await self.db.fetch(
-            (
-                """
-                WITH
-                    users_total_wealth AS (
-                        SELECT
-                            users.user_id,
-                            (emeralds + vault_balance * 9 + SUM(items.sell_price * items.amount)) AS amount
-                        FROM users
-                        JOIN items ON users.user_id = items.user_id
-                        GROUP BY users.user_id
-                    ),
-                    lb AS (
-                        SELECT *, ROW_NUMBER() OVER (ORDER BY amount DESC) AS idx
-                        FROM users_total_wealth
-                        WHERE amount IS NOT NULL
-                    )
-                SELECT * FROM lb
-                WHERE idx <= 10 OR user_id = $1
-                ORDER BY idx ASC;
-                """
-            ),
-            user_id,
-        )
-
-    async def fetch_local_lb_total_wealth(
-        self, user_id: int, user_ids: list[int]
-    ) -> list[dict[str, Any]]:
-        return await self.db.fetch(
-            (
-                """
-                WITH
-                    users_total_wealth AS (
-                        SELECT
-                            users.user_id,
-                            (emeralds + vault_balance * 9 + SUM(items.sell_price * items.amount)) AS amount
-                        FROM users
-                        JOIN items ON users.user_id = items.user_id
-                        WHERE users.user_id = ANY($2::BIGINT[])
-                        GROUP BY users.user_id
-                    ),
-                    lb AS (
-                        SELECT *, ROW_NUMBER() OVER (ORDER BY amount DESC) AS idx
-                        FROM users_total_wealth
-                        WHERE amount IS NOT NULL
-                    )
-                (
-                    (SELECT * FROM lb LIMIT 10)
-                    UNION
-                    (SELECT * FROM lb WHERE user_id = $1)
-                )
-                ORDER BY idx ASC;
-                """
-            ),
-            user_id,
-            user_ids,
-        )
-
     async def set_botbanned(self, user_id: int, botbanned: bool) -> None:
         await self.ensure_user_exists(user_id)
 
@@ -685,6 +970,9 @@ class Database(commands.Cog):
             user_id,
         )
 
+        if snapshot := self._loaded_snapshot(user_id):
+            snapshot.update_user({"bot_banned": botbanned})
+
     async def add_warn(self, user_id: int, guild_id: int, mod_id: int, reason: str) -> None:
         await self.db.execute(
             "INSERT INTO warnings (user_id, guild_id, mod_id, reason) VALUES ($1, $2, $3, $4)",
@@ -771,40 +1059,62 @@ class Database(commands.Cog):
             user_id,
         )
 
+    async def upgrade_user_badges(
+        self,
+        badges: typing.Sequence[str],
+        rows: list[list[Any]],
+    ) -> None:
+        """Upgrades the given badges of many users at once, each row is a user id followed by the
+        new value of each badge, a badge is never downgraded"""
+
+        columns = ", ".join(badges)
+        placeholders = ", ".join(f"${i + 1}" for i in range(len(badges) + 1))
+        sets = ", ".join(f"{b} = GREATEST(badges.{b}, EXCLUDED.{b})" for b in badges)
+
+        # this sql query crafting is safe because the badge names aren't from user input
+        await self.db.executemany(
+            f"INSERT INTO badges (user_id, {columns}) VALUES ({placeholders}) ON CONFLICT (user_id) DO UPDATE SET {sets}",
+            rows,
+        )
+
     async def fetch_farm_plots(self, user_id: int) -> list[dict[str, Any]]:
+        """Fetches a user's farm plots, each row is a batch of count plots planted at once"""
+
         return await self.db.fetch(
             "SELECT * FROM farm_plots WHERE user_id = $1 ORDER BY planted_at ASC",
             user_id,
         )
 
     async def count_farm_plots(self, user_id: int) -> int:
-        return await self.db.fetchval("SELECT COUNT(*) FROM farm_plots WHERE user_id = $1", user_id)
+        return await self.db.fetchval(
+            "SELECT COALESCE(SUM(count), 0)::BIGINT FROM farm_plots WHERE user_id = $1",
+            user_id,
+        )
 
     async def count_ready_farm_plots(self, user_id: int) -> int:
         return await self.db.fetchval(
-            "SELECT COUNT(*) FROM farm_plots WHERE user_id = $1 AND NOW() > planted_at + grow_time",
+            "SELECT COALESCE(SUM(count), 0)::BIGINT FROM farm_plots WHERE user_id = $1 AND NOW() > planted_at + grow_time",
             user_id,
         )
 
     async def add_farm_plot(self, user_id: int, crop_type: str, amount: int) -> None:
         crop_time = self.d.farming.crop_times[crop_type]
 
-        await self.db.executemany(
-            "INSERT INTO farm_plots (user_id, crop_type, planted_at, grow_time) VALUES ($1, $2, NOW(), $3::TEXT::INTERVAL)",
-            [(user_id, crop_type, crop_time) for _ in range(amount)],
+        await self.db.execute(
+            "INSERT INTO farm_plots (user_id, crop_type, planted_at, grow_time, count) VALUES ($1, $2, NOW(), $3::TEXT::INTERVAL, $4)",
+            user_id,
+            crop_type,
+            crop_time,
+            amount,
         )
 
         await self.update_lb(user_id, "crops_planted", amount)
 
-    async def fetch_ready_crops(self, user_id: int) -> list[dict[str, Any]]:
-        return await self.db.fetch(
-            "SELECT COUNT(crop_type) count, crop_type FROM farm_plots WHERE user_id = $1 AND NOW() > planted_at + grow_time GROUP BY crop_type ORDER BY count DESC",
-            user_id,
-        )
+    async def harvest_ready_crops(self, user_id: int) -> list[dict[str, Any]]:
+        """Deletes a user's ready farm plots, returning how many of each crop type were ready"""
 
-    async def delete_ready_crops(self, user_id: int) -> None:
-        await self.db.execute(
-            "DELETE FROM farm_plots WHERE user_id = $1 AND NOW() > planted_at + grow_time",
+        return await self.db.fetch(
+            "WITH harvested AS (DELETE FROM farm_plots WHERE user_id = $1 AND NOW() > planted_at + grow_time RETURNING crop_type, count) SELECT crop_type, SUM(count)::BIGINT AS count FROM harvested GROUP BY crop_type ORDER BY count DESC",
             user_id,
         )
 
@@ -823,7 +1133,7 @@ class Database(commands.Cog):
 
     async def add_to_trashcan(self, user_id: int, item: str, value: float, amount: int) -> None:
         await self.db.execute(
-            "INSERT INTO trash_can (user_id, item, value, amount) VALUES ($1, $2, $3, $4)",
+            ADD_TO_TRASHCAN_QUERY,
             user_id,
             item,
             value,
@@ -832,16 +1142,15 @@ class Database(commands.Cog):
 
     async def fetch_trashcan(self, user_id: int) -> list[dict[str, Any]]:
         return await self.db.fetch(
-            "SELECT item, value, SUM(amount) AS amount FROM trash_can WHERE user_id = $1 GROUP BY item, value",
+            "SELECT item, value, amount FROM trash_can WHERE user_id = $1",
             user_id,
         )
 
     async def empty_trashcan(self, user_id: int) -> tuple[float, int]:
         trashcan = await self.db.fetchrow(
-            "SELECT COALESCE(SUM(value * amount), 0) AS total_value, COALESCE(SUM(amount), 0) AS amount FROM trash_can WHERE user_id = $1",
+            "WITH emptied AS (DELETE FROM trash_can WHERE user_id = $1 RETURNING value, amount) SELECT COALESCE(SUM(value * amount), 0) AS total_value, COALESCE(SUM(amount), 0) AS amount FROM emptied",
             user_id,
         )
-        await self.db.execute("DELETE FROM trash_can WHERE user_id = $1", user_id)
         return (float(trashcan["total_value"]), int(trashcan["amount"]))
 
     async def add_guild_join(self, guild: discord.Guild):
@@ -882,14 +1191,14 @@ class Database(commands.Cog):
         guild_ids = [g.id for g in self.bot.guilds]
 
         return await self.db.fetch(
-            "SELECT guild_id AS id, COUNT(user_id) AS count FROM (SELECT DISTINCT guild_id, user_id FROM command_executions WHERE guild_id = ANY($1::BIGINT[]) AND ((NOW() - at) < INTERVAL '7 DAYS')) iq GROUP BY guild_id ORDER BY count DESC LIMIT 10",
+            "SELECT guild_id AS id, COUNT(user_id) AS count FROM (SELECT DISTINCT guild_id, user_id FROM command_executions WHERE guild_id = ANY($1::BIGINT[]) AND at > NOW() - INTERVAL '7 DAYS') iq GROUP BY guild_id ORDER BY count DESC LIMIT 10",
             guild_ids,
         )
 
     async def fetch_guilds_commands_count_over_30d(self) -> list[dict[str, Any]]:
         guild_ids = [g.id for g in self.bot.guilds]
         return await self.db.fetch(
-            "SELECT guild_id AS id, COUNT(*) AS count FROM command_executions WHERE guild_id = ANY($1::BIGINT[]) AND ((NOW() - at) < INTERVAL '30 DAYS') GROUP BY guild_id ORDER BY count DESC LIMIT 10",
+            "SELECT guild_id AS id, COUNT(*) AS count FROM command_executions WHERE guild_id = ANY($1::BIGINT[]) AND at > NOW() - INTERVAL '30 DAYS' GROUP BY guild_id ORDER BY count DESC LIMIT 10",
             guild_ids,
         )
 
@@ -1002,22 +1311,9 @@ class Database(commands.Cog):
         value: int | float,
         mode: typing.Literal["add", "set"] = "add",
     ) -> UserQuest:
-        sql_value: str
-        if mode == "add":
-            sql_value = f"daily_quests.{key} + $1"
-        else:
-            sql_value = "$1"
-
         await self.fetch_user_daily_quest(user_id)
 
-        db_quest = await self.db.fetchrow(
-            (
-                f"UPDATE daily_quests SET {key} = {sql_value} WHERE daily_quests.user_id = $2 "
-                f"RETURNING *"
-            ),
-            value,
-            user_id,
-        )
+        db_quest = await self.db.fetchrow(update_daily_quest_query(key, mode), value, user_id)
 
         return {
             "key": db_quest["key"],
@@ -1038,6 +1334,16 @@ class Database(commands.Cog):
             key,
         )
 
+    def tx_mark_daily_quest_as_done(self, tx: Transaction, user_id: int, key: str) -> None:
+        """Rolls the transaction back if the quest was already done"""
+
+        tx.fetchval(
+            "UPDATE daily_quests SET done = true WHERE user_id = $1 AND key = $2 AND NOT done RETURNING done",
+            user_id,
+            key,
+            required=True,
+        )
+
     async def mark_daily_quest_as_notified(self, user_id: int, key: str) -> None:
         await self.db.execute(
             "UPDATE daily_quests SET notified = true WHERE user_id = $1 AND key = $2",
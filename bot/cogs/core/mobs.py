@@ -103,6 +103,9 @@ class MobSpawner(commands.Cog):
         if ctx.guild is None:  # ignore dms
             return
 
+        # this runs in its own task, so it needs its own snapshots of the users involved
+        self.db.begin_user_snapshots()
+
         # The difficulty of the mob spawned is based off who triggered the action, rather
         # than the person who actually engages the mob
         ctx_user_pickaxe_lvl = len(self.d.mining.pickaxes) - self.d.mining.pickaxes.index(
@@ -332,6 +335,9 @@ class MobSpawner(commands.Cog):
 
             await ctx.send(embed=embed)
 
+            # the fight can take a while, so the user is loaded again for the outcome
+            self.db.begin_user_snapshots()
+
             db_user = await self.db.fetch_user(user.id)
             user_bal = db_user.emeralds
 
@@ -10,12 +10,14 @@ import discord
 from discord.ext import commands
 
 from bot.utils.ctx import CustomContext
+from bot.utils.database_proxy import TransactionAborted
 from bot.utils.misc import emojify_item, get_user_and_lang_from_loc, make_progress_bar
 from bot.villager_bot import VillagerBotCluster
 from common.models.data import Quest
 from common.models.db.quests import UserQuest as DbUserQuest
 
 if typing.TYPE_CHECKING:
+    from bot.cogs.core.badges import Badges
     from bot.cogs.core.database import Database
 
 
@@ -101,6 +103,10 @@ class Quests(commands.Cog):
     def db(self) -> "Database":
         return typing.cast("Database", self.bot.get_cog("Database"))
 
+    @property
+    def badges(self) -> "Badges":
+        return typing.cast("Badges", self.bot.get_cog("Badges"))
+
     def get_quest_embed(
         self, loc: CustomContext | commands.Context | discord.User, quest: UserQuest
     ):
@@ -249,19 +255,31 @@ class Quests(commands.Cog):
             if quest.done:
                 return
 
-            await self.db.mark_daily_quest_as_done(user_id, quest.key)
+            # marking the quest as done and rewarding it happen atomically, so it can't be
+            # rewarded twice
+            tx = self.db.transaction()
+            self.db.tx_mark_daily_quest_as_done(tx, user_id, quest.key)
+            badge_stats = self.db.tx_fetch_badge_stats(tx, user_id)
 
             if quest.reward_item == "emerald":
-                await self.db.balance_add(user_id, quest.reward_amount)
+                self.db.tx_balance_add(tx, user_id, quest.reward_amount)
             elif quest.reward_item == "Barrel":
-                await self.db.add_item(user_id, "Barrel", 1024, quest.reward_amount)
+                self.db.tx_add_item(tx, user_id, "Barrel", 1024, quest.reward_amount)
             else:
                 raise NotImplementedError(
                     f"Couldn't reward item {quest.reward_item} to user {user_id}"
                 )
 
-            await self.db.update_lb(user_id, "daily_quests", 1)
-            await self.db.update_lb(user_id, "week_daily_quests", 1)
+            self.db.tx_update_lb(tx, user_id, "daily_quests", 1)
+            self.db.tx_update_lb(tx, user_id, "week_daily_quests", 1)
+            new_badge_stats = self.db.tx_fetch_badge_stats(tx, user_id)
+
+            try:
+                await tx.run()
+            except TransactionAborted:
+                return
+
+            await self.badges.on_stats_changed(user_id, badge_stats.value, new_badge_stats.value)
 
         await asyncio.sleep(1.0 + random.randint(0, 2))
 
@@ -0,0 +1,9 @@
+from typing import Literal
+
+from pydantic import BaseModel
+
+
+class CommandGate(BaseModel):
+    can_run: bool
+    reason: Literal["cooldown", "concurrency", "econ_paused"] | None
+    remaining: float | None
@@ -2,6 +2,7 @@ import discord
 from discord.ext.commands import Context
 
 from bot.models.translation import Translation
+from bot.utils.user_snapshot import UserSnapshots
 
 
 class CustomContext(Context):
@@ -11,11 +12,13 @@ class CustomContext(Context):
     l: Translation  # the translation of the bot text for the current context  # noqa: E741
     failure_reason: str | None  # failure reason used in some command error handling
     custom_error: Exception | None
+    user_snapshots: UserSnapshots | None  # snapshots of the users read by an econ command
 
     def __init__(self, *args, embed_color: discord.Color = None, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.embed_color = embed_color
+        self.user_snapshots = None
 
     async def send_embed(self, message: str, *, ignore_exceptions: bool = False) -> None:
         await self.bot.send_embed(self, message, ignore_exceptions=ignore_exceptions)
@@ -1,27 +1,225 @@
-from typing import Any
+from __future__ import annotations
 
-from bot.utils.karen_client import KarenClient
+from typing import Any, AsyncIterator, Iterable
+
+from bot.utils.karen_client import KarenClient, KarenResponseError
+from bot.utils.user_snapshot import current_user_snapshots
+from common.coms.errors import UnknownQueryError
+from common.coms.query_result import QueryResult, Row
+
+
+def is_unknown_query_error(e: KarenResponseError) -> bool:
+    return str(e.packet.data).startswith(UnknownQueryError.__name__)
 
 
 class DatabaseProxy:
     """Provides an API similar to that of an asyncpg.Pool but proxies calls through Karen"""
 
-    __slots__ = ("karen",)
+    __slots__ = ("karen", "_query_ids")
 
     def __init__(self, karen: KarenClient):
         self.karen = karen
 
+        # queries registered with Karen, which are sent as their id rather than their text
+        self._query_ids = dict[str, int]()
+
+    async def register_queries(self, queries: Iterable[str]) -> None:
+        """Registers queries with Karen, which prepares them on each of its connections, after this
+        only their id is sent when they're used"""
+
+        queries = list(dict.fromkeys([*self._query_ids, *queries]))
+        self._query_ids = dict(zip(queries, await self.karen.db_register_queries(queries)))
+
+    async def _registered_query(self, method: str, query: str, args: list[Any]) -> Any:
+        try:
+            return await self.karen.db_registered_query(self._query_ids[query], method, args)
+        except KarenResponseError as e:
+            # Karen forgets the registered queries when it restarts, so they're registered again
+            if not is_unknown_query_error(e):
+                raise
+
+        await self.register_queries(())
+
+        return await self.karen.db_registered_query(self._query_ids[query], method, args)
+
+    def transaction(self) -> Transaction:
+        """Creates a builder for statements which Karen runs atomically in one round trip"""
+
+        return Transaction(self)
+
     async def execute(self, query: str, *args: Any) -> None:
-        await self.karen.db_exec(query, *args)
+        if query in self._query_ids:
+            await self._registered_query("execute", query, list(args))
+        else:
+            await self.karen.db_exec(query, *args)
 
     async def executemany(self, query: str, args: list[list[Any]]) -> None:
-        await self.karen.db_exec_many(query, args)
+        if query in self._query_ids:
+            await self._registered_query("executemany", query, args)
+        else:
+            await self.karen.db_exec_many(query, args)
 
     async def fetchval(self, query: str, *args: Any) -> Any:
+        if query in self._query_ids:
+            return await self._registered_query("fetchval", query, list(args))
+
         return await self.karen.db_fetch_val(query, *args)
 
     async def fetchrow(self, query: str, *args: Any) -> dict[str, Any] | None:
+        if query in self._query_ids:
+            return await self._registered_query("fetchrow", query, list(args))
+
         return await self.karen.db_fetch_row(query, *args)
 
-    async def fetch(self, query: str, *args: Any) -> list[dict[str, Any]]:
+    async def fetch(self, query: str, *args: Any) -> QueryResult:
+        if query in self._query_ids:
+            return QueryResult.decode(await self._registered_query("fetch", query, list(args)))
+
         return await self.karen.db_fetch_all(query, *args)
+
+    async def cursor(self, query: str, *args: Any) -> AsyncIterator[Row]:
+        """Iterates over the rows of a query's result, which Karen streams in chunks"""
+
+        async for chunk in self.karen.db_cursor(query, *args):
+            for row in chunk:
+                yield row
+
+
+class TransactionAborted(Exception):
+    """Raised when a transaction was rolled back because a required statement returned nothing"""
+
+    def __init__(self, statement: StatementResult):
+        super().__init__(f"Statement {statement.index} of the transaction returned nothing")
+        self.statement = statement
+
+
+class StatementResult:
+    """The result of a statement in a transaction, it can be passed as an argument to statements
+    added after it and its value is available once the transaction has run"""
+
+    __slots__ = ("transaction", "index", "column")
+
+    def __init__(self, transaction: Transaction, index: int, column: str | None = None):
+        self.transaction = transaction
+        self.index = index
+        self.column = column
+
+    def __getitem__(self, column: str) -> StatementResult:
+        """References a column of the row returned by the statement"""
+
+        return StatementResult(self.transaction, self.index, column)
+
+    @property
+    def value(self) -> Any:
+        if self.transaction.results is None:
+            raise RuntimeError("The transaction hasn't been run yet")
+
+        result = self.transaction.results[self.index]
+
+        return result if self.column is None else result[self.column]
+
+
+class Transaction:
+    """Collects statements which Karen runs in order inside a single database transaction"""
+
+    __slots__ = ("db", "results", "_statements")
+
+    def __init__(self, db: DatabaseProxy):
+        self.db = db
+        self.results: list[Any] | None = None
+
+        # (method, query, args, required)
+        self._statements = list[tuple[str, str, list[Any], bool]]()
+
+    def _add(self, method: str, query: str, args: list[Any], required: bool) -> StatementResult:
+        if self.results is not None:
+            raise RuntimeError("The transaction has already been run")
+
+        self._statements.append((method, query, args, required))
+
+        return StatementResult(self, len(self._statements) - 1)
+
+    def execute(self, query: str, *args: Any) -> None:
+        self._add("execute", query, list(args), False)
+
+    def executemany(self, query: str, args: list[list[Any]]) -> None:
+        self._add("executemany", query, args, False)
+
+    def fetchval(self, query: str, *args: Any, required: bool = False) -> StatementResult:
+        """Adds a statement whose first value is returned, if required is True the transaction is
+        rolled back when the statement returns no rows"""
+
+        return self._add("fetchval", query, list(args), required)
+
+    def fetchrow(self, query: str, *args: Any, required: bool = False) -> StatementResult:
+        return self._add("fetchrow", query, list(args), required)
+
+    def fetch(self, query: str, *args: Any, required: bool = False) -> StatementResult:
+        return self._add("fetch", query, list(args), required)
+
+    def _encode_statements(self) -> list[dict[str, Any]]:
+        statements = list[dict[str, Any]]()
+
+        for method, query, args, required in self._statements:
+            args = list(args)
+            refs = list[tuple[int, int, str | None]]()
+
+            # results of earlier statements are filled in by Karen
+            for i, arg in enumerate(args):
+                if isinstance(arg, StatementResult):
+                    if arg.transaction is not self or arg.index >= len(statements):
+                        raise ValueError("Only results of earlier statements can be referenced")
+
+                    refs.append((i, arg.index, arg.column))
+                    args[i] = None
+
+            statement = {"method": method, "args": args, "refs": refs, "required": required}
+
+            if (query_id := self.db._query_ids.get(query)) is not None:
+                statement["query_id"] = query_id
+            else:
+                statement["query"] = query
+
+            statements.append(statement)
+
+        return statements
+
+    async def run(self) -> list[Any]:
+        """Runs the transaction, returning the result of each statement, raises TransactionAborted
+        if a required statement returned nothing"""
+
+        if not self._statements:
+            self.results = []
+            return self.results
+
+        try:
+            response = await self.db.karen.db_transaction(self._encode_statements())
+        except KarenResponseError as e:
+            # Karen forgets the registered queries when it restarts, as the transaction was rolled
+            # back it can safely be sent again
+            if not is_unknown_query_error(e):
+                raise
+
+            await self.db.register_queries(())
+            response = await self.db.karen.db_transaction(self._encode_statements())
+
+        if response["aborted_at"] is not None:
+            raise TransactionAborted(StatementResult(self, response["aborted_at"]))
+
+        # user snapshots can't follow what the transaction changed, so they're loaded again
+        if snapshots := current_user_snapshots.get():
+            snapshots.clear()
+
+        self.results = [
+            QueryResult.decode(result) if method == "fetch" else result
+            for (method, *_), result in zip(self._statements, response["results"])
+        ]
+
+        return self.results
+
+    async def __aenter__(self) -> Transaction:
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.run()
@@ -1,15 +1,18 @@
 import logging
 import time
-from typing import Any
+from typing import Any, AsyncIterator
 
 import discord
 
 from bot.models.karen.cluster_info import ClusterInfo
+from bot.models.karen.command_gate import CommandGate
 from bot.models.karen.cooldown import Cooldown
 from common.coms.client import Client
 from common.coms.packet import T_PACKET_DATA, Packet
 from common.coms.packet_handling import PacketHandler
 from common.coms.packet_type import PacketType
+from common.coms.query_result import QueryResult
+from common.models.coms_metrics import ComsMetrics
 from common.models.secrets import KarenSecrets
 from common.models.system_stats import SystemStats
 from common.utils.validate_return_type import validate_return_type
@@ -40,6 +43,8 @@ class KarenClient:
             self.secrets.port,
             self.packet_handlers,
             self.logger,
+            self.secrets.batch_window_us,
+            unix_socket=self.secrets.unix_socket,
         )
         await self._client.connect(self.secrets.auth)
 
@@ -49,6 +54,11 @@ class KarenClient:
 
         self.logger.info("Disconnected from Karen")
 
+    def coms_metrics(self, identifier: str) -> ComsMetrics:
+        """Returns the metrics recorded by this cluster's connection to Karen"""
+
+        return self._client.metrics.snapshot(identifier)
+
     async def _send(self, packet_type: PacketType, **kwargs: T_PACKET_DATA) -> T_PACKET_DATA:
         resp = await self._client.send(packet_type, kwargs)
 
@@ -57,6 +67,9 @@ class KarenClient:
 
         return resp.data
 
+    async def _notify(self, packet_type: PacketType, **kwargs: T_PACKET_DATA) -> None:
+        await self._client.notify(packet_type, kwargs)
+
     async def _broadcast(
         self,
         packet_type: PacketType,
@@ -69,6 +82,9 @@ class KarenClient:
 
         return resp.data
 
+    async def _broadcast_notify(self, packet_type: PacketType, **kwargs: T_PACKET_DATA) -> None:
+        await self._client.broadcast_notify(packet_type, kwargs)
+
     async def _broadcast_aggregate(
         self,
         packet_type: PacketType,
@@ -98,7 +114,7 @@ class KarenClient:
 
     @validate_return_type
     async def cooldown_add(self, command: str, user_id: int) -> None:
-        await self._send(PacketType.COOLDOWN_ADD, command=command, user_id=user_id)
+        await self._notify(PacketType.COOLDOWN_ADD, command=command, user_id=user_id)
 
     @validate_return_type
     async def cooldown_reset(self, command: str, user_id: int) -> None:
@@ -136,11 +152,11 @@ class KarenClient:
 
     @validate_return_type
     async def release_concurrency(self, command: str, user_id: int) -> None:
-        await self._send(PacketType.CONCURRENCY_RELEASE, command=command, user_id=user_id)
+        await self._notify(PacketType.CONCURRENCY_RELEASE, command=command, user_id=user_id)
 
     @validate_return_type
     async def lb_command_ran(self, user_id: int) -> None:
-        await self._send(PacketType.LB_COMMAND_RAN, user_id=user_id)
+        await self._notify(PacketType.LB_COMMAND_RAN, user_id=user_id)
 
     @validate_return_type
     async def check_econ_paused(self, user_id: int) -> bool:
@@ -164,7 +180,7 @@ class KarenClient:
 
     @validate_return_type
     async def add_active_fx(self, user_id: int, fx: str, duration: float) -> None:
-        await self._send(PacketType.ACTIVE_FX_ADD, user_id=user_id, fx=fx, duration=duration)
+        await self._notify(PacketType.ACTIVE_FX_ADD, user_id=user_id, fx=fx, duration=duration)
 
     @validate_return_type
     async def remove_active_fx(self, user_id: int, fx: str, duration: float) -> None:
@@ -174,6 +190,20 @@ class KarenClient:
     async def clear_active_fx(self, user_id: int) -> None:
         await self._send(PacketType.ACTIVE_FX_CLEAR, user_id=user_id)
 
+    @validate_return_type
+    async def fetch_leaderboard(
+        self,
+        lb: str,
+        user_id: int,
+        user_ids: list[int] | None = None,
+    ) -> list[dict[str, Any]] | None:
+        return await self._send(
+            PacketType.FETCH_LEADERBOARD,
+            lb=lb,
+            user_id=user_id,
+            user_ids=user_ids,
+        )
+
     @validate_return_type
     async def db_exec(self, query: str, *args: Any) -> None:
         await self._send(PacketType.DB_EXEC, query=query, args=args)
@@ -191,8 +221,34 @@ class KarenClient:
         return await self._send(PacketType.DB_FETCH_ROW, query=query, args=args)
 
     @validate_return_type
-    async def db_fetch_all(self, query: str, *args: Any) -> list[dict[str, Any]]:
-        return await self._send(PacketType.DB_FETCH_ALL, query=query, args=args)
+    async def db_fetch_all(self, query: str, *args: Any) -> QueryResult:
+        return QueryResult.decode(
+            await self._send(PacketType.DB_FETCH_ALL, query=query, args=args),
+        )
+
+    @validate_return_type
+    async def db_register_queries(self, queries: list[str]) -> list[int]:
+        return await self._send(PacketType.DB_REGISTER_QUERIES, queries=queries)
+
+    @validate_return_type
+    async def db_registered_query(self, query_id: int, method: str, args: list[Any]) -> Any:
+        return await self._send(
+            PacketType.DB_REGISTERED_QUERY,
+            query_id=query_id,
+            method=method,
+            args=args,
+        )
+
+    @validate_return_type
+    async def db_transaction(self, statements: list[dict[str, Any]]) -> dict[str, Any]:
+        return await self._send(PacketType.DB_TRANSACTION, statements=statements)
+
+    async def db_cursor(self, query: str, *args: Any) -> AsyncIterator[QueryResult]:
+        async for resp in self._client.stream(PacketType.DB_CURSOR, {"query": query, "args": args}):
+            if resp.error:
+                raise KarenResponseError(resp)
+
+            yield QueryResult.decode(resp.data)
 
     @validate_return_type
     async def get_user_name(self, user_id: int) -> str | None:
@@ -226,11 +282,11 @@ class KarenClient:
 
     @validate_return_type
     async def botban_cache_add(self, user_id: int) -> None:
-        await self._broadcast(PacketType.BOTBAN_CACHE_ADD, user_id=user_id)
+        await self._broadcast_notify(PacketType.BOTBAN_CACHE_ADD, user_id=user_id)
 
     @validate_return_type
     async def botban_cache_remove(self, user_id: int) -> None:
-        await self._broadcast(PacketType.BOTBAN_CACHE_REMOVE, user_id=user_id)
+        await self._broadcast_notify(PacketType.BOTBAN_CACHE_REMOVE, user_id=user_id)
 
     @validate_return_type
     async def lookup_user(self, user_id: int) -> list[list[int | str]]:
@@ -254,6 +310,14 @@ class KarenClient:
     async def fetch_karen_system_stats(self) -> SystemStats:
         return SystemStats(**await self._send(PacketType.FETCH_SYSTEM_STATS))
 
+    @validate_return_type
+    async def fetch_karen_coms_metrics(self) -> ComsMetrics:
+        return ComsMetrics(**await self._send(PacketType.FETCH_COMS_METRICS))
+
+    @validate_return_type
+    async def fetch_clusters_coms_metrics(self) -> list[ComsMetrics]:
+        return [ComsMetrics(**r) for r in await self._broadcast(PacketType.FETCH_COMS_METRICS)]
+
     @validate_return_type
     async def shutdown(self) -> None:
         await self._send(PacketType.SHUTDOWN)
@@ -278,10 +342,28 @@ class KarenClient:
         command: str,
         is_slash: bool,
     ) -> None:
-        await self._send(
+        await self._notify(
             PacketType.COMMAND_EXECUTION,
             user_id=user_id,
             guild_id=guild_id,
             command=command,
             is_slash=is_slash,
         )
+
+    @validate_return_type
+    async def command_gate(
+        self,
+        command: str,
+        user_id: int,
+        guild_id: int | None,
+        econ: bool,
+    ) -> CommandGate:
+        return CommandGate(
+            **await self._send(
+                PacketType.COMMAND_GATE,
+                command=command,
+                user_id=user_id,
+                guild_id=guild_id,
+                econ=econ,
+            ),
+        )
@@ -4,10 +4,10 @@ import math
 import mimetypes
 import re
 import time
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
 from contextlib import suppress
 from datetime import timedelta
-from typing import Any, Generator, Literal
+from typing import Any, Generator, Generic, Hashable, Literal, TypeVar
 
 import aiohttp
 import discord
@@ -16,8 +16,6 @@ from discord.ext import commands
 from bot.models.translation import Translation
 from bot.utils.ctx import CustomContext
 from common.models.data import Data, Emojis
-from common.models.db.item import Item
-from common.models.db.user import User
 from common.utils.code import format_exception
 
 
@@ -203,14 +201,6 @@ async def craft_lbs(
     )
 
 
-def calc_total_wealth(db_user: User, items: list[Item]):
-    return (
-        db_user.emeralds
-        + db_user.vault_balance * 9
-        + sum([u_it.sell_price * u_it.amount for u_it in items if u_it.sell_price > 0])
-    )
-
-
 def emojify_item(d, item: str, default: Any = SENTINEL) -> str | Any:
     try:
         emoji_key = d.emoji_items[item]
@@ -293,6 +283,43 @@ class TTLPreventDuplicate:
                 del self.store[k]
 
 
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class TTLCache(Generic[K, V]):
+    """A cache whose entries expire after a while, when it's full the least recently stored entries
+    are evicted"""
+
+    def __init__(self, expire_after: float, max_size: int):
+        self.expire_after = expire_after
+        self.max_size = max_size
+
+        self.store = OrderedDict[K, tuple[float, V]]()  # key: (stored_at, value)
+
+    def get(self, key: K) -> V | None:
+        entry = self.store.get(key)
+
+        if entry is None:
+            return None
+
+        if time.monotonic() - entry[0] > self.expire_after:
+            del self.store[key]
+            return None
+
+        return entry[1]
+
+    def put(self, key: K, value: V) -> None:
+        self.store[key] = (time.monotonic(), value)
+        self.store.move_to_end(key)
+
+        while len(self.store) > self.max_size:
+            self.store.popitem(last=False)
+
+    def pop(self, key: K) -> None:
+        self.store.pop(key, None)
+
+
 def fix_giphy_url(url: str) -> str:
     return f"https://i.giphy.com/media/{url.split('-')[-1]}/giphy.gif"
 
@@ -0,0 +1,127 @@
+import asyncio
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable
+
+from common.models.db.item import Item
+from common.models.db.user import User
+
+
+class UserSnapshot:
+    """A user's row, items and active effects, loaded at once and kept up to date by the Database
+    cog's writes for the rest of a command"""
+
+    __slots__ = ("user", "items", "active_fx")
+
+    def __init__(self, user: User, items: list[Item], active_fx: set[str]):
+        self.user = user
+        self.items = {item.name.lower(): item for item in items}  # lowercase name: item
+        self.active_fx = active_fx
+
+    def update_user(self, columns: dict[str, Any]) -> None:
+        """Sets columns of the user's row, adjusting their net worth like the trigger on the users
+        table does"""
+
+        user = self.user
+        user.net_worth += columns.get("emeralds", user.emeralds) - user.emeralds
+        user.net_worth += (
+            columns.get("vault_balance", user.vault_balance) - user.vault_balance
+        ) * 9
+
+        for column, value in columns.items():
+            setattr(user, column, value)
+
+    def fetch_items(self) -> list[Item]:
+        return [item.copy() for item in self.items.values()]
+
+    def fetch_item(self, name: str) -> Item | None:
+        item = self.items.get(name.lower())
+        return None if item is None else item.copy()
+
+    def add_item(
+        self,
+        name: str,
+        sell_price: int,
+        amount: int,
+        sticky: bool,
+        sellable: bool,
+    ) -> None:
+        """Sets the amount the user has of an item, to what the database returned after adding to
+        it"""
+
+        item = self.items.get(name.lower())
+        prev_amount = 0 if item is None else item.amount
+
+        if item is None:
+            item = self.items[name.lower()] = Item(
+                name=name,
+                sell_price=sell_price,
+                amount=amount,
+                sticky=sticky,
+                sellable=sellable,
+            )
+        else:
+            item.amount = amount
+
+        self.user.net_worth += max(item.sell_price, 0) * (amount - prev_amount)
+
+    def remove_item(self, name: str, amount: int) -> None:
+        item = self.items.get(name.lower())
+
+        if item is None:
+            return
+
+        self.user.net_worth -= max(item.sell_price, 0) * min(item.amount, amount)
+
+        if item.amount <= amount:
+            del self.items[name.lower()]
+        else:
+            item.amount -= amount
+
+
+class UserSnapshots:
+    """The snapshots of the users read during a command, each is only loaded once even when it's
+    first needed by several tasks at the same time"""
+
+    def __init__(self):
+        self._loads = dict[int, asyncio.Future[UserSnapshot]]()
+
+    async def fetch(
+        self,
+        user_id: int,
+        load: Callable[[int], Awaitable[UserSnapshot]],
+    ) -> UserSnapshot:
+        future = self._loads.get(user_id)
+
+        if future is None:
+            future = self._loads[user_id] = asyncio.ensure_future(load(user_id))
+
+        try:
+            return await future
+        except Exception:
+            # a failed load shouldn't stick around for the rest of the command
+            if self._loads.get(user_id) is future:
+                del self._loads[user_id]
+
+            raise
+
+    def loaded(self, user_id: int) -> UserSnapshot | None:
+        """Returns the user's snapshot if it's been loaded, for updating it after a write, a load
+        still in progress might not see the write so it's dropped instead"""
+
+        future = self._loads.get(user_id)
+
+        if future is None:
+            return None
+
+        if not future.done() or future.cancelled() or future.exception():
+            del self._loads[user_id]
+            return None
+
+        return future.result()
+
+    def clear(self) -> None:
+        self._loads.clear()
+
+
+# the snapshots of the current command, None outside of commands which use them
+current_user_snapshots = ContextVar[UserSnapshots | None]("current_user_snapshots", default=None)
@@ -19,6 +19,7 @@ from common.models.system_stats import SystemStats
 from common.models.topgg_vote import TopggVote
 from common.utils.code import execute_code
 from common.utils.font_handler import FontHandler
+from common.utils.misc import chunk_sequence
 from common.utils.setup import load_data, setup_logging
 
 from bot.models.fwd_dm import ForwardedDirectMessage
@@ -270,25 +271,24 @@ class VillagerBotCluster(commands.AutoShardedBot, PacketHandlerRegistry):
             ctx.failure_reason = "disabled"
             return False
 
-        # handle cooldowns that need to be synced between shard groups / processes
-        # (aka karen cooldowns)
-        if command_name in self.d.cooldown_rates:
-            cooldown_info = await self.karen.cooldown(command_name, ctx.author.id)
-
-            if not cooldown_info.can_run:
-                ctx.custom_error = CommandOnKarenCooldown(cooldown_info.remaining)
-                return False
-
-        if command_name in self.d.concurrency_limited and not await self.karen.check_concurrency(
+        # handle cooldowns, concurrency limits and econ pauses that need to be synced between
+        # shard groups / processes (aka karen checks) in a single round trip, Karen also records
+        # the command execution and acquires the concurrency lock if the command can be run
+        gate = await self.karen.command_gate(
             command_name,
             ctx.author.id,
-        ):
-            ctx.custom_error = MaxKarenConcurrencyReached()
-            return False
+            getattr(ctx.guild, "id", None),
+            ctx.command.cog_name == "Econ",
+        )
+
+        if not gate.can_run:
+            if gate.reason == "cooldown":
+                ctx.custom_error = CommandOnKarenCooldown(gate.remaining)
+            elif gate.reason == "concurrency":
+                ctx.custom_error = MaxKarenConcurrencyReached()
+            else:
+                ctx.failure_reason = gate.reason
 
-        # check if user has paused econ
-        if ctx.command.cog_name == "Econ" and await self.karen.check_econ_paused(ctx.author.id):
-            ctx.failure_reason = "econ_paused"
             return False
 
         return True
@@ -304,30 +304,6 @@ class VillagerBotCluster(commands.AutoShardedBot, PacketHandlerRegistry):
             elif random.randint(0, self.d.tip_chance) == 0:  # random chance to send tip
                 asyncio.create_task(self.send_tip(ctx))
 
-        try:
-            if ctx.command.qualified_name in self.d.concurrency_limited:
-                await self.karen.acquire_concurrency(ctx.command.qualified_name, ctx.author.id)
-        except Exception:
-            self.logger.exception(
-                (
-                    "An error occurred while attempting to acquire a concurrency lock for "
-                    "command %s for user %s"
-                ),
-                ctx.command,
-                ctx.author.id,
-            )
-            raise
-
-        if ctx.command.qualified_name in self.d.cooldown_rates:
-            await self.karen.lb_command_ran(ctx.author.id)
-
-        await self.karen.command_execution(
-            ctx.author.id,
-            getattr(ctx.guild, "id", None),
-            ctx.command.qualified_name,
-            False,
-        )
-
     async def after_command_invoked(self, ctx: CustomContext):
         try:
             if ctx.command.qualified_name in self.d.concurrency_limited:
@@ -411,6 +387,12 @@ class VillagerBotCluster(commands.AutoShardedBot, PacketHandlerRegistry):
             self.session_votes,
         ]
 
+    @handle_packet(PacketType.FETCH_COMS_METRICS)
+    async def packet_fetch_coms_metrics(self):
+        return self.karen.coms_metrics(
+            f'Cluster {self.cluster_id} ({",".join(map(str, self.shard_ids))})',
+        )
+
     @handle_packet(PacketType.FETCH_SYSTEM_STATS)
     async def packet_fetch_system_stats(self):
         memory_info = psutil.virtual_memory()
@@ -498,7 +480,10 @@ class VillagerBotCluster(commands.AutoShardedBot, PacketHandlerRegistry):
     @handle_packet(PacketType.FETCH_GUILD_IDS)
     async def packet_fetch_guild_ids(self):
         await self.wait_until_ready()
-        return [g.id for g in self.guilds]
+
+        # streamed in chunks, as large clusters can have a lot of guilds
+        for guilds in chunk_sequence(self.guilds, 5000):
+            yield [g.id for g in guilds]
 
     @handle_packet(PacketType.SHUTDOWN)
     async def packet_shutdown(self):
@@ -0,0 +1,121 @@
+import asyncio
+from typing import Awaitable, Callable, TypeAlias
+
+from common.coms.codec import Codec
+from common.coms.errors import WebsocketStateError
+from common.coms.packet import Packet
+
+# batches are kept well below the 1 MiB message size limit websockets enforces by default, as
+# the length of text frames is counted in characters rather than bytes
+MAX_BATCH_SIZE = 2**19
+
+# an encoded packet and the future which is resolved once it has been sent
+QueuedMessage: TypeAlias = tuple[str | bytes, asyncio.Future[None]]
+
+
+class PacketBatcher:
+    """Coalesces packets sent within the same event loop iteration, or within a configurable
+    window, into a single frame"""
+
+    def __init__(
+        self,
+        send_message: Callable[[str | bytes], Awaitable[None]],
+        codec: Codec,
+        window_us: int | None = 0,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ):
+        self.send_message = send_message
+        self.codec = codec
+        # how long to wait for more packets before flushing in microseconds, 0 means until the
+        # next event loop iteration and None disables batching entirely
+        self.window_us = window_us
+        # packets are split across multiple frames when joining them would exceed this size
+        self.max_batch_size = max_batch_size
+
+        self._queue = list[QueuedMessage]()
+        self._flush_task: asyncio.Task | None = None
+        # keeps frames in order when a flush is split into multiple of them
+        self._send_lock = asyncio.Lock()
+        self._closed = False
+
+    async def send(self, packet: Packet) -> None:
+        await self.send_encoded(self.codec.encode(packet))
+
+    async def send_encoded(self, message: str | bytes) -> None:
+        """Sends a packet which was already encoded with this batcher's codec"""
+
+        if self._closed:
+            raise WebsocketStateError("Websocket connection is not open")
+
+        if self.window_us is None:
+            await self.send_message(message)
+            return
+
+        sent = asyncio.get_running_loop().create_future()
+        self._queue.append((message, sent))
+
+        # the flush task only starts running on the next event loop iteration, so any packets
+        # queued by other tasks until then end up in the same frame
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush())
+
+        await sent
+
+    async def _flush(self) -> None:
+        if self.window_us:
+            await asyncio.sleep(self.window_us / 1_000_000)
+
+        queue = self._queue
+        self._queue = []
+        self._flush_task = None
+
+        async with self._send_lock:
+            for batch in self._split(queue):
+                await self._send_batch(batch)
+
+    def _split(self, queue: list[QueuedMessage]) -> list[list[QueuedMessage]]:
+        batches = list[list[QueuedMessage]]()
+        batch_size = 0
+
+        for item in queue:
+            # a packet which is too big on its own is still sent in a frame by itself
+            if batches and batch_size + len(item[0]) < self.max_batch_size:
+                batches[-1].append(item)
+                batch_size += len(item[0]) + 1
+            else:
+                batches.append([item])
+                batch_size = len(item[0]) + 1
+
+        return batches
+
+    async def _send_batch(self, batch: list[QueuedMessage]) -> None:
+        try:
+            if len(batch) == 1:
+                message = batch[0][0]
+            else:
+                message = self.codec.join_batch([m for m, _ in batch])
+
+            await self.send_message(message)
+        except Exception as e:
+            for _, sent in batch:
+                if not sent.done():
+                    sent.set_exception(e)
+        else:
+            for _, sent in batch:
+                if not sent.done():
+                    sent.set_result(None)
+
+    def close(self) -> None:
+        """Fails any queued packets and prevents new ones from being sent"""
+
+        self._closed = True
+
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+
+        for _, sent in self._queue:
+            if not sent.done():
+                sent.set_exception(WebsocketStateError("Websocket connection was closed"))
+
+        self._queue.clear()
@@ -1,15 +1,43 @@
 import asyncio
+import functools
+import inspect
 import logging
+import time
+from typing import AsyncIterator
 
 from websockets.client import WebSocketClientProtocol, connect
 from websockets.exceptions import ConnectionClosed
 
+from common.coms.batching import PacketBatcher
+from common.coms.codec import CODECS, JSON_CODEC, Codec, negotiate_codec
 from common.coms.coms_base import ComsBase
-from common.coms.errors import InvalidPacketReceived, WebsocketStateError
-from common.coms.json_encoder import special_obj_encode
+from common.coms.errors import (
+    InvalidPacketReceived,
+    RequestTimeoutError,
+    WebsocketStateError,
+)
 from common.coms.packet import T_PACKET_DATA, Packet
 from common.coms.packet_handling import PacketHandler
 from common.coms.packet_type import PacketType
+from common.coms.unix_socket import UnixSocketConnection, connect_unix
+
+# seconds to wait for a response to a request before giving up on it
+DEFAULT_TIMEOUT = 30.0
+
+# packet types which need a different timeout than the default, None means no timeout
+PACKET_TIMEOUTS: dict[PacketType, float | None] = {
+    PacketType.BROADCAST_REQUEST: 60.0,
+    PacketType.DB_EXEC: 60.0,
+    PacketType.DB_EXEC_MANY: 120.0,
+    PacketType.DB_FETCH_VAL: 60.0,
+    PacketType.DB_FETCH_ROW: 60.0,
+    PacketType.DB_FETCH_ALL: 120.0,
+    PacketType.DB_CURSOR: 60.0,  # applies to each chunk
+    PacketType.DB_REGISTERED_QUERY: 120.0,
+    PacketType.DB_TRANSACTION: 120.0,
+    PacketType.EXEC_CODE: None,
+    PacketType.SHUTDOWN: None,
+}
 
 
 class Client(ComsBase):
@@ -19,80 +47,178 @@ class Client(ComsBase):
         port: int,
         packet_handlers: dict[PacketType, PacketHandler],
         logger: logging.Logger,
+        batch_window_us: int | None = 0,
+        timeouts: dict[PacketType, float | None] | None = None,
+        default_timeout: float | None = DEFAULT_TIMEOUT,
+        codecs: list[str] | None = None,
+        unix_socket: str | None = None,
     ):
         super().__init__(host, port, packet_handlers, logger.getChild("client"))
 
-        self.ws: WebSocketClientProtocol | None = None
+        self.ws: WebSocketClientProtocol | UnixSocketConnection | None = None
+        self.codec: Codec = JSON_CODEC
+        self.batch_window_us = batch_window_us
+        self.timeouts = {**PACKET_TIMEOUTS, **(timeouts or {})}
+        self.default_timeout = default_timeout
+        # codecs to offer the server, in order of preference
+        self.codecs = list(CODECS) if codecs is None else codecs
+        # when set, the server is connected to over this unix socket instead of a TCP websocket
+        self.unix_socket = unix_socket
 
         self._current_id = 0
         self._task: asyncio.Task | None = None
         self._closing = False
         self._connected = asyncio.Event()
         self._waiting = dict[str, asyncio.Future[Packet]]()
+        # responses to streamed requests, an exception is queued when the connection is lost
+        self._streams = dict[str, asyncio.Queue[Packet | Exception]]()
+        self._batcher: PacketBatcher | None = None
 
     def _get_packet_id(self) -> str:
         packet_id = self._current_id
         self._current_id += 1
         return f"c{packet_id}"
 
+    def _close_batcher(self) -> None:
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
+
     async def _disconnect(self) -> None:
+        self._close_batcher()
+
         if self.ws is not None:
             await self.ws.close()
             self.ws = None
 
         self._connected.clear()
+        self.codec = JSON_CODEC
+
+    async def _send(self, packet: Packet, packet_type: PacketType | None = None) -> None:
+        """Sends a packet, packet_type is the type of the request when sending a response"""
 
-    async def _send(self, packet: Packet) -> None:
         if self.ws is None or self.ws.closed:
             raise WebsocketStateError("Websocket connection is not open")
 
-        await self.ws.send(packet.json(encoder=special_obj_encode))
+        message = self.codec.encode(packet)
+
+        if (packet_type := packet_type or packet.type) is not None:
+            self.metrics.record_payload(packet_type, len(message))
+
+        if self._batcher is not None:
+            await self._batcher.send_encoded(message)
+        else:
+            await self.ws.send(message)
 
     async def _authorize(self, auth: str) -> None:
-        await self._send(Packet(id=self._get_packet_id(), type=PacketType.AUTH, data=auth))
+        # the AUTH exchange always happens in JSON, the server responds with the codec to use
+        # for the rest of the connection
+        self.codec = JSON_CODEC
+
+        await self._send(
+            Packet(
+                id=self._get_packet_id(),
+                type=PacketType.AUTH,
+                data={"auth": auth, "codecs": self.codecs},
+            ),
+        )
+
+        packet = self._decode(await self.ws.recv())
+
+        if packet.type != PacketType.AUTH or packet.error or not isinstance(packet.data, dict):
+            raise WebsocketStateError("Authorization with Karen failed")
+
+        self.codec = negotiate_codec([packet.data.get("codec")])
+        self._batcher = PacketBatcher(self.ws.send, self.codec, self.batch_window_us)
+
+    def _fail_waiting(self, exception: Exception) -> None:
+        for future in self._waiting.values():
+            if not future.done():
+                future.set_exception(exception)
+
+        self._waiting.clear()
+
+        for stream in self._streams.values():
+            stream.put_nowait(exception)
+
+    def _get_timeout(self, packet_type: PacketType) -> float | None:
+        return self.timeouts.get(packet_type, self.default_timeout)
 
     async def _handle_packet(self, packet: Packet) -> None:
+        if packet.id in self._streams:
+            self._streams[packet.id].put_nowait(packet)
+            return
+
         # handle expected packets
         if packet.id in self._waiting:
-            self._waiting[packet.id].set_result(packet)
+            future = self._waiting.pop(packet.id)
+
+            if not future.done():
+                future.set_result(packet)
+
+            return
+
+        # responses don't have a type, if one isn't expected its request timed out or was cancelled
+        if packet.type is None:
+            self.logger.warning("Received response for expired or unknown request: %s", packet.id)
             return
 
         try:
             response = await self._call_handler(packet)
+
+            if inspect.isasyncgen(response):
+                await self._send_stream(
+                    packet,
+                    response,
+                    functools.partial(self._send, packet_type=packet.type),
+                )
+                return
         except Exception:
             self.logger.exception(
                 "An error ocurred while calling the packet handler for packet type %s",
                 packet.type,
             )
         else:
-            await self._send(Packet(id=packet.id, data=response))
+            if not packet.one_way:
+                await self._send(Packet(id=packet.id, data=response), packet.type)
+
+    def _connections(self) -> AsyncIterator[WebSocketClientProtocol | UnixSocketConnection]:
+        # both yield a new connection each iteration, reconnecting with a backoff
+        if self.unix_socket is not None:
+            return connect_unix(self.unix_socket, self.logger)
+
+        return aiter(connect(f"ws://{self.host}:{self.port}", logger=self.logger))
 
     async def _connect(self, auth: str) -> None:
         self.logger.info("Connecting to Karen...")
 
-        async for self.ws in connect(f"ws://{self.host}:{self.port}", logger=self.logger):
+        async for self.ws in self._connections():
             try:
                 await self._authorize(auth)
                 self._connected.set()
-                self.logger.info("Connected to Karen!")
+                self.logger.info("Connected to Karen! (codec=%s)", self.codec.name)
 
                 async for message in self.ws:
                     try:
-                        packet = self._decode(message)
+                        packets = self._decode_frame(message, self.codec)
                     except InvalidPacketReceived:
                         self.logger.exception("Invalid packet received from server")
                         await self._disconnect()
                         break
 
-                    if packet.type == PacketType.AUTH and packet.error:
-                        raise WebsocketStateError("Authorization with Karen failed")
-
-                    asyncio.create_task(self._handle_packet(packet))
+                    for packet in packets:
+                        asyncio.create_task(self._handle_packet(packet))
             except ConnectionClosed:
                 pass
             except Exception:
                 self.logger.exception("An error occurred in the message handling loop")
             finally:
+                self._connected.clear()
+                self._close_batcher()
+
+                # requests in flight will never receive a response from the server
+                self._fail_waiting(WebsocketStateError("Connection to the server was lost"))
+
                 if self._closing:
                     break
 
@@ -105,12 +231,27 @@ class Client(ComsBase):
     async def close(self) -> None:
         self._closing = True
         await self._disconnect()
+        self._fail_waiting(WebsocketStateError("Client was closed"))
+
+    async def _send_when_connected(self, packet: Packet) -> None:
+        # while reconnecting, wait for the connection to be reestablished instead of failing
+        await self._connected.wait()
+        await self._send(packet)
+
+    async def _send_and_wait(self, packet: Packet, future: asyncio.Future[Packet]) -> Packet:
+        await self._send_when_connected(packet)
+        return await future
 
     async def send(
         self,
         packet_type: PacketType,
         packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
     ) -> Packet:
+        """Sends a request and waits for its response, the timeout defaults to the one configured
+        for the packet type"""
+
         packet_id = self._get_packet_id()
 
         packet = Packet(
@@ -119,16 +260,129 @@ class Client(ComsBase):
             data=({} if packet_data is None else packet_data),
         )
 
-        self._waiting[packet.id] = asyncio.Future[Packet]()
-        await self._send(packet)
-        return await self._waiting[packet.id]
+        if timeout is None:
+            timeout = self._get_timeout(packet_type)
+
+        future = self._waiting[packet.id] = asyncio.get_running_loop().create_future()
+
+        start = time.perf_counter()
+        error = True
+
+        try:
+            response = await asyncio.wait_for(self._send_and_wait(packet, future), timeout)
+            error = response.error
+            return response
+        except asyncio.TimeoutError:
+            raise RequestTimeoutError(
+                f"No response received for packet {packet_id} ({packet_type.name}) within "
+                f"{timeout} seconds",
+            )
+        finally:
+            # also cleans up after timed out and cancelled requests
+            self._waiting.pop(packet.id, None)
+            self.metrics.record_round_trip(packet_type, time.perf_counter() - start, error)
+
+    async def stream(
+        self,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> AsyncIterator[Packet]:
+        """Sends a request to a streaming packet handler and yields a packet for each chunk of the
+        response as it arrives, or a single error packet. The timeout applies to each chunk"""
+
+        packet = Packet(
+            id=self._get_packet_id(),
+            type=packet_type,
+            data=({} if packet_data is None else packet_data),
+        )
+
+        if timeout is None:
+            timeout = self._get_timeout(packet_type)
+
+        stream = self._streams[packet.id] = asyncio.Queue[Packet | Exception]()
+
+        try:
+            try:
+                await asyncio.wait_for(self._send_when_connected(packet), timeout)
+            except asyncio.TimeoutError:
+                raise RequestTimeoutError(
+                    f"Could not send packet {packet.id} ({packet_type.name}) within {timeout} "
+                    "seconds",
+                )
+
+            while True:
+                try:
+                    response = await asyncio.wait_for(stream.get(), timeout)
+                except asyncio.TimeoutError:
+                    raise RequestTimeoutError(
+                        f"No chunk received for packet {packet.id} ({packet_type.name}) within "
+                        f"{timeout} seconds",
+                    )
+
+                if isinstance(response, Exception):
+                    raise response
+
+                if response.error:
+                    yield response
+                    return
+
+                if response.data["done"]:
+                    return
+
+                yield Packet(id=response.id, data=response.data["chunk"])
+        finally:
+            self._streams.pop(packet.id, None)
+
+    async def notify(
+        self,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> None:
+        """Sends a one-way packet, the server won't send a response and errors are only logged on
+        the server's side"""
+
+        packet = Packet(
+            id=self._get_packet_id(),
+            type=packet_type,
+            data=({} if packet_data is None else packet_data),
+            one_way=True,
+        )
+
+        if timeout is None:
+            timeout = self._get_timeout(packet_type)
+
+        try:
+            await asyncio.wait_for(self._send_when_connected(packet), timeout)
+        except asyncio.TimeoutError:
+            raise RequestTimeoutError(
+                f"Could not send packet {packet.id} ({packet_type.name}) within {timeout} seconds",
+            )
 
     async def broadcast(
         self,
         packet_type: PacketType,
         packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
     ) -> Packet:
         return await self.send(
             PacketType.BROADCAST_REQUEST,
             {"type": packet_type, "data": ({} if packet_data is None else packet_data)},
+            timeout=timeout,
+        )
+
+    async def broadcast_notify(
+        self,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+    ) -> None:
+        """Broadcasts a one-way packet to all connected clients without waiting for responses"""
+
+        await self.notify(
+            PacketType.BROADCAST_REQUEST,
+            {"type": packet_type, "data": ({} if packet_data is None else packet_data)},
         )
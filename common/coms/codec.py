@@ -0,0 +1,214 @@
+import datetime
+import json
+from typing import Any
+
+import arrow
+import msgpack
+import pydantic.json
+from pydantic import ValidationError
+
+from common.coms.errors import InvalidPacketReceived
+from common.coms.json_encoder import special_obj_decode, special_obj_encode
+from common.coms.packet import Packet
+
+# msgpack extension type codes
+EXT_SET = 1
+EXT_ARROW = 2
+EXT_DATETIME = 3
+EXT_TIMEDELTA = 4
+
+
+class Codec:
+    """Base class for the wire formats packets can be serialized with"""
+
+    name: str
+
+    def encode(self, packet: Packet) -> str | bytes:
+        raise NotImplementedError
+
+    def decode(self, message: str | bytes) -> Packet:
+        raise NotImplementedError
+
+    def join_batch(self, messages: list[str | bytes]) -> str | bytes:
+        """Combines already encoded packets into a single batched frame"""
+
+        raise NotImplementedError
+
+    def encode_batch(self, packets: list[Packet]) -> str | bytes:
+        return self.join_batch([self.encode(p) for p in packets])
+
+    def decode_frame(self, message: str | bytes) -> list[Packet]:
+        """Decodes a frame which is either a single packet or a batch of packets"""
+
+        raise NotImplementedError
+
+    @staticmethod
+    def _construct(data: dict[str, Any]) -> Packet:
+        try:
+            return Packet(**data)
+        except (ValidationError, ValueError, TypeError) as e:
+            raise InvalidPacketReceived("Could not construct Packet model", e)
+
+
+class JsonCodec(Codec):
+    """Encodes packets as JSON objects, used for the AUTH exchange and as a fallback"""
+
+    name = "json"
+
+    def encode(self, packet: Packet) -> str:
+        return packet.json(encoder=special_obj_encode)
+
+    def _loads(self, message: str | bytes) -> Any:
+        try:
+            return json.loads(message, object_hook=special_obj_decode)
+        except json.JSONDecodeError as e:
+            raise InvalidPacketReceived("Packet was not a valid JSON object", e)
+
+    def _from_object(self, data: Any) -> Packet:
+        if not isinstance(data, dict):
+            raise InvalidPacketReceived(
+                f"Packet was expected to be of type 'dict', got '{type(data).__name__}' instead",
+            )
+
+        return self._construct(data)
+
+    def decode(self, message: str | bytes) -> Packet:
+        return self._from_object(self._loads(message))
+
+    def join_batch(self, messages: list[str | bytes]) -> str:
+        # batches are sent as a JSON array of packet objects
+        return "[" + ",".join(messages) + "]"
+
+    def decode_frame(self, message: str | bytes) -> list[Packet]:
+        data = self._loads(message)
+
+        if isinstance(data, list):
+            return [self._from_object(d) for d in data]
+
+        return [self._from_object(data)]
+
+
+class MsgpackCodec(Codec):
+    """Encodes packets as msgpack arrays of [id, type, data, error, one_way], with extension types
+    for the values JSON needs object hooks for"""
+
+    name = "msgpack"
+
+    def __init__(self):
+        self._packer = msgpack.Packer()
+
+    def _default(self, obj: object) -> Any:
+        if isinstance(obj, set):
+            return msgpack.ExtType(EXT_SET, self._pack(list(obj)))
+
+        if isinstance(obj, arrow.Arrow):
+            return msgpack.ExtType(EXT_ARROW, obj.isoformat().encode())
+
+        if isinstance(obj, datetime.datetime):
+            return msgpack.ExtType(EXT_DATETIME, obj.isoformat().encode())
+
+        if isinstance(obj, datetime.timedelta):
+            return msgpack.ExtType(
+                EXT_TIMEDELTA,
+                self._pack([obj.days, obj.seconds, obj.microseconds]),
+            )
+
+        if isinstance(obj, pydantic.BaseModel):
+            return obj.dict()
+
+        return pydantic.json.pydantic_encoder(obj)
+
+    def _ext_hook(self, code: int, data: bytes) -> Any:
+        if code == EXT_SET:
+            return set(self._unpack(data))
+
+        if code == EXT_ARROW:
+            return arrow.get(data.decode())
+
+        if code == EXT_DATETIME:
+            return datetime.datetime.fromisoformat(data.decode())
+
+        if code == EXT_TIMEDELTA:
+            days, seconds, microseconds = self._unpack(data)
+            return datetime.timedelta(days=days, seconds=seconds, microseconds=microseconds)
+
+        return msgpack.ExtType(code, data)
+
+    def _pack(self, obj: Any) -> bytes:
+        return msgpack.packb(obj, default=self._default)
+
+    def _unpack(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, ext_hook=self._ext_hook, strict_map_key=False)
+
+    @staticmethod
+    def _to_array(packet: Packet) -> list[Any]:
+        return [packet.id, packet.type, packet.data, packet.error, packet.one_way]
+
+    def _loads(self, message: str | bytes) -> Any:
+        if isinstance(message, str):
+            raise InvalidPacketReceived("Packet was expected to be binary, got text instead")
+
+        try:
+            return self._unpack(message)
+        except (msgpack.UnpackException, ValueError) as e:
+            raise InvalidPacketReceived("Packet was not valid msgpack data", e)
+
+    def _from_array(self, data: Any) -> Packet:
+        if not isinstance(data, list) or len(data) != 5:
+            raise InvalidPacketReceived(
+                f"Packet was expected to be an array of length 5, got {data!r} instead",
+            )
+
+        packet_id, packet_type, packet_data, error, one_way = data
+
+        return self._construct(
+            {
+                "id": packet_id,
+                "type": packet_type,
+                "data": packet_data,
+                "error": error,
+                "one_way": one_way,
+            },
+        )
+
+    def encode(self, packet: Packet) -> bytes:
+        return self._pack(self._to_array(packet))
+
+    def decode(self, message: str | bytes) -> Packet:
+        return self._from_array(self._loads(message))
+
+    def join_batch(self, messages: list[str | bytes]) -> bytes:
+        # batches are sent as an array of packet arrays, which is just an array header followed by
+        # the already packed packets
+        return self._packer.pack_array_header(len(messages)) + b"".join(messages)
+
+    def decode_frame(self, message: str | bytes) -> list[Packet]:
+        data = self._loads(message)
+
+        # a single packet's first element is its id, whereas a batch's first element is a packet
+        if isinstance(data, list) and data and isinstance(data[0], list):
+            return [self._from_array(d) for d in data]
+
+        return [self._from_array(data)]
+
+
+JSON_CODEC = JsonCodec()
+
+# supported codecs, in order of preference
+CODECS: dict[str, Codec] = {
+    codec.name: codec
+    for codec in (
+        MsgpackCodec(),
+        JSON_CODEC,
+    )
+}
+
+
+def negotiate_codec(offered: list[str]) -> Codec:
+    """Picks the first codec offered by the peer which is supported, falling back to JSON"""
+
+    for name in offered:
+        if name in CODECS:
+            return CODECS[name]
+
+    return JSON_CODEC
@@ -1,11 +1,12 @@
-import json
+import inspect
 import logging
-from typing import Any
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
 
-from pydantic import ValidationError, validate_arguments
+from pydantic import ValidationError
 
-from common.coms.errors import InvalidPacketReceived
-from common.coms.json_encoder import special_obj_decode
+from common.coms.codec import JSON_CODEC, Codec
+from common.coms.metrics import ComsMetricsRecorder
 from common.coms.packet import PACKET_DATA_TYPES, T_PACKET_DATA, Packet
 from common.coms.packet_handling import PacketHandler
 from common.coms.packet_type import PacketType
@@ -24,24 +25,44 @@ class ComsBase:
         self.packet_handlers = packet_handlers
         self.logger = logger
 
-    def _decode(self, message: str | bytes) -> Packet:
-        data: Any
-        try:
-            data = json.loads(message, object_hook=special_obj_decode)
-        except json.JSONDecodeError as e:
-            raise InvalidPacketReceived("Packet was not a valid JSON object", e)
+        self.metrics = ComsMetricsRecorder()
 
-        if not isinstance(data, dict):
-            raise InvalidPacketReceived(
-                f"Packet was expected to be of type 'dict', got '{type(data).__name}' instead",
-            )
+    def _decode(self, message: str | bytes, codec: Codec = JSON_CODEC) -> Packet:
+        return codec.decode(message)
+
+    def _decode_frame(self, message: str | bytes, codec: Codec = JSON_CODEC) -> list[Packet]:
+        return codec.decode_frame(message)
+
+    async def _send_stream(
+        self,
+        packet: Packet,
+        chunks: AsyncIterator[T_PACKET_DATA],
+        send: Callable[[Packet], Awaitable[None]],
+    ) -> None:
+        """Sends each chunk yielded by a streaming packet handler as its own response, followed by
+        a response marking the end of the stream"""
+
+        start = time.perf_counter()
+        error = True
 
         try:
-            return Packet(**data)
-        except (ValidationError, ValueError, TypeError) as e:
-            raise InvalidPacketReceived("Could not construct Packet model", e)
+            async for chunk in chunks:
+                await send(Packet(id=packet.id, data={"chunk": chunk, "done": False}))
+
+            error = False
+        finally:
+            self.metrics.record_handler(packet.type, time.perf_counter() - start, error)
+
+        await send(Packet(id=packet.id, data={"chunk": None, "done": True}))
+
+    async def _call_handler(
+        self,
+        packet: Packet,
+        **extra: Any,
+    ) -> T_PACKET_DATA | AsyncIterator[T_PACKET_DATA]:
+        """Calls the handler for the packet, streaming handlers return an async iterator of chunks
+        instead of a value which should be passed to _send_stream"""
 
-    async def _call_handler(self, packet: Packet, **extra: Any) -> T_PACKET_DATA:
         if packet.type is None:
             raise ValueError(f"Missing packet type for packet {packet}")
 
@@ -51,14 +72,8 @@ class ComsBase:
             self.logger.error("Missing packet handler for packet type %s", packet.type)
             raise RuntimeError(f"Missing packet handler for packet type {packet.type.name}")
 
-        annos = {
-            k: v for k, v in handler.function.__annotations__.items() if k not in {"self", "return"}
-        }
-
         # remove any **extra keys/values which aren't expected by the handler function
-        for extra_k in list(extra.keys()):
-            if extra_k not in annos:
-                del extra[extra_k]
+        extra = {k: v for k, v in extra.items() if k in handler.arg_names}
 
         handler_args = list[Any]()
         handler_kwargs = dict[str, Any]()
@@ -68,7 +83,7 @@ class ComsBase:
         elif packet.data is None:
             # check if None is an expected value for an argument rather than signifying there's
             # no data passed
-            if len(annos) != 0:
+            if handler.arg_names:
                 handler_args.append(None)
         else:
             handler_args.append(packet.data)
@@ -80,12 +95,17 @@ class ComsBase:
             handler_kwargs,
         )
 
+        start = time.perf_counter()
+        error = True
+
         try:
-            response = await validate_arguments(handler.function)(
-                *handler_args,
-                **handler_kwargs,
-                **extra,
-            )
+            response = handler.call(*handler_args, **handler_kwargs, **extra)
+
+            # streaming handlers are async generators, so there's nothing to await
+            if not inspect.isasyncgen(response):
+                response = await response
+
+            error = False
         except ValidationError:
             self.logger.info(
                 (
@@ -97,6 +117,11 @@ class ComsBase:
                 handler_kwargs,
             )
             raise
+        finally:
+            self.metrics.record_handler(packet.type, time.perf_counter() - start, error)
+
+        if inspect.isasyncgen(response):
+            return response
 
         if not isinstance(response, PACKET_DATA_TYPES):
             raise TypeError(
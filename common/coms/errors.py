@@ -1,3 +1,6 @@
+import uuid
+
+
 class InvalidPacketReceived(Exception):
     """Raised when an invalid packet is received"""
 
@@ -19,3 +22,38 @@ class NoConnectedClientsError(Exception):
 
     def __init__(self):
         super().__init__("There are no connected clients to broadcast to")
+
+
+class BroadcastIncompleteError(Exception):
+    """Raised at the end of a broadcast stream when some clients didn't stream their whole
+    response, because they disconnected, timed out or responded with an error"""
+
+    def __init__(self, missed: set[uuid.UUID]):
+        super().__init__(
+            f"Clients didn't finish the broadcast stream: {', '.join(map(str, missed))}"
+        )
+        self.missed = missed
+
+
+class RequestTimeoutError(Exception):
+    """Raised when no response to a request was received before its deadline"""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+
+
+class ShardNotConnectedError(Exception):
+    """Raised when no connected client is running the shard a packet is routed to"""
+
+    def __init__(self, shard_id: int):
+        super().__init__(f"No connected client is running shard {shard_id}")
+        self.shard_id = shard_id
+
+
+class UnknownQueryError(Exception):
+    """Raised when a query id which was never registered with Karen is used, as happens after
+    Karen restarts"""
+
+    def __init__(self, query_id: int):
+        super().__init__(f"No query is registered with the id {query_id}")
+        self.query_id = query_id
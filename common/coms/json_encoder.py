@@ -1,3 +1,4 @@
+import base64
 import datetime
 from typing import Any
 
@@ -25,6 +26,9 @@ def special_obj_encode(obj: object) -> dict[str, Any]:
             },
         }
 
+    if isinstance(obj, bytes):
+        return {"__bytes_object": base64.b64encode(obj).decode()}
+
     return pydantic.json.pydantic_encoder(obj)
 
 
@@ -47,4 +51,7 @@ def special_obj_decode(dct: dict) -> dict | Any:
             microseconds=data["microseconds"],
         )
 
+    if "__bytes_object" in dct:
+        return base64.b64decode(dct["__bytes_object"])
+
     return dct
@@ -0,0 +1,102 @@
+from bisect import bisect_left
+
+from common.coms.packet_type import PacketType
+from common.models.coms_metrics import ComsMetrics, HistogramSnapshot, PacketTypeMetrics
+
+# bucket upper bounds, 100 microseconds to ~52 seconds
+TIME_BUCKETS = tuple(0.0001 * 2**i for i in range(20))
+# bucket upper bounds, 64 bytes to 16 MiB
+SIZE_BUCKETS = tuple(float(64 * 2**i) for i in range(19))
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "total", "max")
+
+    def __init__(self, bounds: tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self) -> HistogramSnapshot:
+        return HistogramSnapshot(
+            bounds=list(self.bounds),
+            counts=list(self.counts),
+            total=self.total,
+            max=self.max,
+        )
+
+
+class PacketTypeRecorder:
+    __slots__ = (
+        "handler_time",
+        "round_trip_time",
+        "payload_bytes",
+        "handler_errors",
+        "request_errors",
+    )
+
+    def __init__(self):
+        self.handler_time = Histogram(TIME_BUCKETS)
+        self.round_trip_time = Histogram(TIME_BUCKETS)
+        self.payload_bytes = Histogram(SIZE_BUCKETS)
+        self.handler_errors = 0
+        self.request_errors = 0
+
+    def snapshot(self) -> PacketTypeMetrics:
+        return PacketTypeMetrics(
+            handler_time=self.handler_time.snapshot(),
+            round_trip_time=self.round_trip_time.snapshot(),
+            payload_bytes=self.payload_bytes.snapshot(),
+            handler_errors=self.handler_errors,
+            request_errors=self.request_errors,
+        )
+
+
+class ComsMetricsRecorder:
+    """Keeps per packet type histograms of handler execution time, request round trip time and
+    payload size, along with error counts"""
+
+    def __init__(self):
+        self._packet_types = dict[PacketType, PacketTypeRecorder]()
+
+    def _get(self, packet_type: PacketType) -> PacketTypeRecorder:
+        recorder = self._packet_types.get(packet_type)
+
+        if recorder is None:
+            recorder = self._packet_types[packet_type] = PacketTypeRecorder()
+
+        return recorder
+
+    def record_handler(self, packet_type: PacketType, seconds: float, error: bool) -> None:
+        recorder = self._get(packet_type)
+        recorder.handler_time.record(seconds)
+
+        if error:
+            recorder.handler_errors += 1
+
+    def record_round_trip(self, packet_type: PacketType, seconds: float, error: bool) -> None:
+        recorder = self._get(packet_type)
+        recorder.round_trip_time.record(seconds)
+
+        if error:
+            recorder.request_errors += 1
+
+    def record_payload(self, packet_type: PacketType, size: int) -> None:
+        self._get(packet_type).payload_bytes.record(size)
+
+    def snapshot(self, identifier: str) -> ComsMetrics:
+        return ComsMetrics(
+            identifier=identifier,
+            packet_types={
+                packet_type.name: recorder.snapshot()
+                for packet_type, recorder in self._packet_types.items()
+            },
+        )
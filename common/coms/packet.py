@@ -43,6 +43,7 @@ class Packet(BaseModel):
     type: PacketType | None = None
     data: T_PACKET_DATA
     error: bool = False
+    one_way: bool = False  # whether the receiver should not send a response
 
     class Config:
         allow_mutation = False
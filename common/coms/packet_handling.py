@@ -2,6 +2,8 @@ from __future__ import annotations
 
 from typing import Awaitable, Callable, TypeAlias
 
+from pydantic import validate_arguments
+
 from common.coms.packet import PACKET_DATA_TYPES, T_PACKET_DATA
 from common.coms.packet_type import PacketType
 
@@ -9,11 +11,40 @@ T_PACKET_HANDLER_CALLABLE: TypeAlias = Callable[..., Awaitable[T_PACKET_DATA]]
 
 
 class PacketHandler:
-    __slots__ = ("packet_type", "function")
+    __slots__ = ("packet_type", "function", "trusted", "arg_names", "call")
 
-    def __init__(self, packet_type: PacketType, function: T_PACKET_HANDLER_CALLABLE):
+    def __init__(
+        self,
+        packet_type: PacketType,
+        function: T_PACKET_HANDLER_CALLABLE,
+        trusted: bool = False,
+    ):
         self.packet_type = packet_type
         self.function = function
+        # trusted handlers are only sent well-formed data by our own code, so their arguments
+        # aren't validated
+        self.trusted = trusted
+
+        # names of the arguments the handler function accepts
+        self.arg_names = frozenset(
+            k for k in function.__annotations__ if k not in {"self", "return"}
+        )
+
+        # the callable used to actually call the handler, set when the handler is bound
+        self.call: T_PACKET_HANDLER_CALLABLE = function
+
+    def bind(self, instance: object) -> PacketHandler:
+        """Creates a copy of this handler bound to the given instance, compiling its argument
+        validator once instead of on every call"""
+
+        function = self.function.__get__(instance)
+
+        handler = PacketHandler(self.packet_type, function, self.trusted)
+
+        if not self.trusted:
+            handler.call = validate_arguments(function)
+
+        return handler
 
 
 def validate_packet_handler_function(function: T_PACKET_HANDLER_CALLABLE) -> None:
@@ -41,11 +72,15 @@ def validate_packet_handler_function(function: T_PACKET_HANDLER_CALLABLE) -> Non
             )
 
 
-def handle_packet(packet_type: PacketType) -> Callable[[T_PACKET_HANDLER_CALLABLE], PacketHandler]:
+def handle_packet(
+    packet_type: PacketType,
+    *,
+    trusted: bool = False,
+) -> Callable[[T_PACKET_HANDLER_CALLABLE], PacketHandler]:
     """Decorator for creating a PacketHandler object in a class"""
 
     def _inner(handler: T_PACKET_HANDLER_CALLABLE) -> PacketHandler:
-        return PacketHandler(packet_type, handler)
+        return PacketHandler(packet_type, handler, trusted)
 
     return _inner
 
@@ -72,8 +107,10 @@ class PacketHandlerRegistry(metaclass=PacketHandlerRegistryMeta):
         self = super().__new__(cls)
 
         # bind handlers to their class instance
-        for handler in self.__packet_handlers__.values():
-            handler.function = handler.function.__get__(self)
+        self.__packet_handlers__ = {
+            packet_type: handler.bind(self)
+            for packet_type, handler in cls.__packet_handlers__.items()
+        }
 
         return self
 
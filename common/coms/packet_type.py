@@ -52,3 +52,10 @@ class PacketType(IntEnum):
     FETCH_TOP_GUILDS_BY_ACTIVE_MEMBERS = auto()
     FETCH_TOP_GUILDS_BY_COMMANDS_LAST_30D = auto()
     COMMAND_EXECUTION = auto()
+    COMMAND_GATE = auto()
+    FETCH_COMS_METRICS = auto()
+    DB_CURSOR = auto()
+    DB_REGISTER_QUERIES = auto()
+    DB_REGISTERED_QUERY = auto()
+    DB_TRANSACTION = auto()
+    FETCH_LEADERBOARD = auto()
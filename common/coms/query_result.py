@@ -0,0 +1,150 @@
+import sys
+from array import array
+from typing import Any, Iterable, Iterator, Mapping, Sequence, overload
+
+# typecodes integer columns can be packed with, from smallest to largest
+INT_TYPECODES = ("b", "h", "i", "q")
+
+# integer columns shorter than this are sent as plain lists, as packing them saves nothing
+PACK_MIN_ROWS = 8
+
+
+def _int_typecode(values: Sequence[Any]) -> str | None:
+    """Returns the smallest typecode which every value fits in, or None if the values aren't all
+    (non bool) ints"""
+
+    if len(values) < PACK_MIN_ROWS:
+        return None
+
+    for value in values:
+        if type(value) is not int:
+            return None
+
+    low, high = min(values), max(values)
+
+    for typecode in INT_TYPECODES:
+        limit = 2 ** (array(typecode).itemsize * 8 - 1)
+
+        if -limit <= low and high < limit:
+            return typecode
+
+    return None
+
+
+def _pack_column(values: Sequence[Any]) -> tuple[str | None, list[Any] | bytes]:
+    typecode = _int_typecode(values)
+
+    if typecode is None:
+        return None, list(values)
+
+    packed = array(typecode, values)
+
+    # packed columns are always little endian on the wire
+    if sys.byteorder == "big":
+        packed.byteswap()
+
+    return typecode, packed.tobytes()
+
+
+def _unpack_column(typecode: str | None, values: list[Any] | bytes) -> list[Any]:
+    if typecode is None:
+        return values
+
+    packed = array(typecode)
+    packed.frombytes(values)
+
+    if sys.byteorder == "big":
+        packed.byteswap()
+
+    return packed.tolist()
+
+
+def encode_query_result(columns: list[str], rows: Sequence[Iterable[Any]]) -> dict[str, Any]:
+    """Encodes the rows of a query's result column by column, so column names are only sent once
+    and integer columns can be sent as packed arrays"""
+
+    packed = (
+        [_pack_column(values) for values in zip(*rows)] if rows else [(None, [])] * len(columns)
+    )
+
+    return {
+        "columns": columns,
+        "types": [typecode for typecode, _ in packed],
+        "data": [values for _, values in packed],
+        "count": len(rows),
+    }
+
+
+class Row(Mapping[str, Any]):
+    """A read only row of a QueryResult, which looks up its values in the result's columns"""
+
+    __slots__ = ("_result", "_index")
+
+    def __init__(self, result: "QueryResult", index: int):
+        self._result = result
+        self._index = index
+
+    def __getitem__(self, key: str) -> Any:
+        return self._result._columns[self._result._column_indexes[key]][self._index]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._result.columns)
+
+    def __len__(self) -> int:
+        return len(self._result.columns)
+
+    def __repr__(self) -> str:
+        return f"Row({dict(self)!r})"
+
+
+class QueryResult(Sequence[Row]):
+    """The decoded result of a query, rows are only created when they're accessed"""
+
+    __slots__ = ("columns", "_column_indexes", "_columns", "_count")
+
+    def __init__(self, columns: list[str], column_values: list[list[Any]], count: int):
+        self.columns = columns
+        self._column_indexes = {name: i for i, name in enumerate(columns)}
+        self._columns = column_values
+        self._count = count
+
+    @classmethod
+    def decode(cls, data: dict[str, Any]) -> "QueryResult":
+        return cls(
+            data["columns"],
+            [_unpack_column(t, v) for t, v in zip(data["types"], data["data"])],
+            data["count"],
+        )
+
+    def column(self, name: str) -> list[Any]:
+        """Returns all the values of a column, without creating any rows"""
+
+        return self._columns[self._column_indexes[name]]
+
+    @overload
+    def __getitem__(self, index: int) -> Row: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[Row]: ...
+
+    def __getitem__(self, index: int | slice) -> Row | list[Row]:
+        if isinstance(index, slice):
+            return [Row(self, i) for i in range(*index.indices(self._count))]
+
+        if index < 0:
+            index += self._count
+
+        if not 0 <= index < self._count:
+            raise IndexError("QueryResult index out of range")
+
+        return Row(self, index)
+
+    def __iter__(self) -> Iterator[Row]:
+        for i in range(self._count):
+            yield Row(self, i)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __repr__(self) -> str:
+        return f"QueryResult(columns={self.columns!r}, count={self._count})"
@@ -1,28 +1,99 @@
 import asyncio
+import functools
+import inspect
 import logging
+import time
 import uuid
-from typing import Any, Callable, Coroutine
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Coroutine, TypeAlias
 
 from pydantic import BaseModel
 from websockets.exceptions import ConnectionClosedOK as WebSocketConnectionClosedOK
 from websockets.server import WebSocketServer, WebSocketServerProtocol, serve
 
+from common.coms.batching import PacketBatcher
+from common.coms.codec import JSON_CODEC, Codec, negotiate_codec
 from common.coms.coms_base import ComsBase
-from common.coms.errors import InvalidPacketReceived, NoConnectedClientsError
-from common.coms.json_encoder import special_obj_encode
+from common.coms.errors import (
+    BroadcastIncompleteError,
+    InvalidPacketReceived,
+    NoConnectedClientsError,
+    RequestTimeoutError,
+    ShardNotConnectedError,
+)
 from common.coms.packet import T_PACKET_DATA, Packet
 from common.coms.packet_handling import PacketHandler, PacketType
+from common.coms.unix_socket import UnixSocketConnection, serve_unix
+
+Connection: TypeAlias = WebSocketServerProtocol | UnixSocketConnection
+
+# seconds to wait for all clients to respond to a broadcast
+DEFAULT_BROADCAST_TIMEOUT = 20.0
+
+# packet types which need a different broadcast timeout than the default, None means no timeout
+BROADCAST_TIMEOUTS: dict[PacketType, float | None] = {
+    PacketType.EXEC_CODE: None,
+    # clusters wait until they're ready before responding
+    PacketType.FETCH_GUILD_IDS: None,
+}
 
 
 class Broadcast(BaseModel):
     ready: asyncio.Event
     ws_ids: set[uuid.UUID]  # ws ids to expect a response from
     responses: list[T_PACKET_DATA]
+    missed: set[uuid.UUID]  # ws ids which disconnected before responding
 
     class Config:
         arbitrary_types_allowed = True
 
 
+@dataclass(frozen=True, slots=True)
+class BroadcastResult:
+    responses: list[T_PACKET_DATA]
+    missed: set[uuid.UUID]  # ws ids which didn't respond before the deadline or disconnected
+
+
+class ConnectionTasks:
+    """Keeps track of the tasks handling packets from a connection and limits how many of them
+    can be in flight at once"""
+
+    def __init__(self, limit: int):
+        self._semaphore = asyncio.Semaphore(limit)
+        self._tasks = set[asyncio.Task]()
+        self._cancelled = False
+
+    async def spawn(self, coro: Coroutine[None, Any, Any]) -> None:
+        """Waits until there's room for another task and then starts running the coroutine"""
+
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            coro.close()
+            raise
+
+        if self._cancelled:
+            self._semaphore.release()
+            coro.close()
+            return
+
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._on_task_done)
+
+    def _on_task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        self._semaphore.release()
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        current_task = asyncio.current_task()
+
+        for task in list(self._tasks):
+            if task is not current_task:
+                task.cancel()
+
+
 class Server(ComsBase):
     def __init__(
         self,
@@ -33,6 +104,12 @@ class Server(ComsBase):
         logger: logging.Logger,
         connect_cb: Callable[[uuid.UUID], Coroutine[None, Any, Any]] | None = None,
         disconnect_cb: Callable[[uuid.UUID], Coroutine[None, Any, Any]] | None = None,
+        batch_window_us: int | None = 0,
+        max_tasks_per_connection: int = 512,
+        broadcast_timeouts: dict[PacketType, float | None] | None = None,
+        default_broadcast_timeout: float | None = DEFAULT_BROADCAST_TIMEOUT,
+        shard_count: int | None = None,
+        unix_socket: str | None = None,
     ):
         super().__init__(host, port, packet_handlers, logger.getChild("server"))
 
@@ -40,12 +117,28 @@ class Server(ComsBase):
 
         self.connect_cb = connect_cb
         self.disconnect_cb = disconnect_cb
+        self.batch_window_us = batch_window_us
+        # how many packets from a single connection can be handled at once, reading from the
+        # connection is paused while the limit is reached
+        self.max_tasks_per_connection = max_tasks_per_connection
+        self.broadcast_timeouts = {**BROADCAST_TIMEOUTS, **(broadcast_timeouts or {})}
+        self.default_broadcast_timeout = default_broadcast_timeout
+        # total number of shards across all clients, needed to route packets by guild id
+        self.shard_count = shard_count
+        # when set, clients connect over this unix socket instead of TCP websockets
+        self.unix_socket = unix_socket
 
         self._stop = asyncio.Event()
-        self._connections = list[WebSocketServerProtocol]()  # only authed connections
+        self._connections = list[Connection]()  # only authed connections
+        # batchers for authed connections, which also hold the codec negotiated by the connection
+        self._batchers = dict[uuid.UUID, PacketBatcher]()
+        self._tasks = dict[uuid.UUID, ConnectionTasks]()  # tasks handling each connection's packets
         self._current_id = 0
         self._broadcasts = dict[str, Broadcast]()
-        self._server: WebSocketServer | None = None
+        # responses to streamed broadcasts, None is queued when a client disconnects
+        self._streams = dict[str, asyncio.Queue[tuple[uuid.UUID, Packet | None]]]()
+        self._shard_routes = dict[int, uuid.UUID]()  # shard id -> ws id of the client running it
+        self._server: WebSocketServer | asyncio.Server | None = None
         self._ip_blacklist = set[str]()
 
     def _get_packet_id(self, t: str = "s") -> str:
@@ -54,12 +147,17 @@ class Server(ComsBase):
         return f"{t}{packet_id}"
 
     async def serve(self, ready_cb: Callable[[], None] | None = None) -> None:
-        async with serve(
-            self._handle_connection,
-            self.host,
-            self.port,
-            logger=self.logger.getChild("ws"),
-        ) as self._server:
+        if self.unix_socket is None:
+            server = serve(
+                self._handle_connection,
+                self.host,
+                self.port,
+                logger=self.logger.getChild("ws"),
+            )
+        else:
+            server = await serve_unix(self._handle_connection, self.unix_socket)
+
+        async with server as self._server:
             if ready_cb is not None:
                 ready_cb()
 
@@ -67,14 +165,37 @@ class Server(ComsBase):
 
     async def stop(self) -> None:
         if self._connections:
-            await asyncio.wait([c.drain() for c in self._connections])
+            await asyncio.gather(*[c.drain() for c in self._connections], return_exceptions=True)
+
+        for tasks in self._tasks.values():
+            tasks.cancel()
 
         self._stop.set()
 
-    async def _send(self, ws: WebSocketServerProtocol, packet: Packet) -> None:
-        await ws.send(packet.json(encoder=special_obj_encode))
+    def _get_codec(self, ws: Connection) -> Codec:
+        batcher = self._batchers.get(ws.id)
+        return JSON_CODEC if batcher is None else batcher.codec
+
+    async def _send(
+        self,
+        ws: Connection,
+        packet: Packet,
+        packet_type: PacketType | None = None,
+    ) -> None:
+        """Sends a packet, packet_type is the type of the request when sending a response"""
+
+        batcher = self._batchers.get(ws.id)
+        message = (JSON_CODEC if batcher is None else batcher.codec).encode(packet)
+
+        if (packet_type := packet_type or packet.type) is not None:
+            self.metrics.record_payload(packet_type, len(message))
 
-    async def _disconnect(self, ws: WebSocketServerProtocol) -> None:
+        if batcher is None:
+            await ws.send(message)
+        else:
+            await batcher.send_encoded(message)
+
+    async def _disconnect(self, ws: Connection) -> None:
         if not ws.closed:
             await ws.close()
 
@@ -83,57 +204,298 @@ class Server(ComsBase):
         except ValueError:
             pass
 
+        batcher = self._batchers.pop(ws.id, None)
+        if batcher is not None:
+            batcher.close()
+
+        # responses to the packets still being handled can't be delivered anymore
+        tasks = self._tasks.pop(ws.id, None)
+        if tasks is not None:
+            tasks.cancel()
+
+        for shard_id, ws_id in list(self._shard_routes.items()):
+            if ws_id == ws.id:
+                del self._shard_routes[shard_id]
+
+        # stop waiting on responses which will never arrive
+        for stream in self._streams.values():
+            stream.put_nowait((ws.id, None))
+
+        for broadcast in self._broadcasts.values():
+            if ws.id in broadcast.ws_ids:
+                broadcast.ws_ids.remove(ws.id)
+                broadcast.missed.add(ws.id)
+
+                if len(broadcast.ws_ids) == 0:
+                    broadcast.ready.set()
+
         self.logger.info("Disconnected client: %s", ws.id)
 
         if self.disconnect_cb:
             asyncio.create_task(self.disconnect_cb(ws.id))
 
+    async def _fan_out(self, connections: list[Connection], packet: Packet) -> None:
+        # encode the packet once per codec in use instead of once per connection
+        encoded = dict[str, str | bytes]()
+        targets = list[Connection]()
+        sends = []
+
+        for ws in connections:
+            batcher = self._batchers.get(ws.id)
+
+            if batcher is None:
+                continue
+
+            message = encoded.get(batcher.codec.name)
+            if message is None:
+                message = encoded[batcher.codec.name] = batcher.codec.encode(packet)
+
+            targets.append(ws)
+            sends.append(batcher.send_encoded(message))
+            self.metrics.record_payload(packet.type, len(message))
+
+        results = await asyncio.gather(*sends, return_exceptions=True)
+
+        for ws, result in zip(targets, results, strict=True):
+            if isinstance(result, Exception):
+                self.logger.error(
+                    "Failed to send packet %s to client %s",
+                    packet.id,
+                    ws.id,
+                    exc_info=result,
+                )
+
     async def raw_broadcast(
         self,
         packet_type: PacketType,
         packet_data: dict[str, T_PACKET_DATA] | None = None,
     ) -> None:
-        packet = Packet(id=self._get_packet_id("b"), type=packet_type, data=packet_data)
-        tasks = [asyncio.create_task(self._send(c, packet)) for c in self._connections]
-        await asyncio.wait(tasks)
+        packet = Packet(
+            id=self._get_packet_id("b"),
+            type=packet_type,
+            data=packet_data,
+            one_way=True,
+        )
 
-    async def broadcast(
+        await self._fan_out(list(self._connections), packet)
+
+    async def _gather_responses(
         self,
+        connections: list[Connection],
         packet_type: PacketType,
-        packet_data: dict[str, T_PACKET_DATA] | None = None,
-    ) -> list[T_PACKET_DATA]:
-        if len(self._connections) == 0:
-            raise NoConnectedClientsError()
+        packet_data: dict[str, T_PACKET_DATA] | None,
+        timeout: float | None,
+    ) -> BroadcastResult:
+        if timeout is None:
+            timeout = self.broadcast_timeouts.get(packet_type, self.default_broadcast_timeout)
 
         broadcast_id = self._get_packet_id("b")
         broadcast_packet = Packet(id=broadcast_id, type=packet_type, data=packet_data)
 
-        ws_ids = {ws.id for ws in self._connections}
-        broadcast_tasks = [
-            asyncio.create_task(self._send(c, broadcast_packet))
-            for c in self._connections
-            if c.id in ws_ids
-        ]
         broadcast = self._broadcasts[broadcast_id] = Broadcast(
             ready=asyncio.Event(),
-            ws_ids=ws_ids,
+            ws_ids={ws.id for ws in connections},
             responses=[],
+            missed=set(),
         )
 
-        await asyncio.wait(broadcast_tasks)
-        await broadcast.ready.wait()
+        start = time.perf_counter()
 
-        return broadcast.responses
+        try:
+            await self._fan_out(connections, broadcast_packet)
+
+            try:
+                await asyncio.wait_for(broadcast.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                self.logger.warning(
+                    "Broadcast %s (%s) timed out waiting on responses from clients: %s",
+                    broadcast_id,
+                    packet_type.name,
+                    ", ".join(map(str, broadcast.ws_ids)),
+                )
+        finally:
+            del self._broadcasts[broadcast_id]
+
+        missed = broadcast.missed | broadcast.ws_ids
+        self.metrics.record_round_trip(packet_type, time.perf_counter() - start, bool(missed))
+
+        return BroadcastResult(responses=broadcast.responses, missed=missed)
 
-    async def _client_broadcast(self, ws: WebSocketServerProtocol, packet: Packet) -> None:
+    async def broadcast_partial(
+        self,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> BroadcastResult:
+        """Broadcasts a packet to all connected clients and waits for their responses until the
+        deadline, returning the responses received so far and the clients which missed it. The
+        timeout defaults to the one configured for the packet type"""
+
+        connections = list(self._connections)
+
+        if len(connections) == 0:
+            raise NoConnectedClientsError()
+
+        return await self._gather_responses(connections, packet_type, packet_data, timeout)
+
+    async def broadcast(
+        self,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> list[T_PACKET_DATA]:
+        result = await self.broadcast_partial(packet_type, packet_data, timeout=timeout)
+        return result.responses
+
+    async def broadcast_stream(
+        self,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> AsyncIterator[T_PACKET_DATA]:
+        """Broadcasts a packet to the streaming packet handlers of all connected clients, yielding
+        the chunks they respond with as they arrive. The timeout applies to each chunk and
+        defaults to the one configured for the packet type. BroadcastIncompleteError is raised
+        once the stream ends if any client didn't stream its whole response"""
+
+        if timeout is None:
+            timeout = self.broadcast_timeouts.get(packet_type, self.default_broadcast_timeout)
+
+        connections = list(self._connections)
+
+        if len(connections) == 0:
+            raise NoConnectedClientsError()
+
+        stream_id = self._get_packet_id("b")
+        stream = self._streams[stream_id] = asyncio.Queue[tuple[uuid.UUID, Packet | None]]()
+        remaining = {ws.id for ws in connections}
+        missed = set[uuid.UUID]()
+
+        try:
+            await self._fan_out(
+                connections, Packet(id=stream_id, type=packet_type, data=packet_data)
+            )
+
+            while remaining:
+                try:
+                    ws_id, response = await asyncio.wait_for(stream.get(), timeout)
+                except asyncio.TimeoutError:
+                    self.logger.warning(
+                        "Broadcast stream %s (%s) timed out waiting on chunks from clients: %s",
+                        stream_id,
+                        packet_type.name,
+                        ", ".join(map(str, remaining)),
+                    )
+                    missed |= remaining
+                    break
+
+                if ws_id not in remaining:
+                    continue
+
+                # the client disconnected
+                if response is None:
+                    remaining.remove(ws_id)
+                    missed.add(ws_id)
+                    continue
+
+                if response.error:
+                    self.logger.error(
+                        "Client %s responded to broadcast stream %s (%s) with an error: %s",
+                        ws_id,
+                        stream_id,
+                        packet_type.name,
+                        response.data,
+                    )
+                    remaining.remove(ws_id)
+                    missed.add(ws_id)
+                    continue
+
+                if response.data["done"]:
+                    remaining.remove(ws_id)
+                    continue
+
+                yield response.data["chunk"]
+        finally:
+            del self._streams[stream_id]
+
+        if missed:
+            raise BroadcastIncompleteError(missed)
+
+    def register_shards(self, ws_id: uuid.UUID, shard_ids: list[int]) -> None:
+        """Routes packets for the given shards to the client, until it disconnects"""
+
+        for shard_id in shard_ids:
+            self._shard_routes[shard_id] = ws_id
+
+    def shard_for_guild(self, guild_id: int) -> int:
+        if not self.shard_count:
+            raise RuntimeError("The shard count must be set to route packets by guild id")
+
+        return (guild_id >> 22) % self.shard_count
+
+    def _get_shard_connection(self, shard_id: int) -> Connection:
+        ws_id = self._shard_routes.get(shard_id)
+
+        for ws in self._connections:
+            if ws.id == ws_id:
+                return ws
+
+        raise ShardNotConnectedError(shard_id)
+
+    async def send_to_shard(
+        self,
+        shard_id: int,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> T_PACKET_DATA:
+        """Sends a packet to the client running the given shard and waits for its response"""
+
+        ws = self._get_shard_connection(shard_id)
+        result = await self._gather_responses([ws], packet_type, packet_data, timeout)
+
+        if result.missed:
+            raise RequestTimeoutError(
+                f"Client {ws.id} running shard {shard_id} did not respond to {packet_type.name}",
+            )
+
+        return result.responses[0]
+
+    async def send_to_guild(
+        self,
+        guild_id: int,
+        packet_type: PacketType,
+        packet_data: dict[str, T_PACKET_DATA] | None = None,
+        *,
+        timeout: float | None = None,
+    ) -> T_PACKET_DATA:
+        """Sends a packet to the client running the shard the given guild is on and waits for its
+        response"""
+
+        return await self.send_to_shard(
+            self.shard_for_guild(guild_id),
+            packet_type,
+            packet_data,
+            timeout=timeout,
+        )
+
+    async def _client_broadcast(self, ws: Connection, packet: Packet) -> None:
         assert isinstance(packet.data, dict)
 
+        if packet.one_way:
+            await self.raw_broadcast(packet.data["type"], packet.data["data"])
+            return
+
         responses = await self.broadcast(packet.data["type"], packet.data["data"])
 
         # send response back to client who requested broadcast
-        await self._send(ws, Packet(id=packet.id, data=responses))
+        await self._send(ws, Packet(id=packet.id, data=responses), packet.type)
 
-    async def _handle_broadcast_response(self, ws: WebSocketServerProtocol, packet: Packet) -> None:
+    async def _handle_broadcast_response(self, ws: Connection, packet: Packet) -> None:
         broadcast = self._broadcasts[packet.id]
 
         if ws.id not in broadcast.ws_ids:
@@ -147,33 +509,86 @@ class Server(ComsBase):
         if len(broadcast.ws_ids) == 0:
             broadcast.ready.set()
 
-    async def _handle_packet(self, packet: Packet, ws: WebSocketServerProtocol):
+    async def _handle_packet(self, packet: Packet, ws: Connection):
         # handle broadcast requests
         if packet.type == PacketType.BROADCAST_REQUEST:
             # broadcast requests are special types of packets which forward the packet to
             # ALL connected clients
-            asyncio.create_task(
-                self._client_broadcast(ws, packet),
-            )  # TODO: keep track of these tasks and properly cancel them on a server shutdown
-            return
-
-        # handle broadcast responses
-        if packet.id in self._broadcasts:
-            await self._handle_broadcast_response(ws, packet)
+            await self._client_broadcast(ws, packet)
             return
 
         try:
             response = await self._call_handler(packet, ws_id=ws.id)
+
+            if inspect.isasyncgen(response):
+                await self._send_stream(
+                    packet,
+                    response,
+                    functools.partial(self._send, ws, packet_type=packet.type),
+                )
+                return
         except Exception as e:
             self.logger.exception(
                 "An error ocurred while calling the packet handler for packet %s",
                 packet,
             )
-            await self._send(ws, Packet(id=packet.id, data=repr(e), error=True))
+
+            if not packet.one_way:
+                await self._send(ws, Packet(id=packet.id, data=repr(e), error=True), packet.type)
+        else:
+            if not packet.one_way:
+                await self._send(ws, Packet(id=packet.id, data=response), packet.type)
+
+    async def _authorize(self, ws: Connection, packet: Packet) -> bool:
+        # older clients send the auth string as-is and only understand JSON
+        if isinstance(packet.data, dict):
+            auth = packet.data.get("auth")
+            offered_codecs = packet.data.get("codecs")
         else:
-            await self._send(ws, Packet(id=packet.id, data=response))
+            auth = packet.data
+            offered_codecs = None
+
+        if auth != self.auth:
+            self.logger.error("Incorrect authorization received from client: %s", ws.id)
+            await self._send(
+                ws,
+                Packet(
+                    id=self._get_packet_id(),
+                    type=PacketType.AUTH,
+                    data=None,
+                    error=True,
+                ),
+            )
+
+            # access to unix sockets is already restricted by the socket file's permissions
+            if not isinstance(ws, UnixSocketConnection):
+                self._ip_blacklist.add(ws.remote_address[0])
+
+            await self._disconnect(ws)
+            return False
+
+        if offered_codecs is not None:
+            codec = negotiate_codec(offered_codecs)
+
+            # the response is sent in JSON, the negotiated codec is used afterwards
+            await self._send(
+                ws,
+                Packet(id=packet.id, type=PacketType.AUTH, data={"codec": codec.name}),
+            )
+
+            self._batchers[ws.id] = PacketBatcher(ws.send, codec, self.batch_window_us)
+        else:
+            # older clients don't understand batched frames either
+            self._batchers[ws.id] = PacketBatcher(ws.send, JSON_CODEC, None)
+
+        self._connections.append(ws)
+
+        if self.connect_cb:
+            asyncio.create_task(self.connect_cb(ws.id))
 
-    async def _handle_connection(self, ws: WebSocketServerProtocol):
+        return True
+
+    async def _handle_connection(self, ws: Connection):
         self.logger.info("New client connected: %s", ws.id)
 
         if ws.remote_address[0] in self._ip_blacklist:
@@ -185,11 +600,15 @@ class Server(ComsBase):
             return
 
         authed = False
+        tasks = self._tasks[ws.id] = ConnectionTasks(self.max_tasks_per_connection)
+
+        # reading may be paused by the task limit, so watch for the connection closing separately
+        asyncio.create_task(ws.wait_closed()).add_done_callback(lambda _: tasks.cancel())
 
         try:
             async for message in ws:
                 try:
-                    packet = self._decode(message)
+                    packets = self._decode_frame(message, self._get_codec(ws))
                 except InvalidPacketReceived:
                     self.logger.exception(
                         "Invalid packet received from client: %s",
@@ -198,49 +617,58 @@ class Server(ComsBase):
                     await self._disconnect(ws)
                     return
 
-                if packet.type == PacketType.AUTH:
-                    if authed:
+                for packet in packets:
+                    if packet.type == PacketType.AUTH:
+                        if authed:
+                            self.logger.error(
+                                "Already received authorization packet from client: %s",
+                                ws.id,
+                            )
+                            await self._disconnect(ws)
+                            return
+
+                        if not await self._authorize(ws, packet):
+                            return
+
+                        authed = True
+                        continue
+
+                    if not authed:
                         self.logger.error(
-                            "Already received authorization packet from client: %s",
+                            "Authorization packet was not the first received from client: %s",
                             ws.id,
                         )
                         await self._disconnect(ws)
                         return
 
-                    if packet.data != self.auth:
-                        self.logger.error("Incorrect authorization received from client: %s", ws.id)
-                        await self._send(
-                            ws,
-                            Packet(
-                                id=self._get_packet_id(),
-                                type=PacketType.AUTH,
-                                data=None,
-                                error=True,
-                            ),
+                    if packet.id in self._streams:
+                        self._streams[packet.id].put_nowait((ws.id, packet))
+                        continue
+
+                    # broadcast responses are handled immediately, as the tasks waiting on them may
+                    # be what's keeping the connection at its limit
+                    if packet.id in self._broadcasts:
+                        try:
+                            await self._handle_broadcast_response(ws, packet)
+                        except Exception:
+                            self.logger.exception(
+                                "An error occurred while handling broadcast response %s",
+                                packet,
+                            )
+
+                        continue
+
+                    # responses don't have a type, if one isn't expected its broadcast has already
+                    # completed or timed out
+                    if packet.type is None:
+                        self.logger.warning(
+                            "Received response for expired or unknown broadcast %s from client: %s",
+                            packet.id,
+                            ws.id,
                         )
-                        self._ip_blacklist.add(ws.remote_address[0])
-                        await self._disconnect(ws)
-                        return
-
-                    self._connections.append(ws)
-                    authed = True
-
-                    if self.connect_cb:
-                        asyncio.create_task(self.connect_cb(ws.id))
-
-                    continue
-
-                if not authed:
-                    self.logger.error(
-                        "Authorization packet was not the first received from client: %s",
-                        ws.id,
-                    )
-                    await self._disconnect(ws)
-                    return
+                        continue
 
-                asyncio.create_task(
-                    self._handle_packet(packet, ws),
-                )  # TODO: keep track of these and properly cancel on close
+                    await tasks.spawn(self._handle_packet(packet, ws))
         except WebSocketConnectionClosedOK:
             pass
         finally:
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import os
+import struct
+import uuid
+from typing import AsyncIterator, Awaitable, Callable
+
+from common.coms.errors import InvalidPacketReceived, WebsocketStateError
+
+# each frame is prefixed with its kind and the length of its payload
+FRAME_HEADER = struct.Struct("!BI")
+FRAME_TEXT = 1
+FRAME_BINARY = 2
+
+# frames larger than this are rejected instead of being read into memory
+MAX_FRAME_SIZE = 2**27
+
+# seconds to wait between attempts to connect to the server
+INITIAL_RECONNECT_DELAY = 0.5
+MAX_RECONNECT_DELAY = 10.0
+
+
+class UnixSocketConnection:
+    """A connection which sends length prefixed frames over a unix domain socket, it exposes the
+    same interface as the websocket connections the coms server and client otherwise use"""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, path: str):
+        self.id = uuid.uuid4()
+        self.remote_address = (path, 0)
+
+        self._reader = reader
+        self._writer = writer
+        self._closed = asyncio.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed.is_set()
+
+    async def send(self, message: str | bytes) -> None:
+        if self.closed:
+            raise WebsocketStateError("Unix socket connection is closed")
+
+        if isinstance(message, str):
+            kind, data = FRAME_TEXT, message.encode()
+        else:
+            kind, data = FRAME_BINARY, message
+
+        self._writer.writelines((FRAME_HEADER.pack(kind, len(data)), data))
+
+        try:
+            await self._writer.drain()
+        except ConnectionError as e:
+            self._closed.set()
+            raise WebsocketStateError("Unix socket connection was lost", e)
+
+    async def recv(self) -> str | bytes:
+        try:
+            kind, length = FRAME_HEADER.unpack(await self._reader.readexactly(FRAME_HEADER.size))
+
+            if length > MAX_FRAME_SIZE:
+                raise InvalidPacketReceived(f"Received a frame of {length} bytes, which is too big")
+
+            data = await self._reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            self._closed.set()
+            raise WebsocketStateError("Unix socket connection was closed", e)
+
+        return data.decode() if kind == FRAME_TEXT else data
+
+    async def __aiter__(self) -> AsyncIterator[str | bytes]:
+        while not self.closed:
+            try:
+                yield await self.recv()
+            except WebsocketStateError:
+                return
+
+    async def close(self) -> None:
+        self._closed.set()
+        self._writer.close()
+
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def wait_closed(self) -> None:
+        await self._closed.wait()
+
+    async def drain(self) -> None:
+        await self._writer.drain()
+
+
+async def serve_unix(
+    handler: Callable[[UnixSocketConnection], Awaitable[None]],
+    path: str,
+) -> asyncio.Server:
+    # a socket file left behind by a previous run would prevent binding
+    if os.path.exists(path):
+        os.unlink(path)
+
+    async def _handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = UnixSocketConnection(reader, writer, path)
+
+        try:
+            await handler(connection)
+        finally:
+            await connection.close()
+
+    return await asyncio.start_unix_server(_handle, path)
+
+
+async def connect_unix(path: str, logger: logging.Logger) -> AsyncIterator[UnixSocketConnection]:
+    """Yields a new connection to the server each time the previous one is done with, retrying
+    with a backoff while the server can't be reached"""
+
+    delay = INITIAL_RECONNECT_DELAY
+
+    while True:
+        try:
+            reader, writer = await asyncio.open_unix_connection(path)
+        except OSError as e:
+            logger.warning("Failed to connect to %s (%s), retrying in %.1fs", path, e, delay)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+            continue
+
+        delay = INITIAL_RECONNECT_DELAY
+
+        yield UnixSocketConnection(reader, writer, path)
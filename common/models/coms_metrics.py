@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from common.models.base_model import BaseModel
+
+
+class HistogramSnapshot(BaseModel):
+    bounds: list[float]  # upper bound of each bucket
+    counts: list[int]  # has an extra bucket at the end for values above the last bound
+    total: float
+    max: float
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    @property
+    def mean(self) -> float:
+        count = self.count
+        return (self.total / count) if count else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """Estimates a percentile (0-100) as the upper bound of the bucket it falls into"""
+
+        target = self.count * percentile / 100
+        seen = 0
+
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+
+            if count and seen >= target:
+                return min(bound, self.max)
+
+        return self.max
+
+    def merge(self, other: HistogramSnapshot) -> HistogramSnapshot:
+        if self.bounds != other.bounds:
+            raise ValueError("Can't merge histograms with different buckets")
+
+        return HistogramSnapshot(
+            bounds=self.bounds,
+            counts=[a + b for a, b in zip(self.counts, other.counts)],
+            total=(self.total + other.total),
+            max=max(self.max, other.max),
+        )
+
+
+class PacketTypeMetrics(BaseModel):
+    handler_time: HistogramSnapshot  # seconds spent in the packet handler
+    round_trip_time: HistogramSnapshot  # seconds between sending a request and its response
+    payload_bytes: HistogramSnapshot  # size of the encoded packets sent, requests and responses
+    handler_errors: int
+    request_errors: int  # error responses, timeouts and lost connections
+
+    def merge(self, other: PacketTypeMetrics) -> PacketTypeMetrics:
+        return PacketTypeMetrics(
+            handler_time=self.handler_time.merge(other.handler_time),
+            round_trip_time=self.round_trip_time.merge(other.round_trip_time),
+            payload_bytes=self.payload_bytes.merge(other.payload_bytes),
+            handler_errors=(self.handler_errors + other.handler_errors),
+            request_errors=(self.request_errors + other.request_errors),
+        )
+
+
+class ComsMetrics(BaseModel):
+    identifier: str
+    packet_types: dict[str, PacketTypeMetrics]  # keyed by PacketType name
+
+    def merge(self, other: ComsMetrics, identifier: str) -> ComsMetrics:
+        packet_types = dict(self.packet_types)
+
+        for name, metrics in other.packet_types.items():
+            packet_types[name] = (
+                metrics if name not in packet_types else packet_types[name].merge(metrics)
+            )
+
+        return ComsMetrics(identifier=identifier, packet_types=packet_types)
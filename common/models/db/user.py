@@ -15,3 +15,4 @@ class User(BaseModel):
     give_alert: bool = Field(default=True)
     shield_pearl: datetime.datetime | None
     last_dq_reroll: datetime.datetime
+    net_worth: int = Field(default=0)
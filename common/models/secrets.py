@@ -7,3 +7,9 @@ class KarenSecrets(ImmutableBaseModel):
     host: str
     port: int = Field(gt=0, le=65535)
     auth: str
+    # how long packets are held to be sent together in one frame in microseconds, 0 batches the
+    # packets sent within the same event loop iteration and null disables batching
+    batch_window_us: int | None = Field(0, ge=0)
+    # path of a unix socket to use instead of TCP websockets when Karen and the clusters share a
+    # host, host and port are ignored when it's set
+    unix_socket: str | None = None
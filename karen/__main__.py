@@ -10,6 +10,7 @@ import psutil
 from common.utils.setup import load_data
 
 from karen.karen import MechaKaren
+from karen.utils.migrations import run_migrations
 from karen.utils.setup import load_secrets
 
 
@@ -31,6 +32,8 @@ async def async_main():
                 lambda: asyncio.create_task(karen.stop),
             )
 
+        await run_migrations(secrets.database, karen.logger)
+
         await karen.serve()
 
 
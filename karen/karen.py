@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 import asyncio
-import itertools
 import time
 import uuid
 from collections import defaultdict
@@ -13,9 +12,11 @@ import arrow
 import asyncpg
 import psutil
 
+from common.coms.errors import BroadcastIncompleteError
 from common.coms.packet import PACKET_DATA_TYPES
 from common.coms.packet_handling import PacketHandlerRegistry, handle_packet
 from common.coms.packet_type import PacketType
+from common.coms.query_result import encode_query_result
 from common.coms.server import Server
 from common.data.enums.guild_event_type import GuildEventType
 from common.models.data import Data
@@ -27,10 +28,19 @@ from common.utils.recurring_tasks import RecurringTasksMixin, recurring_task
 from common.utils.setup import setup_logging
 from karen.models.secrets import Secrets
 from karen.utils.cooldowns import CooldownManager, MaxConcurrencyManager
+from karen.utils.leaderboards import (
+    LEADERBOARD_SOURCES,
+    LeaderboardSnapshot,
+    leaderboard_snapshot_query,
+)
+from karen.utils.query_registry import QUERY_METHODS, QueryRegistry, TransactionAbortedError
 from karen.utils.setup import setup_database_pool
 from karen.utils.shard_ids import ShardIdManager
 from karen.utils.topgg import VotingWebhookServer
 
+# rows sent per chunk by streamed database queries
+DB_CURSOR_CHUNK_SIZE = 500
+
 
 class Share:
     """Class which holds any data that clients can access (excluding exec packet)"""
@@ -38,6 +48,7 @@ class Share:
     def __init__(self, data: Data):
         self.command_cooldowns = CooldownManager(data.cooldown_rates)
         self.command_concurrency = MaxConcurrencyManager()
+        self.concurrency_limited = data.concurrency_limited
         self.econ_paused_users = dict[int, float]()  # user_id: time paused
         self.bottable_command_points = defaultdict[int, int](
             int,
@@ -49,6 +60,9 @@ class Share:
         )  # user_id: dict[fx: expires_at]
         self.current_cluster_id = 0
 
+        # leaderboard name: snapshot, leaderboards are only served from these once refreshed
+        self.leaderboards = dict[str, LeaderboardSnapshot]()
+
         self.command_executions = list[tuple[int, int | None, str, bool, datetime]]()
 
 
@@ -71,6 +85,9 @@ class MechaKaren(PacketHandlerRegistry, RecurringTasksMixin):
             self.logger,
             self._connect_callback,
             self._disconnect_callback,
+            secrets.karen.batch_window_us,
+            shard_count=self.k.shard_count,
+            unix_socket=secrets.karen.unix_socket,
         )
 
         self.votehook_server = VotingWebhookServer(
@@ -84,6 +101,7 @@ class MechaKaren(PacketHandlerRegistry, RecurringTasksMixin):
         self.aiohttp: aiohttp.ClientSession | None = None
 
         self.shard_ids = ShardIdManager(self.k.shard_count, self.k.cluster_count)
+        self.queries = QueryRegistry()
 
         self._did_initial_load = False
         self._did_stop = False
@@ -151,12 +169,12 @@ class MechaKaren(PacketHandlerRegistry, RecurringTasksMixin):
 
     async def _vote_callback(self, vote: TopggVote) -> None:
         await self.ready_event.wait()
-        await self.server.broadcast(PacketType.TOPGG_VOTE, {"vote": vote})
+        # only the cluster running shard 0 handles votes
+        await self.server.send_to_shard(0, PacketType.TOPGG_VOTE, {"vote": vote})
 
     async def _connect_callback(self, ws_id: uuid.UUID) -> None:
         if len(self.server._connections) == self.k.cluster_count and not self._did_initial_load:
-            await self._update_guild_diffs()
-            self._did_initial_load = True
+            self._did_initial_load = await self._update_guild_diffs()
 
     async def _disconnect_callback(self, ws_id: uuid.UUID) -> None:
         self.shard_ids.release(ws_id)
@@ -165,22 +183,38 @@ class MechaKaren(PacketHandlerRegistry, RecurringTasksMixin):
         self.ready_event.set()
         self.start_recurring_tasks()
 
-    async def _update_guild_diffs(self):
+    async def _update_guild_diffs(self) -> bool:
+        """Records the guild joins and leaves missed while Karen was down, returns whether it
+        could, which it can't unless every cluster sent its whole list of guilds"""
+
         self.logger.info("Updating guild events table with missed joins and leaves...")
 
-        current_guilds_db = await self.db.fetch(
-            """SELECT COALESCE(js.guild_id, ls.guild_id) AS guild_id FROM (
+        current_guilds_db = set[int]()
+
+        async with self.db.acquire() as con, con.transaction():
+            async for record in con.cursor(
+                """SELECT COALESCE(js.guild_id, ls.guild_id) AS guild_id FROM (
     SELECT guild_id, COUNT(*) AS c FROM guild_events WHERE event_type = 1 GROUP BY guild_id) js
 FULL JOIN (
     SELECT guild_id, COUNT(*) AS c FROM guild_events WHERE event_type = 2 GROUP BY guild_id) ls
 ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""",
-        )
-
-        current_guilds_db: set[int] = {r["guild_id"] for r in current_guilds_db}
-
-        current_guilds = set[int](
-            itertools.chain.from_iterable(await self.server.broadcast(PacketType.FETCH_GUILD_IDS)),
-        )
+                prefetch=DB_CURSOR_CHUNK_SIZE,
+            ):
+                current_guilds_db.add(record["guild_id"])
+
+        # clusters stream their guild ids in chunks rather than sending them in one huge packet
+        current_guilds = set[int]()
+
+        try:
+            async for guild_ids in self.server.broadcast_stream(PacketType.FETCH_GUILD_IDS):
+                current_guilds.update(guild_ids)
+        except BroadcastIncompleteError as e:
+            # the missing guilds would otherwise all be recorded as left
+            self.logger.warning(
+                "Not updating guild events table, clusters didn't send all their guilds: %s",
+                ", ".join(map(str, e.missed)),
+            )
+            return False
 
         missed_guild_joins = current_guilds - current_guilds_db
         missed_guild_leaves = current_guilds_db - current_guilds
@@ -202,6 +236,8 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
 
         self.logger.info("Done updating guild events table")
 
+        return True
+
     @classmethod
     def _transform_query_result(cls, result: Any) -> Any:
         if isinstance(result, list):
@@ -212,6 +248,53 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
 
         return result
 
+    @staticmethod
+    def _encode_records(records: list[asyncpg.Record]) -> dict[str, Any]:
+        return encode_query_result(list(records[0].keys()) if records else [], records)
+
+    def _encode_query_result(self, method: str, result: Any) -> Any:
+        if method == "fetch":
+            return self._encode_records(result)
+
+        return self._transform_query_result(result)
+
+    async def _run_query(
+        self,
+        con: asyncpg.Connection,
+        method: str,
+        args: list[Any],
+        *,
+        query: str | None = None,
+        query_id: int | None = None,
+    ) -> Any:
+        """Runs a query with the given connection method, using the prepared statement for it if
+        it's a registered query"""
+
+        if method not in QUERY_METHODS:
+            raise ValueError(f"Unknown query method: {method!r}")
+
+        if query_id is None:
+            if method == "executemany":
+                return await con.executemany(query, args)
+
+            if method == "execute":
+                await con.execute(query, *args)
+                return None
+
+            return await getattr(con, method)(query, *args)
+
+        statement = await self.queries.prepare(con, query_id)
+
+        if method == "executemany":
+            return await statement.executemany(args)
+
+        # prepared statements have no execute method, so the fetched result is discarded
+        if method == "execute":
+            await statement.fetch(*args)
+            return None
+
+        return await getattr(statement, method)(*args)
+
     # loops ###############################################################
 
     @recurring_task(minutes=2)
@@ -272,17 +355,25 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
     async def loop_remind_reminders(self):
         reminders = await self.db.fetch(
             "DELETE FROM reminders WHERE at <= NOW() "
-            "RETURNING channel_id, user_id, message_id, reminder",
+            "RETURNING guild_id, channel_id, user_id, message_id, reminder",
         )
 
-        broadcast_tasks = [
-            asyncio.create_task(self.server.broadcast(PacketType.REMINDER, {**r}))
-            for r in reminders
-        ]
+        remind_tasks = [asyncio.create_task(self._send_reminder(**r)) for r in reminders]
 
-        for tasks_chunk in chunk_sequence(broadcast_tasks, 4):
+        for tasks_chunk in chunk_sequence(remind_tasks, 4):
             await asyncio.wait(tasks_chunk)
 
+    async def _send_reminder(self, guild_id: int | None, **reminder: Any) -> None:
+        # reminders from dms or from before guild ids were stored could be on any cluster
+        if guild_id is None:
+            await self.server.broadcast(PacketType.REMINDER, reminder)
+            return
+
+        try:
+            await self.server.send_to_guild(guild_id, PacketType.REMINDER, reminder)
+        except Exception:
+            self.logger.exception("An error occurred while sending reminder to guild %s", guild_id)
+
     @recurring_task(minutes=30, sleep_first=False)
     async def loop_clear_weekly_leaderboards(self):
         await self.db.execute(
@@ -294,6 +385,20 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
             "WHERE DATE_TRUNC('WEEK', NOW()) > week",
         )
 
+    @recurring_task(minutes=5, sleep_first=False)
+    async def loop_refresh_leaderboards(self):
+        for lb, source in LEADERBOARD_SOURCES.items():
+            snapshot = LeaderboardSnapshot()
+
+            async with self.db.acquire() as con, con.transaction():
+                async for record in con.cursor(
+                    leaderboard_snapshot_query(source),
+                    prefetch=DB_CURSOR_CHUNK_SIZE,
+                ):
+                    snapshot.add(record["user_id"], record["rank"], record["amount"])
+
+            self.v.leaderboards[lb] = snapshot
+
     @recurring_task(hours=1, sleep_first=True)
     async def loop_topgg_stats(self):
         responses = await self.server.broadcast(PacketType.FETCH_GUILD_COUNT)
@@ -325,22 +430,26 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
     @handle_packet(PacketType.FETCH_CLUSTER_INIT_INFO)
     async def packet_fetch_cluster_init_info(self, ws_id: uuid.UUID):
         self.v.current_cluster_id += 1
+
+        shard_ids = self.shard_ids.take(ws_id)
+        self.server.register_shards(ws_id, shard_ids)
+
         return {
-            "shard_ids": self.shard_ids.take(ws_id),
+            "shard_ids": shard_ids,
             "shard_count": self.k.shard_count,
             "cluster_id": self.v.current_cluster_id - 1,
         }
 
-    @handle_packet(PacketType.COOLDOWN_CHECK_ADD)
+    @handle_packet(PacketType.COOLDOWN_CHECK_ADD, trusted=True)
     async def packet_cooldown(self, command: str, user_id: int):
         can_run, remaining = self.v.command_cooldowns.check_add_cooldown(command, user_id)
         return {"can_run": can_run, "remaining": remaining}
 
-    @handle_packet(PacketType.COOLDOWN_ADD)
+    @handle_packet(PacketType.COOLDOWN_ADD, trusted=True)
     async def packet_cooldown_add(self, command: str, user_id: int):
         self.v.command_cooldowns.add_cooldown(command, user_id)
 
-    @handle_packet(PacketType.COOLDOWN_RESET)
+    @handle_packet(PacketType.COOLDOWN_RESET, trusted=True)
     async def packet_cooldown_reset(self, command: str, user_id: int):
         self.v.command_cooldowns.clear_cooldown(command, user_id)
 
@@ -352,7 +461,8 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
         message_id: int,
         content: str | None,
     ):
-        await self.server.broadcast(
+        # any cluster could be waiting on a dm, but none of them respond to it
+        await self.server.raw_broadcast(
             PacketType.DM_MESSAGE,
             {
                 "user_id": user_id,
@@ -371,22 +481,26 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
     async def packet_bottable_command_points_reset(self, user_id: int):
         self.v.bottable_command_points.pop(user_id, None)
 
-    @handle_packet(PacketType.CONCURRENCY_CHECK)
+    @handle_packet(PacketType.CONCURRENCY_CHECK, trusted=True)
     async def packet_concurrency_check(self, command: str, user_id: int):
         return self.v.command_concurrency.check(command, user_id)
 
-    @handle_packet(PacketType.CONCURRENCY_ACQUIRE)
+    @handle_packet(PacketType.CONCURRENCY_ACQUIRE, trusted=True)
     async def packet_concurrency_acquire(self, command: str, user_id: int):
         self.v.command_concurrency.acquire(command, user_id)
 
-    @handle_packet(PacketType.CONCURRENCY_RELEASE)
+    @handle_packet(PacketType.CONCURRENCY_RELEASE, trusted=True)
     async def packet_concurrency_release(self, command: str, user_id: int):
         self.v.command_concurrency.release(command, user_id)
 
-    @handle_packet(PacketType.LB_COMMAND_RAN)
+    @handle_packet(PacketType.LB_COMMAND_RAN, trusted=True)
     async def packet_command_ran(self, user_id: int):
         self.v.command_counts_lb[user_id] += 1
 
+    @handle_packet(PacketType.FETCH_COMS_METRICS)
+    async def packet_fetch_coms_metrics(self):
+        return self.server.metrics.snapshot("Karen")
+
     @handle_packet(PacketType.FETCH_SYSTEM_STATS)
     async def packet_fetch_system_stats(self):
         memory_info = psutil.virtual_memory()
@@ -401,7 +515,7 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
             start_time=self.start_time.datetime,
         )
 
-    @handle_packet(PacketType.ECON_PAUSE_CHECK)
+    @handle_packet(PacketType.ECON_PAUSE_CHECK, trusted=True)
     async def packet_econ_pause_check(self, user_id: int):
         return user_id in self.v.econ_paused_users
 
@@ -413,11 +527,11 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
     async def packet_econ_pause_undo(self, user_id: int):
         self.v.econ_paused_users.pop(user_id, None)
 
-    @handle_packet(PacketType.ACTIVE_FX_FETCH)
+    @handle_packet(PacketType.ACTIVE_FX_FETCH, trusted=True)
     async def packet_active_fx_fetch(self, user_id: int):
         return set(self.v.active_fx[user_id].keys())
 
-    @handle_packet(PacketType.ACTIVE_FX_CHECK)
+    @handle_packet(PacketType.ACTIVE_FX_CHECK, trusted=True)
     async def packet_active_fx_check(self, user_id: int, fx: str):
         return fx.lower() in self.v.active_fx[user_id]
 
@@ -449,25 +563,93 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
     async def packet_active_fx_clear(self, user_id: int):
         self.v.active_fx.pop(user_id, None)
 
-    @handle_packet(PacketType.DB_EXEC)
+    @handle_packet(PacketType.DB_EXEC, trusted=True)
     async def packet_db_exec(self, query: str, args: list[Any]):
         await self.db.execute(query, *args)
 
-    @handle_packet(PacketType.DB_EXEC_MANY)
+    @handle_packet(PacketType.DB_EXEC_MANY, trusted=True)
     async def packet_db_exec_many(self, query: str, args: list[list[Any]]):
         await self.db.executemany(query, args)
 
-    @handle_packet(PacketType.DB_FETCH_VAL)
+    @handle_packet(PacketType.DB_FETCH_VAL, trusted=True)
     async def packet_db_fetch_one(self, query: str, args: list[Any]):
         return self._transform_query_result(await self.db.fetchval(query, *args))
 
-    @handle_packet(PacketType.DB_FETCH_ROW)
+    @handle_packet(PacketType.DB_FETCH_ROW, trusted=True)
     async def packet_db_fetch_row(self, query: str, args: list[Any]):
         return self._transform_query_result(await self.db.fetchrow(query, *args))
 
-    @handle_packet(PacketType.DB_FETCH_ALL)
+    @handle_packet(PacketType.DB_FETCH_ALL, trusted=True)
     async def packet_db_fetch_all(self, query: str, args: list[Any]):
-        return self._transform_query_result(await self.db.fetch(query, *args))
+        return self._encode_records(await self.db.fetch(query, *args))
+
+    @handle_packet(PacketType.DB_CURSOR, trusted=True)
+    async def packet_db_cursor(self, query: str, args: list[Any]):
+        # the connection is held until the whole result has been sent
+        async with self.db.acquire() as con, con.transaction():
+            cursor = await con.cursor(query, *args)
+
+            while chunk := await cursor.fetch(DB_CURSOR_CHUNK_SIZE):
+                yield self._encode_records(chunk)
+
+    @handle_packet(PacketType.DB_REGISTER_QUERIES, trusted=True)
+    async def packet_db_register_queries(self, queries: list[str]):
+        return self.queries.register(queries)
+
+    @handle_packet(PacketType.DB_REGISTERED_QUERY, trusted=True)
+    async def packet_db_registered_query(self, query_id: int, method: str, args: list[Any]):
+        async with self.db.acquire() as con:
+            result = await self._run_query(con, method, args, query_id=query_id)
+
+        return self._encode_query_result(method, result)
+
+    @handle_packet(PacketType.DB_TRANSACTION, trusted=True)
+    async def packet_db_transaction(self, statements: list[dict[str, Any]]):
+        results = list[Any]()
+
+        async with self.db.acquire() as con:
+            try:
+                async with con.transaction():
+                    for i, statement in enumerate(statements):
+                        args = list(statement["args"])
+
+                        # arguments which are the results of earlier statements in the transaction
+                        for arg_index, result_index, column in statement["refs"]:
+                            result = results[result_index]
+                            args[arg_index] = result if column is None else result[column]
+
+                        result = await self._run_query(
+                            con,
+                            statement["method"],
+                            args,
+                            query=statement.get("query"),
+                            query_id=statement.get("query_id"),
+                        )
+
+                        if statement["required"] and result in (None, []):
+                            raise TransactionAbortedError(i)
+
+                        results.append(result)
+            except TransactionAbortedError as e:
+                return {"aborted_at": e.statement, "results": None}
+
+        return {
+            "aborted_at": None,
+            "results": [
+                self._encode_query_result(statement["method"], result)
+                for statement, result in zip(statements, results)
+            ],
+        }
+
+    @handle_packet(PacketType.FETCH_LEADERBOARD, trusted=True)
+    async def packet_fetch_leaderboard(self, lb: str, user_id: int, user_ids: list[int] | None):
+        snapshot = self.v.leaderboards.get(lb)
+
+        # the leaderboard hasn't been refreshed yet, so the cluster queries it itself
+        if snapshot is None:
+            return None
+
+        return snapshot.fetch(user_id, user_ids)
 
     @handle_packet(PacketType.TRIVIA)
     async def packet_trivia(self, user_id: int):
@@ -480,7 +662,7 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
         await self.server.raw_broadcast(PacketType.SHUTDOWN)
         await self.stop()
 
-    @handle_packet(PacketType.COMMAND_EXECUTION)
+    @handle_packet(PacketType.COMMAND_EXECUTION, trusted=True)
     async def packet_command_execution(
         self,
         user_id: int,
@@ -491,3 +673,39 @@ ON js.guild_id = ls.guild_id WHERE (COALESCE(js.c, 0) - COALESCE(ls.c, 0)) > 0""
         self.v.command_executions.append(
             (user_id, guild_id, command, is_slash, datetime.now(timezone.utc)),
         )
+
+    @handle_packet(PacketType.COMMAND_GATE, trusted=True)
+    async def packet_command_gate(
+        self,
+        command: str,
+        user_id: int,
+        guild_id: int | None,
+        econ: bool,
+    ):
+        # combines the cooldown, concurrency and econ pause checks with the before-invoke side
+        # effects so clusters only need one round trip per command invocation
+        if command in self.v.command_cooldowns.rates:
+            can_run, remaining = self.v.command_cooldowns.check_add_cooldown(command, user_id)
+
+            if not can_run:
+                return {"can_run": False, "reason": "cooldown", "remaining": remaining}
+
+        concurrency_limited = command in self.v.concurrency_limited
+
+        if concurrency_limited and not self.v.command_concurrency.check(command, user_id):
+            return {"can_run": False, "reason": "concurrency", "remaining": None}
+
+        if econ and user_id in self.v.econ_paused_users:
+            return {"can_run": False, "reason": "econ_paused", "remaining": None}
+
+        if concurrency_limited:
+            self.v.command_concurrency.acquire(command, user_id)
+
+        if command in self.v.command_cooldowns.rates:
+            self.v.command_counts_lb[user_id] += 1
+
+        self.v.command_executions.append(
+            (user_id, guild_id, command, False, datetime.now(timezone.utc)),
+        )
+
+        return {"can_run": True, "reason": None, "remaining": None}
@@ -0,0 +1,13 @@
+-- items had no unique key, so a user could end up with several rows for the same item, these are
+-- merged into one row each before the unique index on items (user_id, LOWER(name)) is created
+
+CREATE TEMPORARY TABLE merged_items ON COMMIT DROP AS
+  SELECT user_id, MIN(name) AS name, MAX(sell_price) AS sell_price, SUM(amount) AS amount,
+    BOOL_OR(sticky) AS sticky, BOOL_AND(sellable) AS sellable
+  FROM items GROUP BY user_id, LOWER(name) HAVING COUNT(*) > 1;
+
+DELETE FROM items USING merged_items
+  WHERE items.user_id = merged_items.user_id AND LOWER(items.name) = LOWER(merged_items.name);
+
+INSERT INTO items (user_id, name, sell_price, amount, sticky, sellable)
+  SELECT user_id, name, sell_price, amount, sticky, sellable FROM merged_items;
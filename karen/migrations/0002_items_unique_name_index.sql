@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS items_user_id_name_idx ON items (user_id, LOWER(name));
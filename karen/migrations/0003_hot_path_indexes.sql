@@ -0,0 +1,12 @@
+-- migrate: no-transaction
+
+-- items (user_id) lookups are already covered by items_user_id_name_idx
+CREATE INDEX CONCURRENTLY IF NOT EXISTS farm_plots_user_id_idx ON farm_plots (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS trash_can_user_id_idx ON trash_can (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS reminders_at_idx ON reminders (at);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS reminders_user_id_idx ON reminders (user_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS give_logs_sender_at_idx ON give_logs (sender, at DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS give_logs_receiver_at_idx ON give_logs (receiver, at DESC);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS warnings_user_id_guild_id_idx ON warnings (user_id, guild_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS disabled_commands_guild_id_idx ON disabled_commands (guild_id);
+CREATE INDEX CONCURRENTLY IF NOT EXISTS command_executions_at_guild_id_idx ON command_executions (at, guild_id);
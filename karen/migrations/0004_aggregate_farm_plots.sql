@@ -0,0 +1,13 @@
+-- farm plots used to be stored as one row per plot, now each row is a batch of plots planted at
+-- once, existing plots planted by the same command (within the same second) are merged
+
+ALTER TABLE farm_plots ADD COLUMN IF NOT EXISTS count INT NOT NULL DEFAULT 1;
+
+CREATE TEMPORARY TABLE merged_farm_plots ON COMMIT DROP AS
+  SELECT user_id, crop_type, MIN(planted_at) AS planted_at, grow_time, SUM(count)::INT AS count
+  FROM farm_plots GROUP BY user_id, crop_type, DATE_TRUNC('second', planted_at), grow_time;
+
+TRUNCATE farm_plots;
+
+INSERT INTO farm_plots (user_id, crop_type, planted_at, grow_time, count)
+  SELECT user_id, crop_type, planted_at, grow_time, count FROM merged_farm_plots;
@@ -0,0 +1,16 @@
+-- trash_can used to get a new row for every item found while mining, now there's one row per user
+-- and item which is added to, so existing rows are merged before the unique index is created
+
+CREATE TEMPORARY TABLE merged_trash_can ON COMMIT DROP AS
+  SELECT user_id, item, MAX(value) AS value, SUM(amount)::BIGINT AS amount
+  FROM trash_can GROUP BY user_id, item;
+
+TRUNCATE trash_can;
+
+INSERT INTO trash_can (user_id, item, value, amount)
+  SELECT user_id, item, value, amount FROM merged_trash_can;
+
+CREATE UNIQUE INDEX IF NOT EXISTS trash_can_user_id_item_idx ON trash_can (user_id, item);
+
+-- user_id lookups are covered by the new index
+DROP INDEX IF EXISTS trash_can_user_id_idx;
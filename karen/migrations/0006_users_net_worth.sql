@@ -0,0 +1,64 @@
+-- users.net_worth is a user's emeralds, vault and what their items sell for, it's kept up to date
+-- by triggers on users and items so every write path keeps it correct, and is backfilled here
+
+ALTER TABLE users ADD COLUMN IF NOT EXISTS net_worth BIGINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION users_update_net_worth() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    NEW.net_worth := NEW.emeralds + NEW.vault_balance * 9::BIGINT;
+  ELSE
+    NEW.net_worth := NEW.net_worth + (NEW.emeralds - OLD.emeralds) + (NEW.vault_balance - OLD.vault_balance) * 9::BIGINT;
+  END IF;
+
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- items which can't be sold (sell_price <= 0) are worth nothing
+CREATE OR REPLACE FUNCTION items_update_net_worth() RETURNS TRIGGER AS $$
+DECLARE
+  old_worth BIGINT := 0;
+  new_worth BIGINT := 0;
+BEGIN
+  IF TG_OP <> 'INSERT' THEN
+    old_worth := GREATEST(COALESCE(OLD.sell_price, 0), 0) * OLD.amount;
+  END IF;
+
+  IF TG_OP <> 'DELETE' THEN
+    new_worth := GREATEST(COALESCE(NEW.sell_price, 0), 0) * NEW.amount;
+  END IF;
+
+  IF TG_OP = 'UPDATE' AND OLD.user_id = NEW.user_id THEN
+    IF new_worth <> old_worth THEN
+      UPDATE users SET net_worth = net_worth + new_worth - old_worth WHERE user_id = NEW.user_id;
+    END IF;
+
+    RETURN NULL;
+  END IF;
+
+  IF old_worth <> 0 THEN
+    UPDATE users SET net_worth = net_worth - old_worth WHERE user_id = OLD.user_id;
+  END IF;
+
+  IF new_worth <> 0 THEN
+    UPDATE users SET net_worth = net_worth + new_worth WHERE user_id = NEW.user_id;
+  END IF;
+
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_net_worth ON users;
+CREATE TRIGGER users_net_worth BEFORE INSERT OR UPDATE OF emeralds, vault_balance ON users
+  FOR EACH ROW EXECUTE FUNCTION users_update_net_worth();
+
+DROP TRIGGER IF EXISTS items_net_worth ON items;
+CREATE TRIGGER items_net_worth AFTER INSERT OR DELETE OR UPDATE OF user_id, sell_price, amount ON items
+  FOR EACH ROW EXECUTE FUNCTION items_update_net_worth();
+
+-- only net_worth is set, so the users trigger doesn't fire
+UPDATE users SET net_worth = emeralds + vault_balance * 9::BIGINT + COALESCE(
+  (SELECT SUM(sell_price * amount) FROM items WHERE items.user_id = users.user_id AND sell_price > 0),
+  0
+);
@@ -0,0 +1,4 @@
+-- migrate: no-transaction
+
+-- the total wealth leaderboard reads users in net_worth order
+CREATE INDEX CONCURRENTLY IF NOT EXISTS users_net_worth_idx ON users (net_worth DESC);
@@ -0,0 +1,124 @@
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+# number of rows at the top of a leaderboard which are sent
+LEADERBOARD_TOP_ROWS = 10
+
+# columns of the leaderboards table which have leaderboards
+LEADERBOARD_COLUMNS = (
+    "pillaged_emeralds",
+    "mobs_killed",
+    "fish_fished",
+    "commands",
+    "crops_planted",
+    "trash_emptied",
+    "week_emeralds",
+    "week_commands",
+    "daily_quests",
+    "week_daily_quests",
+)
+
+# leaderboard name: query for the user_id and amount of each user on the leaderboard, users with
+# nothing aren't ranked
+LEADERBOARD_SOURCES = {
+    **{
+        lb: f"SELECT user_id, {lb} AS amount FROM leaderboards WHERE {lb} > 0"
+        for lb in LEADERBOARD_COLUMNS
+    },
+    **{
+        column: (
+            f"SELECT user_id, {column} AS amount FROM users "
+            f"WHERE {column} > 0 AND bot_banned = false"
+        )
+        for column in ("emeralds", "vote_streak", "net_worth")
+    },
+    "unique_items": "SELECT user_id, COUNT(*) AS amount FROM items GROUP BY user_id",
+}
+
+
+def leaderboard_snapshot_query(source: str) -> str:
+    """Ranks the users of a leaderboard in Postgres, returning them ordered by user_id so a
+    snapshot can be built without sorting"""
+
+    return (
+        "SELECT user_id, amount, ROW_NUMBER() OVER (ORDER BY amount DESC, user_id) - 1 AS rank "
+        f"FROM ({source}) lb ORDER BY user_id"
+    )
+
+
+class LeaderboardSnapshot:
+    """A leaderboard as of when it was last refreshed, any user's rank can be looked up in
+    O(log n) from compact arrays sorted by user_id"""
+
+    __slots__ = ("_top", "_user_ids", "_ranks", "_amounts")
+
+    def __init__(self):
+        self._top = list[tuple[int, int, int]]()  # (rank, user_id, amount) of the top rows
+
+        # parallel arrays, sorted by user_id
+        self._user_ids = array("q")
+        self._ranks = array("q")  # 0 based
+        self._amounts = array("q")
+
+    def add(self, user_id: int, rank: int, amount: int) -> None:
+        """Adds a user to the snapshot, users have to be added in ascending user_id order"""
+
+        self._user_ids.append(user_id)
+        self._ranks.append(rank)
+        self._amounts.append(amount)
+
+        if rank < LEADERBOARD_TOP_ROWS:
+            self._top.append((rank, user_id, amount))
+            self._top.sort()
+
+    def __len__(self) -> int:
+        return len(self._user_ids)
+
+    def _find(self, user_id: int) -> int | None:
+        i = bisect_left(self._user_ids, user_id)
+
+        if i < len(self._user_ids) and self._user_ids[i] == user_id:
+            return i
+
+        return None
+
+    def fetch(self, user_id: int, user_ids: Iterable[int] | None = None) -> list[dict[str, int]]:
+        """Returns the top rows of the leaderboard followed by the user's row if they aren't in the
+        top rows, like the leaderboard queries do, if user_ids are given only they are ranked"""
+
+        if user_ids is None:
+            rows = [
+                {"user_id": uid, "amount": amount, "idx": idx}
+                for idx, (_, uid, amount) in enumerate(self._top, 1)
+            ]
+
+            i = self._find(user_id)
+
+            if i is not None and self._ranks[i] >= LEADERBOARD_TOP_ROWS:
+                rows.append(
+                    {"user_id": user_id, "amount": self._amounts[i], "idx": self._ranks[i] + 1},
+                )
+
+            return rows
+
+        # (rank, user_id, amount) of each of the given users who are on the leaderboard
+        ranked = sorted(
+            (self._ranks[i], self._user_ids[i], self._amounts[i])
+            for i in {self._find(uid) for uid in user_ids} - {None}
+        )
+
+        rows = [
+            {"user_id": uid, "amount": amount, "idx": idx}
+            for idx, (_, uid, amount) in enumerate(ranked[:LEADERBOARD_TOP_ROWS], 1)
+        ]
+
+        i = self._find(user_id)
+
+        if i is not None:
+            local_idx = bisect_left(ranked, (self._ranks[i],))
+
+            if LEADERBOARD_TOP_ROWS <= local_idx < len(ranked) and ranked[local_idx][1] == user_id:
+                rows.append({"user_id": user_id, "amount": self._amounts[i], "idx": local_idx + 1})
+
+        return rows
@@ -0,0 +1,129 @@
+import logging
+import os
+import re
+from dataclasses import dataclass
+
+import asyncpg
+
+from karen.models.secrets import DatabaseSecrets
+
+MIGRATIONS_DIR = "karen/migrations"
+
+# migration files are named like 0001_some_description.sql
+MIGRATION_FILE_REGEX = re.compile(r"^(\d+)_(\w+)\.sql$")
+
+# migrations starting with this line aren't run in a transaction, which CREATE INDEX CONCURRENTLY
+# requires, each of their statements is run on its own so they must be split by semicolons
+NO_TRANSACTION_MARKER = "-- migrate: no-transaction"
+
+# arbitrary key for the advisory lock held while migrating, so two Karens can't migrate at once
+MIGRATION_LOCK_KEY = 5_318_008_001
+
+
+@dataclass(frozen=True, slots=True)
+class Migration:
+    version: int
+    name: str
+    sql: str
+
+    @property
+    def transactional(self) -> bool:
+        return not self.sql.lstrip().startswith(NO_TRANSACTION_MARKER)
+
+    @property
+    def statements(self) -> list[str]:
+        return [s.strip() for s in self.sql.split(";") if strip_sql_comments(s).strip()]
+
+
+def strip_sql_comments(sql: str) -> str:
+    return "\n".join(line.split("--", 1)[0] for line in sql.splitlines())
+
+
+def load_migrations(directory: str = MIGRATIONS_DIR) -> list[Migration]:
+    """Loads the migrations in the given directory, ordered by their version"""
+
+    migrations = dict[int, Migration]()
+
+    for file_name in os.listdir(directory):
+        match = MIGRATION_FILE_REGEX.match(file_name)
+
+        if match is None:
+            continue
+
+        version = int(match.group(1))
+
+        if version in migrations:
+            raise ValueError(f"There are multiple migrations with the version {version}")
+
+        with open(os.path.join(directory, file_name), "r", encoding="utf8") as f:
+            migrations[version] = Migration(version, match.group(2), f.read())
+
+    return sorted(migrations.values(), key=(lambda m: m.version))
+
+
+async def drop_invalid_indexes(con: asyncpg.Connection, logger: logging.Logger) -> None:
+    """Drops indexes left invalid by a CREATE INDEX CONCURRENTLY which failed part way through,
+    otherwise the IF NOT EXISTS of the statement would skip them when the migration is retried"""
+
+    for record in await con.fetch(
+        "SELECT indexrelid::REGCLASS::TEXT AS name FROM pg_index WHERE NOT indisvalid",
+    ):
+        logger.warning("Dropping invalid index %s", record["name"])
+        await con.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {record['name']}")
+
+
+async def apply_migration(
+    con: asyncpg.Connection,
+    migration: Migration,
+    logger: logging.Logger,
+) -> None:
+    logger.info("Applying migration %s (%s)...", migration.version, migration.name)
+
+    record_query = "INSERT INTO schema_version (version, name) VALUES ($1, $2)"
+
+    if migration.transactional:
+        async with con.transaction():
+            await con.execute(migration.sql)
+            await con.execute(record_query, migration.version, migration.name)
+    else:
+        await drop_invalid_indexes(con, logger)
+
+        for statement in migration.statements:
+            await con.execute(statement)
+
+        await con.execute(record_query, migration.version, migration.name)
+
+
+async def run_migrations(secrets: DatabaseSecrets, logger: logging.Logger) -> None:
+    """Applies the migrations which haven't been applied to the database yet, in order"""
+
+    migrations = load_migrations()
+
+    con = await asyncpg.connect(
+        host=secrets.host,
+        port=secrets.port,
+        database=secrets.name,
+        user=secrets.user,
+        password=secrets.auth,
+    )
+
+    try:
+        await con.execute("SELECT pg_advisory_lock($1)", MIGRATION_LOCK_KEY)
+
+        await con.execute(
+            (
+                "CREATE TABLE IF NOT EXISTS schema_version (version INT PRIMARY KEY, "
+                "name TEXT NOT NULL, applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW())"
+            ),
+        )
+
+        current_version = await con.fetchval("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+        pending = [m for m in migrations if m.version > current_version]
+
+        for migration in pending:
+            await apply_migration(con, migration, logger)
+
+        if pending:
+            logger.info("Migrated the database to version %s", pending[-1].version)
+    finally:
+        await con.close()
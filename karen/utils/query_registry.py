@@ -0,0 +1,67 @@
+import asyncpg
+from asyncpg.pool import PoolConnectionProxy
+from asyncpg.prepared_stmt import PreparedStatement
+
+from common.coms.errors import UnknownQueryError
+
+# the connection methods queries proxied through Karen can be run with
+QUERY_METHODS = frozenset({"execute", "executemany", "fetch", "fetchrow", "fetchval"})
+
+
+class TransactionAbortedError(Exception):
+    """Raised to roll back a transaction when one of its required statements returned nothing"""
+
+    def __init__(self, statement: int):
+        super().__init__(f"Statement {statement} of the transaction returned nothing")
+        self.statement = statement
+
+
+class RegistryConnection(asyncpg.Connection):
+    """A connection which keeps the statements prepared on it for registered queries"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self.registered_statements = dict[int, PreparedStatement]()
+
+
+class QueryRegistry:
+    """Assigns ids to the queries clusters register, so only the id has to be sent when one is used,
+    and prepares each query once per pool connection"""
+
+    def __init__(self):
+        self._queries = list[str]()
+        self._query_ids = dict[str, int]()
+
+    def register(self, queries: list[str]) -> list[int]:
+        """Registers the given queries, returning their ids in the same order, a query which was
+        already registered keeps its id"""
+
+        query_ids = list[int]()
+
+        for query in queries:
+            query_id = self._query_ids.get(query)
+
+            if query_id is None:
+                query_id = self._query_ids[query] = len(self._queries)
+                self._queries.append(query)
+
+            query_ids.append(query_id)
+
+        return query_ids
+
+    async def prepare(
+        self,
+        con: RegistryConnection | PoolConnectionProxy,
+        query_id: int,
+    ) -> PreparedStatement:
+        statements: dict[int, PreparedStatement] = con.registered_statements
+        statement = statements.get(query_id)
+
+        if statement is None:
+            if not 0 <= query_id < len(self._queries):
+                raise UnknownQueryError(query_id)
+
+            statement = statements[query_id] = await con.prepare(self._queries[query_id])
+
+        return statement
@@ -1,6 +1,7 @@
 import asyncpg
 
 from karen.models.secrets import DatabaseSecrets, Secrets
+from karen.utils.query_registry import RegistryConnection
 
 
 async def setup_database_pool(secrets: DatabaseSecrets) -> "asyncpg.Pool[asyncpg.Record]":
@@ -12,6 +13,7 @@ async def setup_database_pool(secrets: DatabaseSecrets) -> "asyncpg.Pool[asyncpg
         password=secrets.auth,
         max_size=secrets.pool_size,
         min_size=1,
+        connection_class=RegistryConnection,
     )
 
     assert pool is not None
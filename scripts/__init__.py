@@ -1,3 +1,4 @@
+from .benchmark_coms import run as benchmark_coms
 from .check_text import run as check_text
 from .format_and_lint import main as format_and_lint
 from .generate_blockify_data import run as generate_blockify_data
@@ -0,0 +1,332 @@
+# ruff: noqa: T201
+
+import argparse
+import asyncio
+import datetime
+import gc
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+import psutil
+
+from common.coms.client import Client
+from common.coms.codec import CODECS
+from common.coms.packet_handling import PacketHandlerRegistry, handle_packet
+from common.coms.packet_type import PacketType
+from common.coms.query_result import QueryResult, encode_query_result
+from common.coms.server import Server
+from common.utils.misc import chunk_sequence
+
+AUTH = "benchmark"
+DB_ROWS = 1_000
+GUILD_IDS = 100_000
+
+
+class StubKaren(PacketHandlerRegistry):
+    """Stands in for Karen, responding with precomputed data"""
+
+    def __init__(self, rows: list[dict[str, Any]]):
+        self.columns = list(rows[0])
+        self.rows = [tuple(r.values()) for r in rows]
+
+    @handle_packet(PacketType.COOLDOWN_CHECK_ADD, trusted=True)
+    async def packet_cooldown(self, command: str, user_id: int):
+        return {"can_run": True, "remaining": 0.0}
+
+    @handle_packet(PacketType.DB_FETCH_ALL, trusted=True)
+    async def packet_db_fetch_all(self, query: str, args: list[Any]):
+        return encode_query_result(self.columns, self.rows)
+
+    @handle_packet(PacketType.DB_CURSOR, trusted=True)
+    async def packet_db_cursor(self, query: str, args: list[Any]):
+        for chunk in chunk_sequence(self.rows, 500):
+            yield encode_query_result(self.columns, chunk)
+
+    @handle_packet(PacketType.PING)
+    async def packet_ping(self):
+        return 1
+
+
+class StubCluster(PacketHandlerRegistry):
+    """Stands in for a bot cluster, responding with precomputed data"""
+
+    def __init__(self, guild_ids: list[int]):
+        self.guild_ids = guild_ids
+
+    @handle_packet(PacketType.FETCH_GUILD_IDS)
+    async def packet_fetch_guild_ids(self):
+        for chunk in chunk_sequence(self.guild_ids, 5000):
+            yield chunk
+
+    @handle_packet(PacketType.PING)
+    async def packet_ping(self):
+        return 1
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: list[float]  # seconds
+    elapsed: float  # seconds
+
+    def format(self) -> str:
+        ms = sorted(lat * 1000 for lat in self.latencies)
+        quantiles = statistics.quantiles(ms, n=100, method="inclusive")
+
+        return (
+            f"{self.name:<30} n={len(ms):<7} {len(ms) / self.elapsed:>10.1f}/s   "
+            f"p50={quantiles[49]:>8.3f}ms  p90={quantiles[89]:>8.3f}ms  "
+            f"p99={quantiles[98]:>8.3f}ms  max={ms[-1]:>8.3f}ms"
+        )
+
+
+def make_rows(count: int) -> list[dict[str, Any]]:
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    return [
+        {
+            "user_id": 639498607632056321 + i,
+            "bot_banned": False,
+            "emeralds": i * 17,
+            "vault_balance": i % 100,
+            "vault_max": 100,
+            "health": 20,
+            "vote_streak": i % 30,
+            "last_vote": now,
+            "give_alert": True,
+            "shield_pearl": None,
+            "last_dq_reroll": now,
+        }
+        for i in range(count)
+    ]
+
+
+async def consume(iterator: AsyncIterator[Any]) -> None:
+    async for _ in iterator:
+        pass
+
+
+async def fetch_all(client: Client) -> None:
+    resp = await client.send(PacketType.DB_FETCH_ALL, {"query": "", "args": []})
+    QueryResult.decode(resp.data)
+
+
+async def fetch_cursor(client: Client) -> None:
+    async for resp in client.stream(PacketType.DB_CURSOR, {"query": "", "args": []}):
+        QueryResult.decode(resp.data)
+
+
+async def measure(
+    name: str,
+    request: Callable[[], Awaitable[Any]],
+    total: int,
+    concurrency: int,
+) -> Result:
+    latencies = list[float]()
+    remaining = total
+
+    async def worker() -> None:
+        nonlocal remaining
+
+        while remaining > 0:
+            remaining -= 1
+
+            start = time.perf_counter()
+            await request()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+    return Result(name, latencies, time.perf_counter() - start)
+
+
+async def soak(
+    clients: list[Client],
+    seconds: float,
+    concurrency: int,
+    sample_every: float,
+) -> None:
+    process = psutil.Process()
+    stop_at = time.perf_counter() + seconds
+    sent = 0
+
+    async def worker(client: Client) -> None:
+        nonlocal sent
+
+        while time.perf_counter() < stop_at:
+            await client.send(PacketType.COOLDOWN_CHECK_ADD, {"command": "mine", "user_id": sent})
+            sent += 1
+
+    def sample() -> tuple[int, int]:
+        gc.collect()
+        return process.memory_info().rss, tracemalloc.get_traced_memory()[0]
+
+    tracemalloc.start()
+    base_rss, base_traced = sample()
+
+    workers = asyncio.gather(*[worker(c) for c in clients for _ in range(concurrency)])
+
+    print(f"\nsoak ({seconds:.0f}s, {len(clients) * concurrency} workers)")
+
+    while not workers.done():
+        await asyncio.wait([workers], timeout=sample_every)
+
+        rss, traced = sample()
+        print(
+            f"  {sent:>10} packets   rss {(rss - base_rss) / 1024**2:>+9.2f}MiB   "
+            f"traced {(traced - base_traced) / 1024**2:>+9.2f}MiB",
+        )
+
+    await workers
+    tracemalloc.stop()
+
+
+async def run_benchmark(args: argparse.Namespace, codec: str, unix_socket: str | None) -> None:
+    logger = logging.getLogger("benchmark")
+
+    server = Server(
+        "127.0.0.1",
+        0,
+        AUTH,
+        StubKaren(make_rows(DB_ROWS)).get_packet_handlers(),
+        logger,
+        batch_window_us=args.batch_window_us,
+        unix_socket=unix_socket,
+    )
+
+    ready = asyncio.Event()
+    serve_task = asyncio.create_task(server.serve(ready.set))
+    await ready.wait()
+
+    port = 0 if unix_socket else server._server.sockets[0].getsockname()[1]
+
+    guild_ids_per_client = GUILD_IDS // args.clients
+    clients = [
+        Client(
+            "127.0.0.1",
+            port,
+            StubCluster(
+                [
+                    641117791272960031 + i * guild_ids_per_client + g
+                    for g in range(guild_ids_per_client)
+                ],
+            ).get_packet_handlers(),
+            logger,
+            batch_window_us=args.batch_window_us,
+            codecs=[codec],
+            unix_socket=unix_socket,
+        )
+        for i in range(args.clients)
+    ]
+
+    await asyncio.gather(*[c.connect(AUTH) for c in clients])
+
+    print(
+        f"\ncodec={codec} transport={args.transport} clients={args.clients} "
+        f"batch_window_us={args.batch_window_us} concurrency={args.concurrency}",
+    )
+
+    try:
+        results = [
+            await measure(
+                "cooldown check",
+                lambda: clients[0].send(
+                    PacketType.COOLDOWN_CHECK_ADD,
+                    {"command": "mine", "user_id": 639498607632056321},
+                ),
+                args.requests,
+                args.concurrency,
+            ),
+            await measure(
+                f"db fetch all ({DB_ROWS} rows)",
+                lambda: fetch_all(clients[0]),
+                max(args.requests // 100, 10),
+                args.concurrency,
+            ),
+            await measure(
+                f"db cursor ({DB_ROWS} rows)",
+                lambda: fetch_cursor(clients[0]),
+                max(args.requests // 100, 10),
+                args.concurrency,
+            ),
+            await measure(
+                "broadcast ping",
+                lambda: server.broadcast(PacketType.PING),
+                max(args.requests // 10, 10),
+                1,
+            ),
+            await measure(
+                f"broadcast guild ids ({GUILD_IDS})",
+                lambda: consume(server.broadcast_stream(PacketType.FETCH_GUILD_IDS)),
+                max(args.requests // 1000, 10),
+                1,
+            ),
+        ]
+
+        for result in results:
+            print(result.format())
+
+        if args.soak > 0:
+            await soak(clients, args.soak, args.concurrency, args.sample_every)
+    finally:
+        await asyncio.gather(*[c.close() for c in clients])
+        await server.stop()
+        await serve_task
+
+
+def parse_batch_window(value: str) -> int | None:
+    return None if value.lower() == "none" else int(value)
+
+
+def run():
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the coms layer with an in-process server and clients",
+    )
+    parser.add_argument("--clients", type=int, default=4, help="number of clients to connect")
+    parser.add_argument(
+        "--codec",
+        choices=[*CODECS, "all"],
+        default="all",
+        help="codec to benchmark, or all of them one after another",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["tcp", "unix"],
+        default="tcp",
+        help="whether to use TCP websockets or a unix socket",
+    )
+    parser.add_argument(
+        "--batch-window-us",
+        type=parse_batch_window,
+        default=0,
+        help="batching window in microseconds, or none to disable batching",
+    )
+    parser.add_argument("--requests", type=int, default=10_000, help="cooldown checks to send")
+    parser.add_argument("--concurrency", type=int, default=32, help="requests in flight at once")
+    parser.add_argument("--soak", type=float, default=0, help="seconds to run the soak test for")
+    parser.add_argument(
+        "--sample-every",
+        type=float,
+        default=10,
+        help="seconds between memory samples during the soak test",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        unix_socket = os.path.join(temp_dir, "karen.sock") if args.transport == "unix" else None
+
+        for codec in CODECS if args.codec == "all" else [args.codec]:
+            asyncio.run(run_benchmark(args, codec, unix_socket))
+
+
+if __name__ == "__main__":
+    run()
@@ -17,9 +17,12 @@ CREATE TABLE IF NOT EXISTS users ( -- used for economy data
   last_vote          TIMESTAMPTZ, -- the time at which the last user voted
   give_alert         BOOLEAN NOT NULL DEFAULT true, -- whether users should be alerted if someone gives them items or emeralds or not
   shield_pearl       TIMESTAMPTZ, -- time at which last shield pearl was activated
-  last_dq_reroll     TIMESTAMPTZ NOT NULL DEFAULT NOW() -- time at which the daily quest was last re-rolled
+  last_dq_reroll     TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- time at which the daily quest was last re-rolled
+  net_worth          BIGINT NOT NULL DEFAULT 0 -- emeralds + vault * 9 + what their items sell for, kept up to date by the triggers in karen/migrations/0006_users_net_worth.sql
 );
 
+CREATE INDEX IF NOT EXISTS users_net_worth_idx ON users (net_worth DESC);
+
 CREATE TABLE IF NOT EXISTS items (
   user_id            BIGINT REFERENCES users (user_id) ON DELETE CASCADE, -- the discord user id / snowflake
   name               VARCHAR(50) NOT NULL, -- the name of the item
@@ -29,6 +32,8 @@ CREATE TABLE IF NOT EXISTS items (
   sellable           BOOLEAN NOT NULL -- whether the item can be sold to the bot
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS items_user_id_name_idx ON items (user_id, LOWER(name));
+
 CREATE TABLE IF NOT EXISTS trash_can (
   user_id            BIGINT REFERENCES users (user_id) ON DELETE CASCADE, -- the discord user id / snowflake
   item               VARCHAR(50) NOT NULL, -- name of item,
@@ -36,6 +41,8 @@ CREATE TABLE IF NOT EXISTS trash_can (
   amount             BIGINT NOT NULL
 );
 
+CREATE UNIQUE INDEX IF NOT EXISTS trash_can_user_id_item_idx ON trash_can (user_id, item);
+
 CREATE TABLE IF NOT EXISTS badges (
   user_id            BIGINT PRIMARY KEY REFERENCES users (user_id) ON DELETE CASCADE,
   code_helper        BOOLEAN NOT NULL DEFAULT false,
@@ -119,7 +126,8 @@ CREATE TABLE IF NOT EXISTS farm_plots (
   user_id            BIGINT REFERENCES users (user_id) ON DELETE CASCADE,
   crop_type          VARCHAR NOT NULL,
   planted_at         TIMESTAMPTZ NOT NULL,
-  grow_time          INTERVAL NOT NULL
+  grow_time          INTERVAL NOT NULL,
+  count              INT NOT NULL DEFAULT 1 -- the number of plots planted at once
 );
 
 CREATE TABLE IF NOT EXISTS give_logs (
@@ -133,6 +141,7 @@ CREATE TABLE IF NOT EXISTS give_logs (
 CREATE TABLE IF NOT EXISTS reminders (
   id                 SERIAL PRIMARY KEY, -- the serial number for the reminder (1, 2, 3)
   user_id            BIGINT NOT NULL, -- the discord user id / snowflake
+  guild_id           BIGINT, -- the guild id where the reminder command was summoned (null in dms)
   channel_id         BIGINT NOT NULL, -- the channel id where the reminder command was summoned
   message_id         BIGINT NOT NULL, -- the message where the reminder command was summoned
   reminder           TEXT NOT NULL, -- the actual text for the reminder
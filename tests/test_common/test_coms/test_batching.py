@@ -0,0 +1,52 @@
+import asyncio
+
+from common.coms.batching import PacketBatcher
+from common.coms.codec import JSON_CODEC
+from common.coms.packet import Packet
+
+
+def send_all(batcher: PacketBatcher, packets: list[Packet]) -> None:
+    async def _inner():
+        await asyncio.gather(*[batcher.send(p) for p in packets])
+
+    asyncio.run(_inner())
+
+
+def test_batcher_coalesces_packets():
+    frames = []
+
+    async def send_message(message):
+        frames.append(message)
+
+    packets = [Packet(id=f"c{i}", data=i) for i in range(10)]
+    send_all(PacketBatcher(send_message, JSON_CODEC), packets)
+
+    assert len(frames) == 1
+    assert JSON_CODEC.decode_frame(frames[0]) == packets
+
+
+def test_batcher_splits_large_batches():
+    frames = []
+
+    async def send_message(message):
+        frames.append(message)
+
+    packets = [Packet(id=f"c{i}", data="x" * 100) for i in range(10)]
+    batcher = PacketBatcher(send_message, JSON_CODEC, max_batch_size=350)
+    send_all(batcher, packets)
+
+    assert len(frames) > 1
+    assert all(len(f) < 350 for f in frames)
+    assert [p for f in frames for p in JSON_CODEC.decode_frame(f)] == packets
+
+
+def test_batcher_sends_oversized_packet_alone():
+    frames = []
+
+    async def send_message(message):
+        frames.append(message)
+
+    packets = [Packet(id="c0", data=1), Packet(id="c1", data="x" * 1000), Packet(id="c2", data=2)]
+    send_all(PacketBatcher(send_message, JSON_CODEC, max_batch_size=100), packets)
+
+    assert [JSON_CODEC.decode_frame(f) for f in frames] == [[p] for p in packets]
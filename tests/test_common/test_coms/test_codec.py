@@ -0,0 +1,95 @@
+import datetime
+
+import arrow
+import pytest
+
+from common.coms.codec import CODECS, JSON_CODEC, negotiate_codec
+from common.coms.errors import InvalidPacketReceived
+from common.coms.packet import Packet
+from common.coms.packet_type import PacketType
+from common.models.system_stats import SystemStats
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+@pytest.mark.parametrize(
+    "data",
+    [
+        None,
+        True,
+        123,
+        1.5,
+        "abc",
+        {1, 2, 3},
+        arrow.now(),
+        datetime.datetime.now(),
+        datetime.timedelta(days=1, seconds=1, microseconds=1),
+        [{"user_id": 639498607632056321, "at": datetime.datetime.now()}],
+        {"nested": {"set": {"a", "b"}, "delta": datetime.timedelta(hours=3)}},
+    ],
+)
+def test_codec_roundtrip(codec, data):
+    packet = Packet(id="c1", type=PacketType.DB_FETCH_ALL, data=data)
+
+    decoded = codec.decode(codec.encode(packet))
+
+    assert decoded.id == packet.id
+    assert decoded.type == packet.type
+    assert decoded.data == data
+    assert decoded.error is False
+    assert decoded.one_way is False
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_codec_one_way_flag(codec):
+    packet = Packet(id="c1", type=PacketType.LB_COMMAND_RAN, data={"user_id": 1}, one_way=True)
+
+    assert codec.decode(codec.encode(packet)).one_way is True
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_codec_encodes_models(codec):
+    stats = SystemStats(
+        identifier="Karen",
+        cpu_usage_percent=1.0,
+        memory_usage_bytes=1,
+        memory_max_bytes=2,
+        threads=3,
+        asyncio_tasks=4,
+        start_time=datetime.datetime.now(),
+    )
+
+    decoded = codec.decode(codec.encode(Packet(id="c1", data=stats)))
+
+    assert SystemStats(**decoded.data) == stats
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_codec_invalid_packet(codec):
+    with pytest.raises(InvalidPacketReceived):
+        codec.decode(b"\xc1" if codec.name == "msgpack" else "[1, 2, 3]")
+
+
+@pytest.mark.parametrize(
+    ("offered", "expected"),
+    [
+        (["msgpack", "json"], "msgpack"),
+        (["json", "msgpack"], "json"),
+        (["unknown", "msgpack"], "msgpack"),
+        (["unknown"], JSON_CODEC.name),
+        ([], JSON_CODEC.name),
+    ],
+)
+def test_negotiate_codec(offered, expected):
+    assert negotiate_codec(offered).name == expected
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_codec_batch_roundtrip(codec):
+    packets = [
+        Packet(id="c1", type=PacketType.COOLDOWN_CHECK_ADD, data={"command": "mine", "user_id": 1}),
+        Packet(id="c2", type=PacketType.LB_COMMAND_RAN, data={"user_id": 1}, one_way=True),
+        Packet(id="c3", type=PacketType.DB_FETCH_ALL, data=[[1, 2], [3, 4]]),
+    ]
+
+    assert codec.decode_frame(codec.encode_batch(packets)) == packets
+    assert codec.decode_frame(codec.encode(packets[2])) == [packets[2]]
@@ -0,0 +1,63 @@
+import pytest
+
+from common.coms.codec import CODECS
+from common.coms.metrics import TIME_BUCKETS, ComsMetricsRecorder, Histogram
+from common.coms.packet import Packet
+from common.coms.packet_type import PacketType
+from common.models.coms_metrics import ComsMetrics
+
+
+def test_histogram_percentiles():
+    histogram = Histogram((1.0, 2.0, 4.0, 8.0))
+
+    for value in [0.5] * 50 + [3.0] * 49 + [100.0]:
+        histogram.record(value)
+
+    snapshot = histogram.snapshot()
+
+    assert snapshot.count == 100
+    assert snapshot.max == 100.0
+    assert snapshot.mean == pytest.approx((0.5 * 50 + 3.0 * 49 + 100.0) / 100)
+    assert snapshot.percentile(50) == 1.0
+    assert snapshot.percentile(99) == 4.0
+    assert snapshot.percentile(100) == 100.0
+
+
+def test_histogram_percentile_capped_at_max():
+    histogram = Histogram(TIME_BUCKETS)
+    histogram.record(0.15)
+
+    assert histogram.snapshot().percentile(50) == 0.15
+
+
+def test_recorder_snapshot_and_merge():
+    recorder = ComsMetricsRecorder()
+    recorder.record_handler(PacketType.DB_FETCH_ROW, 0.01, False)
+    recorder.record_handler(PacketType.DB_FETCH_ROW, 0.02, True)
+    recorder.record_round_trip(PacketType.COMMAND_GATE, 0.001, True)
+    recorder.record_payload(PacketType.DB_FETCH_ROW, 300)
+
+    metrics = recorder.snapshot("Karen")
+    db_fetch_row = metrics.packet_types["DB_FETCH_ROW"]
+
+    assert db_fetch_row.handler_time.count == 2
+    assert db_fetch_row.handler_errors == 1
+    assert db_fetch_row.payload_bytes.count == 1
+    assert metrics.packet_types["COMMAND_GATE"].request_errors == 1
+
+    merged = metrics.merge(metrics, "Clusters")
+
+    assert merged.identifier == "Clusters"
+    assert merged.packet_types["DB_FETCH_ROW"].handler_time.count == 4
+    assert merged.packet_types["COMMAND_GATE"].round_trip_time.count == 2
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_metrics_roundtrip(codec):
+    recorder = ComsMetricsRecorder()
+    recorder.record_handler(PacketType.PING, 0.0005, False)
+    metrics = recorder.snapshot("Cluster 0 (0,1)")
+
+    decoded = codec.decode(codec.encode(Packet(id="c1", data=metrics)))
+
+    assert ComsMetrics(**decoded.data) == metrics
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+
+import pydantic
+import pytest
+
+from common.coms.coms_base import ComsBase
+from common.coms.packet import Packet
+from common.coms.packet_handling import PacketHandlerRegistry, handle_packet
+from common.coms.packet_type import PacketType
+
+
+class DummyRegistry(PacketHandlerRegistry):
+    def __init__(self, name: str):
+        self.name = name
+
+    @handle_packet(PacketType.PING)
+    async def packet_ping(self):
+        return self.name
+
+    @handle_packet(PacketType.COOLDOWN_CHECK_ADD)
+    async def packet_cooldown(self, command: str, user_id: int):
+        return [command, user_id]
+
+    @handle_packet(PacketType.COOLDOWN_ADD, trusted=True)
+    async def packet_cooldown_add(self, command: str, user_id: int):
+        return [command, user_id]
+
+
+def call_handler(registry: DummyRegistry, packet: Packet, **extra):
+    coms = ComsBase("localhost", 0, registry.get_packet_handlers(), logging.getLogger("test"))
+    return asyncio.run(coms._call_handler(packet, **extra))
+
+
+def test_handlers_bound_per_instance():
+    a = DummyRegistry("a")
+    b = DummyRegistry("b")
+
+    assert call_handler(a, Packet(id="c0", type=PacketType.PING, data=None)) == "a"
+    assert call_handler(b, Packet(id="c0", type=PacketType.PING, data=None)) == "b"
+
+
+def test_handler_arguments_validated():
+    registry = DummyRegistry("a")
+    packet = Packet(id="c0", type=PacketType.COOLDOWN_CHECK_ADD, data={"command": "mine"})
+
+    with pytest.raises(pydantic.ValidationError):
+        call_handler(registry, packet)
+
+    packet = Packet(
+        id="c0",
+        type=PacketType.COOLDOWN_CHECK_ADD,
+        data={"command": "mine", "user_id": "123"},
+    )
+
+    assert call_handler(registry, packet, ws_id="ignored") == ["mine", 123]
+
+
+def test_trusted_handler_arguments_not_validated():
+    registry = DummyRegistry("a")
+    packet = Packet(
+        id="c0",
+        type=PacketType.COOLDOWN_ADD,
+        data={"command": "mine", "user_id": "123"},
+    )
+
+    assert call_handler(registry, packet, ws_id="ignored") == ["mine", "123"]
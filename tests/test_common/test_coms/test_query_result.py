@@ -0,0 +1,66 @@
+import datetime
+
+import pytest
+
+from common.coms.codec import CODECS
+from common.coms.packet import Packet
+from common.coms.query_result import PACK_MIN_ROWS, QueryResult, encode_query_result
+
+COLUMNS = ["user_id", "name", "amount", "last_vote", "bot_banned"]
+ROWS = [
+    (
+        639498607632056321 + i,
+        f"user {i}",
+        i % 50,
+        datetime.datetime(2023, 1, 1, tzinfo=datetime.timezone.utc) if i % 2 else None,
+        i % 3 == 0,
+    )
+    for i in range(20)
+]
+
+
+def test_integer_columns_are_packed():
+    encoded = encode_query_result(COLUMNS, ROWS)
+
+    assert encoded["columns"] == COLUMNS
+    assert encoded["types"] == ["q", None, "b", None, None]
+    assert encoded["count"] == len(ROWS)
+    assert isinstance(encoded["data"][0], bytes)
+
+
+def test_short_columns_are_not_packed():
+    encoded = encode_query_result(COLUMNS, ROWS[: PACK_MIN_ROWS - 1])
+
+    assert encoded["types"] == [None] * len(COLUMNS)
+
+
+@pytest.mark.parametrize("codec", CODECS.values(), ids=CODECS.keys())
+def test_round_trip(codec):
+    packet = Packet(id="a", data=encode_query_result(COLUMNS, ROWS))
+    result = QueryResult.decode(codec.decode(codec.encode(packet)).data)
+
+    assert len(result) == len(ROWS)
+    assert [tuple(row.values()) for row in result] == ROWS
+    assert result[-1]["user_id"] == ROWS[-1][0]
+    assert dict(result[1]) == dict(zip(COLUMNS, ROWS[1]))
+    assert result.column("amount") == [r[2] for r in ROWS]
+
+
+def test_empty_result():
+    result = QueryResult.decode(encode_query_result([], []))
+
+    assert len(result) == 0
+    assert list(result) == []
+
+
+def test_rows():
+    result = QueryResult.decode(encode_query_result(COLUMNS, ROWS))
+
+    assert result[0] == dict(zip(COLUMNS, ROWS[0]))
+    assert [r["name"] for r in result[2:4]] == ["user 2", "user 3"]
+
+    with pytest.raises(IndexError):
+        result[len(ROWS)]
+
+    with pytest.raises(KeyError):
+        result[0]["missing"]
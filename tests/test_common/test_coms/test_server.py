@@ -0,0 +1,55 @@
+import logging
+import uuid
+from types import SimpleNamespace
+
+import pytest
+
+from common.coms.errors import ShardNotConnectedError
+from common.coms.server import Server
+
+
+def make_server(shard_count: int | None = 4) -> Server:
+    return Server("localhost", 0, "auth", {}, logging.getLogger(__name__), shard_count=shard_count)
+
+
+@pytest.mark.parametrize(
+    ("guild_id", "expected"),
+    [
+        (0, 0),
+        (641117791272960031, 0),
+        (1 << 22, 1),
+        (5 << 22, 1),
+    ],
+)
+def test_shard_for_guild(guild_id, expected):
+    assert make_server().shard_for_guild(guild_id) == expected
+
+
+def test_shard_for_guild_without_shard_count():
+    with pytest.raises(RuntimeError):
+        make_server(None).shard_for_guild(1)
+
+
+def test_shard_routing():
+    server = make_server()
+    ws_a = SimpleNamespace(id=uuid.uuid4())
+    ws_b = SimpleNamespace(id=uuid.uuid4())
+    server._connections.extend([ws_a, ws_b])
+
+    server.register_shards(ws_a.id, [0, 1])
+    server.register_shards(ws_b.id, [2, 3])
+
+    assert server._get_shard_connection(1) is ws_a
+    assert server._get_shard_connection(2) is ws_b
+
+    # a shard taken over by another client routes to the new one
+    server.register_shards(ws_b.id, [1])
+    assert server._get_shard_connection(1) is ws_b
+
+    server._connections.remove(ws_a)
+
+    with pytest.raises(ShardNotConnectedError):
+        server._get_shard_connection(0)
+
+    with pytest.raises(ShardNotConnectedError):
+        server._get_shard_connection(4)
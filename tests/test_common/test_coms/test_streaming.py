@@ -0,0 +1,105 @@
+import asyncio
+import logging
+
+import pytest
+
+from common.coms.client import Client
+from common.coms.errors import BroadcastIncompleteError
+from common.coms.packet_handling import PacketHandlerRegistry, handle_packet
+from common.coms.packet_type import PacketType
+from common.coms.server import Server
+
+
+class ServerHandlers(PacketHandlerRegistry):
+    @handle_packet(PacketType.DB_CURSOR, trusted=True)
+    async def packet_db_cursor(self, query: str, args: list):
+        for i in range(0, 10, 3):
+            yield list(range(i, min(i + 3, 10)))
+
+        if query == "fail":
+            raise ValueError("cursor failed")
+
+
+class ClientHandlers(PacketHandlerRegistry):
+    def __init__(self, guild_ids: list[int] | None):
+        self.guild_ids = guild_ids
+
+    @handle_packet(PacketType.FETCH_GUILD_IDS)
+    async def packet_fetch_guild_ids(self):
+        if self.guild_ids is None:
+            raise ValueError("guilds unavailable")
+
+        for guild_id in self.guild_ids:
+            yield [guild_id]
+
+
+def run_with_coms(tmp_path, test, client_guild_ids=([1, 2], [3], [])):
+    path = str(tmp_path / "karen.sock")
+    logger = logging.getLogger(__name__)
+
+    async def _inner():
+        server = Server(
+            "", 0, "auth", ServerHandlers().get_packet_handlers(), logger, unix_socket=path
+        )
+        clients = [
+            Client("", 0, ClientHandlers(ids).get_packet_handlers(), logger, unix_socket=path)
+            for ids in client_guild_ids
+        ]
+
+        ready = asyncio.Event()
+        serve_task = asyncio.create_task(server.serve(ready.set))
+        await ready.wait()
+
+        await asyncio.gather(*[c.connect("auth") for c in clients])
+
+        try:
+            return await test(server, clients[0])
+        finally:
+            await asyncio.gather(*[c.close() for c in clients])
+            await server.stop()
+            await serve_task
+
+    return asyncio.run(_inner())
+
+
+def test_client_stream(tmp_path):
+    async def test(server, client):
+        return [
+            p.data async for p in client.stream(PacketType.DB_CURSOR, {"query": "", "args": []})
+        ]
+
+    assert run_with_coms(tmp_path, test) == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+
+
+def test_client_stream_error(tmp_path):
+    async def test(server, client):
+        return [p async for p in client.stream(PacketType.DB_CURSOR, {"query": "fail", "args": []})]
+
+    packets = run_with_coms(tmp_path, test)
+
+    assert [p.data for p in packets[:-1]] == [[0, 1, 2], [3, 4, 5], [6, 7, 8], [9]]
+    assert packets[-1].error
+    assert "cursor failed" in packets[-1].data
+
+
+def test_server_broadcast_stream(tmp_path):
+    async def test(server, client):
+        return [chunk async for chunk in server.broadcast_stream(PacketType.FETCH_GUILD_IDS)]
+
+    assert sorted(run_with_coms(tmp_path, test)) == [[1], [2], [3]]
+
+
+def test_server_broadcast_stream_incomplete(tmp_path):
+    chunks = []
+
+    async def test(server, client):
+        with pytest.raises(BroadcastIncompleteError) as exc_info:
+            async for chunk in server.broadcast_stream(PacketType.FETCH_GUILD_IDS):
+                chunks.append(chunk)
+
+        return exc_info.value.missed
+
+    missed = run_with_coms(tmp_path, test, ([1, 2], None))
+
+    assert len(missed) == 1
+    assert sorted(chunks) == [[1], [2]]
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+
+from common.coms.client import Client
+from common.coms.packet_handling import PacketHandlerRegistry, handle_packet
+from common.coms.packet_type import PacketType
+from common.coms.server import Server
+from common.coms.unix_socket import UnixSocketConnection, connect_unix, serve_unix
+
+
+class Handlers(PacketHandlerRegistry):
+    @handle_packet(PacketType.PING)
+    async def packet_ping(self):
+        return 1
+
+    @handle_packet(PacketType.GET_USER_NAME)
+    async def packet_get_user_name(self, user_id: int):
+        return "x" * user_id
+
+
+def test_unix_socket_framing(tmp_path):
+    path = str(tmp_path / "test.sock")
+    messages = ["text", b"\x00binary", "", b"x" * 100_000]
+
+    async def echo(connection: UnixSocketConnection) -> None:
+        async for message in connection:
+            await connection.send(message)
+
+    async def _inner():
+        server = await serve_unix(echo, path)
+
+        async with server:
+            connection = await anext(connect_unix(path, logging.getLogger(__name__)))
+
+            received = []
+            for message in messages:
+                await connection.send(message)
+                received.append(await connection.recv())
+
+            await connection.close()
+
+        return received
+
+    assert asyncio.run(_inner()) == messages
+
+
+def test_coms_over_unix_socket(tmp_path):
+    path = str(tmp_path / "karen.sock")
+    logger = logging.getLogger(__name__)
+
+    async def _inner():
+        server = Server("", 0, "auth", Handlers().get_packet_handlers(), logger, unix_socket=path)
+        client = Client("", 0, Handlers().get_packet_handlers(), logger, unix_socket=path)
+
+        ready = asyncio.Event()
+        serve_task = asyncio.create_task(server.serve(ready.set))
+        await ready.wait()
+
+        await client.connect("auth")
+
+        try:
+            return (
+                (await client.send(PacketType.GET_USER_NAME, {"user_id": 5})).data,
+                await server.broadcast(PacketType.PING),
+            )
+        finally:
+            await client.close()
+            await server.stop()
+            await serve_task
+
+    assert asyncio.run(_inner()) == ("xxxxx", [1])